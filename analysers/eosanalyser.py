@@ -1,15 +1,52 @@
 import csv
 import os
+import posixpath
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 
-from helpers.constants import get_glance_codes
-from helpers.eosinterface import eos_du
+from helpers import metrics
+from helpers.checkpoint import Checkpoint
+from helpers.constants import TODAY
+from helpers.dedup import DEFAULT_HASH_WORKERS, MIN_DUPLICATE_SIZE, find_duplicates, reclaimable_per_pair
+from helpers.eosinterface import DEFAULT_ATTEMPTS, DEFAULT_TIMEOUT, eos_du, eos_du_batch, eos_find_files, eos_tree_info
+from helpers.filesystem import DEFAULT_TOP_DIRECTORIES, FileStatistics, ScanCache, iter_files, scan_tree
+from helpers.glance import get_registry
+from helpers.history import HistoryStore
 from helpers.logger import log
+from helpers.sizeindex import DEFAULT_INDEX_DEPTH, INDEX_FILE, SizeIndex, write_index
+
+# total number of analysis folders probed at the same time
+DEFAULT_WORKERS = 8
+# number of analysis folders of one subgroup probed at the same time, to not overload the EOS MGM
+DEFAULT_WORKERS_PER_SUBGROUP = 4
+# 'walk': sizes from the EOS metadata or 'eos du', files counted by walking the analysis folders
+# 'find': sizes and files from one streaming 'eos find' listing per subgroup
+ENGINES = ["walk", "find"]
 
 class EOSAnalyser:
 
-    def __init__(self, directory: str):
+    def __init__(self, directory: str, workers: int = DEFAULT_WORKERS, workers_per_subgroup: int = DEFAULT_WORKERS_PER_SUBGROUP, cache: ScanCache | None = None, history: HistoryStore | None = None, eos_timeout: float = DEFAULT_TIMEOUT, eos_attempts: int = DEFAULT_ATTEMPTS, file_statistics: bool = False, top_directories: int = DEFAULT_TOP_DIRECTORIES, size_index: bool = False, index_depth: int = DEFAULT_INDEX_DEPTH, engine: str = "walk", checkpoint: Checkpoint | None = None):
         self._directory = directory
+        self._cache = cache
+        self._history = history
         self._analyses_without_glance: list[str] = []
+        self._workers = workers
+        self._workers_per_subgroup = workers_per_subgroup
+        self._eos_timeout = eos_timeout
+        self._eos_attempts = eos_attempts
+        # file-size histogram and directories with the most small files, written to 'reports/<subgroup>.files.csv'
+        self._file_statistics = file_statistics
+        self._top_directories = top_directories
+        # disk space and number of files below each directory of the analysis folders, written to 'reports/<subgroup>.index.json'
+        self._size_index = size_index
+        self._index_depth = index_depth
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine}, choose one of {ENGINES}.")
+        if engine == "find" and file_statistics:
+            raise ValueError("File statistics require walking the analysis folders, they are not available with the 'find' engine.")
+        self._engine = engine
+        # results of the analyses checked so far, to resume a scan which has been killed
+        self._checkpoint = checkpoint
 
 
     def glance_ref_from_name(self, name: str) -> str:
@@ -20,54 +57,305 @@ class EOSAnalyser:
         Return:
             Glance reference code as string, empty string if analysis name is not in 'glance_codes.csv'
         '''
-        glance_codes = get_glance_codes()
-        if name not in glance_codes.keys():
+        glance_codes = get_registry().glance_codes
+        if name not in glance_codes:
             log.warning(f"Could not find Glance reference code for analysis {name}.")
             self._analyses_without_glance.append(name)
             return ""
         return glance_codes[name].replace(",","/")
 
-    def check_subgroup(self, subgroup: str) -> None:
+    def check_analysis(self, path: str, size: int | None = None, statistics: FileStatistics | None = None, index: SizeIndex | None = None) -> tuple[int, int]:
+        '''
+        Determine disk space and number of files used by an analysis.
+        The disk space is taken from 'eos du' unless given, and only tallied while walking the folder if EOS fails.
+        With file statistics or a size index, every file has to be stat'ed anyway, so the disk space is always tallied while walking the folder.
+        Arguments:
+            path: str -> path to the analysis folder
+            size: int|None -> disk space in bytes, if already known
+            statistics: FileStatistics|None -> file statistics to add the files of the analysis to
+            index: SizeIndex|None -> size index of the analysis folder to fill
+        Return:
+            tuple of used disk space in bytes and number of files
+        '''
+        metrics.count("analyses_checked")
+        if statistics is not None or index is not None:
+            size, number_of_files, _ = scan_tree(path, cache=self._cache, statistics=statistics, index=index)
+            return size, number_of_files
+        if size is None:
+            try:
+                size = eos_du(path, timeout=self._eos_timeout, attempts=self._eos_attempts)
+            except (RuntimeError, ValueError) as e:
+                log.debug(f"Could not get disk space of {path} from EOS, walking the folder instead: {e}")
+                size, number_of_files, _ = scan_tree(path, cache=self._cache)
+                return size, number_of_files
+        # counting files does not require to stat them
+        _, number_of_files, _ = scan_tree(path, sizes=False, cache=self._cache)
+        return size, number_of_files
+
+    def get_sizes(self, paths: list[str]) -> dict[str, int]:
+        '''
+        Retrieve the disk space of several analysis folders with as few 'eos du' calls as possible.
+        Arguments:
+            paths: list[str] -> paths to the analysis folders
+        Return:
+            dictionary with the paths as keys and the disk space in bytes as values,
+            without the analysis folders whose disk space could not be retrieved, which have to be checked separately
+        '''
+        if not paths:
+            return {}
+        try:
+            return eos_du_batch(paths, timeout=self._eos_timeout, attempts=self._eos_attempts)
+        except (RuntimeError, ValueError) as e:
+            log.info(f"Could not get disk space of {len(paths)} folders from EOS at once, checking them separately: {e}")
+            return {}
+
+    def get_tree_info(self, directory: str) -> dict[str, tuple[int, int]]:
+        '''
+        Retrieve disk space and number of files of all analyses in a subgroup from the recursive EOS directory metadata.
+        Arguments:
+            directory: str -> path to the subgroup folder
+        Return:
+            dictionary with analysis names as keys and tuples of used disk space in bytes and number of files as values,
+            empty if the metadata is not available, in which case each analysis folder has to be checked separately
+        '''
+        try:
+            return eos_tree_info(directory, timeout=self._eos_timeout, attempts=self._eos_attempts)
+        except (RuntimeError, ValueError) as e:
+            log.info(f"Recursive EOS metadata not available for {directory}, checking analysis folders separately: {e}")
+            return {}
+
+    def list_subgroup(self, directory: str, analysis_names: list[str]) -> list[tuple[int, int, None, SizeIndex | None]] | None:
+        '''
+        Tally disk space and number of files of all analyses in a subgroup from a single streaming 'eos find' listing,
+        such that no directory has to be listed and no file has to be stat'ed through the FUSE mount.
+        Only the running totals of each analysis (and its size index, if requested) are kept, no matter the number of files.
+        Arguments:
+            directory: str -> path to the subgroup folder
+            analysis_names: list[str] -> names of the analysis folders
+        Return:
+            list of tuples of used disk space in bytes, number of files, no file statistics and the size index of each analysis,
+            None if the listing fails, in which case each analysis folder has to be checked separately
+        '''
+        top = posixpath.normpath(directory)
+        totals = {analysis: [0, 0] for analysis in analysis_names}
+        indices = {analysis: SizeIndex(f"{top}/{analysis}", self._index_depth) for analysis in analysis_names} if self._size_index else {}
+        try:
+            for path, size, _ in eos_find_files(top, timeout=self._eos_timeout, attempts=self._eos_attempts):
+                if not path.startswith(f"{top}/"):
+                    raise ValueError(f"Unexpected path in eos find output {path}")
+                analysis, _, relative = path[len(top)+1:].partition("/")
+                # files directly inside the subgroup folder do not belong to any analysis
+                if not relative or analysis not in totals:
+                    continue
+                total = totals[analysis]
+                total[0] += size
+                total[1] += 1
+                if indices:
+                    indices[analysis].add(posixpath.dirname(path), {"size": size, "files": 1})
+        except (RuntimeError, ValueError) as e:
+            log.warning(f"Could not list the files of {directory} with eos find, checking analysis folders separately: {e}")
+            return None
+        return [(*totals[analysis], None, indices.get(analysis)) for analysis in analysis_names]
+
+    def checkpoint_result(self, result: tuple[int, int, FileStatistics | None, SizeIndex | None]) -> dict:
+        '''
+        Convert the result of an analysis to a JSON-serialisable dictionary for the checkpoint, see restore_result.
+        '''
+        size, number_of_files, statistics, index = result
+        entry = {"size": size, "files": number_of_files}
+        if statistics is not None:
+            entry["statistics"] = {
+                "histogram": [[bucket, n, bucket_size] for bucket, (n, bucket_size) in sorted(statistics.histogram.items())],
+                "small_files": statistics.small_file_directories,
+            }
+        if index is not None:
+            entry["index"] = {"depth": index.depth, "root": index.root}
+        return entry
+
+    def restore_result(self, path: str, entry: dict) -> tuple[int, int, FileStatistics | None, SizeIndex | None] | None:
+        '''
+        Convert a result read from the checkpoint back, see checkpoint_result.
+        Arguments:
+            path: str -> path to the analysis folder
+            entry: dict -> result read from the checkpoint
+        Return:
+            tuple of used disk space in bytes, number of files, file statistics and size index,
+            None if the result lacks the file statistics or size index requested for this run
+        '''
+        statistics = None
+        index = None
+        if self._file_statistics:
+            if "statistics" not in entry:
+                return None
+            statistics = FileStatistics(self._top_directories)
+            for bucket, number_of_files, size in entry["statistics"]["histogram"]:
+                statistics.add_bucket(bucket, number_of_files, size)
+            for number_of_files, size, directory in entry["statistics"]["small_files"]:
+                statistics.add_small_file_directory((number_of_files, size, directory))
+        if self._size_index:
+            if entry.get("index", {}).get("depth") != self._index_depth:
+                return None
+            index = SizeIndex(path, self._index_depth)
+            index.root = entry["index"]["root"]
+        return entry["size"], entry["files"], statistics, index
+
+    def check_subgroup(self, subgroup: str) -> bool:
         '''
         Compile report for each subgroup, listing disk space and number of files for each analysis in given subgroup.
         The reports are written to one csv file per subgroup and stored in the directory 'reports/'.
         Arguments:
-            subgroup: str -> name of subgroup to report on       
+            subgroup: str -> name of subgroup to report on
+        Return:
+            whether the report has been written
         '''
-        log.info(f"Checking subgroup {subgroup}.")
-        # get the used disk space in units of bytes
-        directory = f"{self._directory}/{subgroup}"
-        analysis_names = [folder for folder in os.listdir(directory) if os.path.isdir(os.path.join(directory, folder))]
-        sizes = []
-        numbers = []
-        log.info(f"Found {len(analysis_names)} analyses in subgroup {subgroup}.")
-        for i_analysis, analysis in enumerate(analysis_names):
-            number_of_files = 0
-            size = 0
-            try:
-                size = eos_du(f"{self._directory}/{subgroup}/{analysis}")
-                number_of_files = sum(len(files) for _, _, files in os.walk(f"{self._directory}/{subgroup}/{analysis}"))
-            except:
-                for dirpath, _, filenames in os.walk(f"{self._directory}/{subgroup}/{analysis}"):
-                    number_of_files += len(filenames)
-                    for filename in filenames:
-                        filepath = os.path.join(dirpath, filename)
-                        if not os.path.isfile(filepath):
-                            continue
-                        # make sure to treat symbolic links correctly
-                        if os.path.islink(filepath):
-                            size += os.lstat(filepath).st_size
+        return subgroup in self.check_subgroups([subgroup])
+
+    def check_subgroups(self, subgroups: list[str]) -> list[str]:
+        '''
+        Compile reports for several subgroups at once, see check_subgroup.
+        The analysis folders of all subgroups are probed concurrently, with at most self._workers probes running in total
+        and at most self._workers_per_subgroup probes running per subgroup.
+        If EOS provides the recursive size and number of files of the analysis folders of a subgroup, these are used directly,
+        unless file statistics or size indices are requested, which require walking all folders.
+        With the 'find' engine, all files of a subgroup are listed with a single streaming 'eos find' call instead, see list_subgroup.
+        With a checkpoint, the result of each analysis is recorded as soon as it is known, and analyses recorded within the run window
+        are not checked again, such that a scan killed partway through resumes where it stopped. The checkpoint of a subgroup
+        is cleared once its reports have been written, such that the next run checks all its analyses again.
+        With the 'find' engine, a subgroup is only skipped as a whole, as all its analyses are listed at once.
+        Reports are written in the order of the given subgroups, listing analyses in the order of the directory listing.
+        A subgroup which cannot be checked, e.g. because its folder cannot be listed, is logged and skipped, such that
+        the reports of the other subgroups are still written.
+        Arguments:
+            subgroups: list[str] -> names of subgroups to report on
+        Return:
+            list of the subgroups whose reports have been written
+        '''
+        limit = threading.Semaphore(self._workers)
+        def probe(subgroup: str, analysis: str, path: str, known: tuple[int, int] | None, size: int | None) -> tuple[int, int, FileStatistics | None, SizeIndex | None]:
+            # no need to check folders whose numbers are known from the recursive EOS metadata
+            if known is not None:
+                result = (*known, None, None)
+            else:
+                statistics = FileStatistics(self._top_directories) if self._file_statistics else None
+                index = SizeIndex(path, self._index_depth) if self._size_index else None
+                with limit:
+                    result = (*self.check_analysis(path, size, statistics, index), statistics, index)
+            if self._checkpoint is not None:
+                self._checkpoint.record(subgroup, analysis, self.checkpoint_result(result))
+            return result
+        def listing(subgroup: str, directory: str, analysis_names: list[str]) -> list[tuple[int, int, None, SizeIndex | None]] | None:
+            with limit:
+                results = self.list_subgroup(directory, analysis_names)
+            if self._checkpoint is not None and results is not None:
+                for analysis, result in zip(analysis_names, results):
+                    self._checkpoint.record(subgroup, analysis, self.checkpoint_result(result))
+            return results
+        def done(result: tuple[int, int, FileStatistics | None, SizeIndex | None]) -> Future:
+            future = Future()
+            future.set_result(result)
+            return future
+
+        analysis_names = {}
+        executors = {}
+        futures = {}
+        listings = {}
+        restored = {}
+        failed = []
+        try:
+            for subgroup in subgroups:
+                try:
+                    log.info(f"Checking subgroup {subgroup}.")
+                    # get the used disk space in units of bytes
+                    directory = f"{self._directory}/{subgroup}"
+                    analysis_names[subgroup] = [folder for folder in os.listdir(directory) if os.path.isdir(os.path.join(directory, folder))]
+                    log.info(f"Found {len(analysis_names[subgroup])} analyses in subgroup {subgroup}.")
+                    checkpoint = self._checkpoint.load(subgroup) if self._checkpoint is not None else {}
+                    restored[subgroup] = {}
+                    for analysis in analysis_names[subgroup]:
+                        if analysis in checkpoint and (result := self.restore_result(f"{directory}/{analysis}", checkpoint[analysis])) is not None:
+                            restored[subgroup][analysis] = result
+                    remaining = [analysis for analysis in analysis_names[subgroup] if analysis not in restored[subgroup]]
+                    executors[subgroup] = ThreadPoolExecutor(max_workers=self._workers_per_subgroup, thread_name_prefix=subgroup)
+                    if self._engine == "find":
+                        if remaining:
+                            listings[subgroup] = executors[subgroup].submit(listing, subgroup, directory, analysis_names[subgroup])
                         else:
-                            size += os.path.getsize(filepath)
+                            listings[subgroup] = done([restored[subgroup][analysis] for analysis in analysis_names[subgroup]])
+                        continue
+                    tree_info = {}
+                    du_sizes = {}
+                    if remaining and not self._file_statistics and not self._size_index:
+                        tree_info = self.get_tree_info(directory)
+                        # disk space of the remaining folders from batched 'eos du' calls, only their files are counted separately
+                        du_sizes = self.get_sizes([f"{directory}/{analysis}" for analysis in remaining if analysis not in tree_info])
+                    futures[subgroup] = [
+                        done(restored[subgroup][analysis]) if analysis in restored[subgroup]
+                        else executors[subgroup].submit(probe, subgroup, analysis, f"{directory}/{analysis}", tree_info.get(analysis), du_sizes.get(f"{directory}/{analysis}"))
+                        for analysis in analysis_names[subgroup]
+                    ]
+                except Exception as e:
+                    log.error(f"Could not check subgroup {subgroup}: {e}")
+                    failed.append(subgroup)
 
-            numbers.append(number_of_files)
-            sizes.append(size)
-            if (i_analysis+1)%10==0:
-                log.info(f"Checked {i_analysis+1}/{len(analysis_names)} analyses.")
-            log.debug(f"Checked {analysis}. Found {size} bytes in {number_of_files} files.")
+            for subgroup in subgroups:
+                if subgroup in failed:
+                    continue
+                try:
+                    sizes = []
+                    numbers = []
+                    subgroup_statistics = FileStatistics(self._top_directories)
+                    indices = {}
+                    results = listings[subgroup].result() if subgroup in listings else None
+                    if results is None:
+                        if subgroup in listings:
+                            # fall back to walking the analysis folders if the listing failed
+                            directory = f"{self._directory}/{subgroup}"
+                            futures[subgroup] = [
+                                done(restored[subgroup][analysis]) if analysis in restored[subgroup]
+                                else executors[subgroup].submit(probe, subgroup, analysis, f"{directory}/{analysis}", None, None)
+                                for analysis in analysis_names[subgroup]
+                            ]
+                        results = (future.result() for future in futures[subgroup])
+                    for i_analysis, (analysis, result) in enumerate(zip(analysis_names[subgroup], results)):
+                        size, number_of_files, statistics, index = result
+                        if statistics is not None:
+                            subgroup_statistics.merge(statistics)
+                        if index is not None:
+                            indices[analysis] = index
+                        numbers.append(number_of_files)
+                        sizes.append(size)
+                        if (i_analysis+1)%10==0:
+                            log.info(f"Checked {i_analysis+1}/{len(analysis_names[subgroup])} analyses in subgroup {subgroup}.")
+                        log.debug(f"Checked {analysis}. Found {size} bytes in {number_of_files} files.")
+                    log.info(f"Finished checking subgroup {subgroup}.")
+                    self.write_report(subgroup, analysis_names[subgroup], sizes, numbers)
+                    if self._file_statistics:
+                        self.write_files_report(subgroup, subgroup_statistics)
+                    if self._size_index:
+                        write_index(INDEX_FILE.format(subgroup=subgroup), self._index_depth, indices)
+                    if self._checkpoint is not None:
+                        self._checkpoint.clear(subgroup)
+                except Exception as e:
+                    log.error(f"Could not check subgroup {subgroup}: {e}")
+                    failed.append(subgroup)
+                    # no need to check the remaining analyses of the subgroup
+                    executors[subgroup].shutdown(wait=False, cancel_futures=True)
+        finally:
+            for executor in executors.values():
+                executor.shutdown(cancel_futures=True)
+        return [subgroup for subgroup in subgroups if subgroup not in failed]
+
+    def write_report(self, subgroup: str, analysis_names: list[str], sizes: list[int], numbers: list[int]) -> None:
+        '''
+        Write the report of a subgroup to 'reports/<subgroup>.csv', and add it to the history store if one is given.
+        Arguments:
+            subgroup: str -> name of subgroup
+            analysis_names: list[str] -> names of the analysis folders
+            sizes: list[int] -> disk space used by each analysis in bytes
+            numbers: list[int] -> number of files of each analysis
+        '''
         total_size = sum(sizes)
         total_numbers = sum(numbers)
-        log.info(f"Finished checking subgroup {subgroup}.")
         with open(f'reports/{subgroup}.csv', 'w') as f:
             writer = csv.writer(f, delimiter=',')
             writer.writerow(["Analysis Team", "Disk Usage in GB", "Number of files", "Glance code"])
@@ -75,3 +363,47 @@ class EOSAnalyser:
                 writer.writerow([analysis_names[i], f'{float(f"{(sizes[i]/1024.**3):.5g}"):g}', numbers[i], self.glance_ref_from_name(analysis_names[i])])
 
             writer.writerow(["Total Sum", f'{float(f"{(total_size/1024.**3):.5g}"):g}', total_numbers, ""])
+
+        if self._history is not None:
+            self._history.record(subgroup, TODAY.strftime("%Y-%m-%d"), {name: (size // 1024, number) for name, size, number in zip(analysis_names, sizes, numbers)})
+
+    def write_files_report(self, subgroup: str, statistics: FileStatistics) -> None:
+        '''
+        Write the file statistics of a subgroup to 'reports/<subgroup>.files.csv': the number of files and disk space per file-size bucket,
+        followed by the directories with the most small files directly inside them.
+        Arguments:
+            subgroup: str -> name of subgroup
+            statistics: FileStatistics -> file statistics of all analyses in the subgroup
+        '''
+        with open(f'reports/{subgroup}.files.csv', 'w') as f:
+            writer = csv.writer(f, delimiter=',')
+            writer.writerow(["Type", "Name", "Number of files", "Disk Usage in GB"])
+            for bucket, (number_of_files, size) in sorted(statistics.histogram.items()):
+                name = "0 B" if bucket == 0 else f"{2**(bucket-1)}-{2**bucket-1} B"
+                writer.writerow(["file size", name, number_of_files, f'{float(f"{(size/1024.**3):.5g}"):g}'])
+            for number_of_files, size, directory in sorted(statistics.small_file_directories, reverse=True):
+                writer.writerow(["small files", directory, number_of_files, f'{float(f"{(size/1024.**3):.5g}"):g}'])
+
+    def check_duplicates(self, subgroup: str, workers: int = DEFAULT_HASH_WORKERS, min_size: int = MIN_DUPLICATE_SIZE) -> None:
+        '''
+        Find files with identical content in the analysis folders of a subgroup, see helpers.dedup.find_duplicates,
+        and write the disk space which can be freed per pair of analyses to 'reports/<subgroup>.duplicates.csv'.
+        Arguments:
+            subgroup: str -> name of subgroup to check
+            workers: int -> maximum number of files read at the same time
+            min_size: int -> smallest file size in bytes to check
+        '''
+        log.info(f"Looking for duplicate files in subgroup {subgroup}.")
+        directory = f"{self._directory}/{subgroup}"
+        analysis_names = [folder for folder in os.listdir(directory) if os.path.isdir(os.path.join(directory, folder))]
+        files = ((analysis, path, size) for analysis in analysis_names for path, size in iter_files(f"{directory}/{analysis}", min_size))
+        duplicates = find_duplicates(files, workers=workers)
+        pairs = reclaimable_per_pair(duplicates)
+        total = sum(size for _, size in pairs.values())
+        log.info(f"Found {sum(len(group) for _, group in duplicates)} files in {len(duplicates)} groups of identical files in subgroup {subgroup}, removing the copies would free {total/1024.**3:.5g} GB.")
+        with open(f'reports/{subgroup}.duplicates.csv', 'w') as f:
+            writer = csv.writer(f, delimiter=',')
+            writer.writerow(["Analysis Team", "Other Analysis Team", "Duplicate files", "Reclaimable Disk Usage in GB"])
+            for (analysis, other), (number_of_files, size) in sorted(pairs.items(), key=lambda pair: (-pair[1][1], pair[0])):
+                writer.writerow([analysis, other, number_of_files, f'{float(f"{(size/1024.**3):.5g}"):g}'])
+            writer.writerow(["Total Sum", "", sum(number_of_files for number_of_files, _ in pairs.values()), f'{float(f"{(total/1024.**3):.5g}"):g}'])
@@ -1,41 +1,123 @@
 from __future__ import annotations
 
+import bisect
 import csv
+import heapq
+import io
+import numpy as np
 import pandas as pd
 import pathlib
-import re
-from datetime import datetime, timezone
+import resource
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
 
+from helpers import metrics
+from helpers.constants import TODAY
+from helpers.dumps import find_bz2_blocks, find_bz2_streams, iter_decompressed, iter_decompressed_blocks, iter_line_blocks
+from helpers.history import HistoryStore
 from helpers.logger import log
+from helpers.tagmatcher import TagMatcher
+from helpers.tagsuggester import TagSuggester, name_components
+
+
+DUMP_HEADER = ['RSE', 'scope', 'name', 'account', 'size', 'created', 'updated', 'accessed', 'ruleid', 'state']
+# only the columns needed to match datasets are read, with compact types
+DUMP_COLUMNS = ['scope', 'name', 'size', 'created', 'updated', 'accessed']
+# sizes are read as nullable integers, as some rows of the dumps have an empty size field
+DUMP_DTYPES = {'scope': 'category', 'name': str, 'size': 'Int64', 'created': str, 'updated': str, 'accessed': str}
+DEFAULT_CHUNKSIZE = 500_000
+# size of the blocks of decompressed lines analysed at once by the worker processes
+PARALLEL_BLOCK_BYTES = 16 * 1024**2
+ENGINES = ["columnar", "rows"]
+# replicas whose latest timestamp is older than this (in seconds) are counted as old
+OLD_THRESHOLD = 365 * 24 * 60 * 60
+# datasets are binned by the age of their latest timestamp, with the upper edges of the bins given in days;
+# datasets without any timestamp end up in the last bin
+AGE_BUCKET_EDGES = [30, 90, 365]
+AGE_BUCKETS = ["<30d", "<90d", "<1y", ">1y", "no date"]
+# marker for missing timestamps in the int64 arrays of epoch seconds
+NO_TIMESTAMP = np.iinfo(np.int64).min
+SUMMARY_FILE = "reports/grid_summary.csv"
+# number of days to look back for the latest dump, starting from today
+DATE_SEARCH_DAYS = 31
+# number of largest and of least recently used datasets listed for each analysis in the details report
+DEFAULT_TOP = 20
+# number of tags suggested for datasets not matching any tag, in the report and in the log
+SUGGEST_TOP = 50
+SUGGEST_LOG = 5
+
+
+def empty_counters() -> dict[str, int]:
+    '''
+    Counters accumulated for each analysis: number of datasets, disk space and number of old datasets in total,
+    as well as number of datasets and disk space per age bucket.
+    '''
+    counters = {"ntotal": 0, "ntotal_old": 0, "size": 0}
+    for bucket in AGE_BUCKETS:
+        counters[f"ntotal {bucket}"] = 0
+        counters[f"size {bucket}"] = 0
+    return counters
 
 
 class GridSpaceAnalyser:
 
-    def __init__(self, rse="CERN-PROD_PHYS-EXOTICS", date: str|None = None):
+    def __init__(self, rse="CERN-PROD_PHYS-EXOTICS", date: str|None = None, engine: str = "columnar", chunksize: int = DEFAULT_CHUNKSIZE, workers: int = 1, history: HistoryStore | None = None, reference_time: datetime | None = None, threshold: int = OLD_THRESHOLD, dump: str | pathlib.Path | None = None, top: int = DEFAULT_TOP):
         self._scopes = {}
+        self._matchers: dict[str, TagMatcher] = {}
         self._scopes_not_found = []
-        self._analyses = {"uncategorised": {"ntotal": 0, "ntotal_old": 0, "size": 0}}
+        self._analyses = {"uncategorised": empty_counters()}
+        # bounded min-heaps of the self._top largest and least recently used datasets of each analysis
+        self._largest: dict[str, list[tuple]] = {}
+        self._oldest: dict[str, list[tuple]] = {}
+        self._top = top
+        # datasets not matching any tag, collected to suggest new tags instead of logging each of them
+        self._unmatched = TagSuggester()
         self._rse = rse
         self._date = date
+        self._dump = pathlib.Path(dump) if dump is not None else None
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine}, choose one of {ENGINES}.")
+        self._engine = engine
+        self._chunksize = chunksize
+        self._workers = workers
+        self._history = history
+        # ages are computed relative to one reference time for the whole run (including all worker processes),
+        # such that the result does not depend on when a dataset is analysed
+        self._now = int((reference_time or datetime.now(timezone.utc)).timestamp())
+        self._threshold = threshold
+        self._bucket_edges = [days * 24 * 60 * 60 for days in AGE_BUCKET_EDGES]
         self.report_path = pathlib.Path("/eos/atlas/atlascerngroupdisk/data-adc/rucio-analytix/reports/")
 
     @property
-    def date(self):
-        if self._date is not None:
-            return self._date
-        pattern = re.compile(r"\d{4}-\d{2}-\d{2}")
-        today = datetime.now(timezone.utc).date()
-        candidates = sorted(
-            (d.name for d in self.report_path.iterdir() if d.is_dir() and pattern.match(d.name)),
-            reverse=True,
-        )
-        for candidate in candidates:
-            if datetime.strptime(candidate, "%Y-%m-%d").date() > today:
-                continue
-            bz2_file = self.report_path / candidate / "datasets_per_rse" / f"{self._rse}.datasets_per_rse.{candidate}.csv.bz2"
-            if bz2_file.is_file():
+    def date(self) -> str:
+        '''
+        Date of the dump to analyse, the latest one available unless given explicitly. Only looked up once.
+        '''
+        if self._date is None:
+            self._date = self.find_date()
+        return self._date
+
+    def find_date(self) -> str:
+        '''
+        Find the latest dump of the RSE, probing one date at a time backwards from today,
+        instead of listing the reports directory, which holds one sub-directory per day.
+        Return:
+            date of the latest dump in format YYYY-MM-DD
+        '''
+        today = datetime.fromtimestamp(self._now, timezone.utc).date()
+        for days_ago in range(DATE_SEARCH_DAYS):
+            candidate = (today - timedelta(days_ago)).strftime("%Y-%m-%d")
+            if self.dump_path(candidate).is_file():
+                log.info(f"Found datasets_per_rse dump for {self._rse} from {candidate}.")
                 return candidate
-        raise FileNotFoundError(f"No datasets_per_rse dump found for {self._rse} on or before {today}.")
+        raise FileNotFoundError(f"No datasets_per_rse dump found for {self._rse} in the {DATE_SEARCH_DAYS} days up to {today}.")
+
+    def dump_path(self, date: str) -> pathlib.Path:
+        '''
+        Path of the datasets_per_rse dump of the RSE from a given date.
+        '''
+        return self.report_path / date / "datasets_per_rse" / f"{self._rse}.datasets_per_rse.{date}.csv.bz2"
 
     def load_lookup_table(self) -> None:
         '''
@@ -55,26 +137,225 @@ class GridSpaceAnalyser:
                 else:
                     analysis_name = row[2]
                     self._scopes[scope][tag]["analysis"] = analysis_name
-                    self._analyses[analysis_name] = {"ntotal": 0, "ntotal_old": 0, "size": 0}
+                    self._analyses[analysis_name] = empty_counters()
+        # compile all tags of a scope into one matcher, such that each dataset name is only scanned once per scope
+        self._matchers = {scope: TagMatcher(list(tags)) for scope, tags in self._scopes.items()}
+
+    def copy_lookup_table(self, other: GridSpaceAnalyser) -> None:
+        '''
+        Use the lookup table already loaded by another analyser, such that it is read and compiled only once for several RSEs.
+        The compiled matchers are shared, while the tags found are tracked separately for each analyser.
+        Arguments:
+            other: GridSpaceAnalyser -> analyser on which load_lookup_table has been called
+        '''
+        self._scopes = {
+            scope: {tag: {"analysis": details["analysis"], "tag_found": False} for tag, details in tags.items()}
+            for scope, tags in other._scopes.items()
+        }
+        self._analyses = {name: empty_counters() for name in other._analyses}
+        self._matchers = other._matchers
 
-    def analyse_datasets(self) -> None:
+    def analyse_datasets(self) -> int:
         '''
         Loop over all datasets on the RSE and match them to analyses.
+        The dump is streamed in chunks of self._chunksize rows, such that memory usage does not grow with the size of the dump.
+        With more than one worker, decompression and matching are distributed over several processes.
+        Return:
+            number of datasets analysed
+        '''
+        f = self._dump if self._dump is not None else self.dump_path(self.date)
+        metrics.count("dump_bytes", f.stat().st_size)
+        if self._workers > 1:
+            n_rows = self.analyse_parallel(f)
+        else:
+            n_rows = self.analyse_serial(f)
+        # ru_maxrss is given in kB on Linux
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        log.info(f"Analysed {n_rows} datasets in chunks of {self._chunksize} rows, peak memory usage {peak_memory:.0f} MB.")
+        if self._workers > 1:
+            peak_memory_workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+            log.info(f"Peak memory usage of the largest worker process {peak_memory_workers:.0f} MB.")
+        self.check_obsolete_tags()
+        self.log_unmatched()
+        return n_rows
+
+    def analyse_serial(self, f: pathlib.Path) -> int:
+        '''
+        Decompress and analyse the dump in the current process.
+        Arguments:
+            f: pathlib.Path -> bz2-compressed datasets_per_rse dump
+        Return:
+            number of datasets analysed
+        '''
+        log.info(f"Reading {f} in chunks of {self._chunksize} rows.")
+        reader = pd.read_csv(
+            f, header=None, names=DUMP_HEADER, usecols=DUMP_COLUMNS, dtype=DUMP_DTYPES,
+            compression='bz2', delimiter="\t", chunksize=self._chunksize,
+        )
+        n_rows = 0
+        with reader:
+            while True:
+                # decompressing and parsing the dump
+                with metrics.span("read_dump"):
+                    chunk = next(reader, None)
+                if chunk is None:
+                    break
+                self.analyse_chunk(chunk)
+                n_rows += len(chunk)
+                log.debug(f"Analysed {n_rows} datasets.")
+        return n_rows
+
+    def analyse_parallel(self, f: pathlib.Path) -> int:
+        '''
+        Decompress and analyse the dump in self._workers processes, each of which decompresses a range of the dump.
+        If the dump consists of several bz2 streams (as written by pbzip2 or lbzip2), the ranges are made of whole streams,
+        otherwise of the blocks of its single stream, see find_bz2_blocks.
+        Lines crossing the border between two ranges are returned by the workers and analysed here.
+        The partial results are merged in the order of the dump, such that the report is identical to the one of a serial run.
+        Dumps without any bz2 block, e.g. empty files, are analysed serially, to fail in the same way.
+        Arguments:
+            f: pathlib.Path -> bz2-compressed datasets_per_rse dump
+        Return:
+            number of datasets analysed
+        '''
+        streams = find_bz2_streams(f)
+        if not streams:
+            return self.analyse_serial(f)
+        boundaries = find_bz2_blocks(f) if len(streams) == 1 else []
+        n_rows = 0
+        with ProcessPoolExecutor(max_workers=self._workers, initializer=_init_worker, initargs=(self,)) as executor:
+            # a few ranges per worker balance the load when streams or blocks differ in size
+            if len(streams) > 1:
+                log.info(f"Decompressing {len(streams)} bz2 streams of {f} in {self._workers} processes.")
+                n_ranges = min(len(streams), 4 * self._workers)
+                borders = [streams[i * len(streams) // n_ranges] for i in range(n_ranges)] + [f.stat().st_size]
+                futures = [executor.submit(_analyse_dump_range, f, start, end) for start, end in zip(borders[:-1], borders[1:])]
+            else:
+                n_blocks = len(boundaries) - 1
+                log.info(f"Decompressing {n_blocks} bz2 blocks of {f} in {self._workers} processes.")
+                n_ranges = min(n_blocks, 4 * self._workers)
+                borders = [i * n_blocks // n_ranges for i in range(n_ranges + 1)]
+                futures = [executor.submit(_analyse_dump_blocks, f, boundaries, first, last) for first, last in zip(borders[:-1], borders[1:])]
+            boundary_lines = []
+            carry = b""
+            # candidate at which the next range has to continue, if the dump is split into blocks
+            next_block = 0
+            for future in futures:
+                results = future.result()
+                n_rows += self.merge_results(results)
+                if "blocks" in results:
+                    start, end = results["blocks"]
+                    # a range in which no block starts has to be covered by the last block of the previous one
+                    if start == end and next_block < start or start < end and start != next_block:
+                        raise OSError(f"Invalid bz2 block at bit {boundaries[next_block]} of {f}.")
+                    next_block = max(next_block, end)
+                if results["head"] is None:
+                    carry += results["tail"]
+                    continue
+                boundary_lines.append(carry + results["head"])
+                carry = results["tail"]
+            boundary_lines.append(carry)
+            n_rows += self.analyse_lines(b"".join(boundary_lines))
+        return n_rows
+
+    def analyse_lines(self, data: bytes) -> int:
+        '''
+        Analyse a block of complete lines of the dump.
+        Arguments:
+            data: bytes -> decompressed lines of the dump
+        Return:
+            number of datasets analysed
         '''
-        header = ['RSE', 'scope', 'name', 'account', 'size', 'created', 'updated', 'accessed', 'ruleid', 'state']
+        if not data.strip():
+            return 0
+        datasets = pd.read_csv(io.BytesIO(data), header=None, names=DUMP_HEADER, usecols=DUMP_COLUMNS, dtype=DUMP_DTYPES, delimiter="\t")
+        self.analyse_chunk(datasets)
+        return len(datasets)
 
-        f = self.report_path / self.date / "datasets_per_rse" / f"{self._rse}.datasets_per_rse.{self.date}.csv.bz2"
-        reader = pd.read_csv(f, header=None, names=header, compression='bz2', delimiter="\t")
-        for line in reader.itertuples(index=False):
+    def analyse_chunk(self, datasets: pd.DataFrame) -> None:
+        '''
+        Match a chunk of datasets to analyses, using the engine chosen for this analyser.
+        Arguments:
+            datasets: pd.DataFrame -> datasets on the RSE, with columns as in DUMP_COLUMNS
+        '''
+        metrics.count("rows_processed", len(datasets))
+        # datasets without size are counted without disk space
+        datasets["size"] = datasets["size"].fillna(0).astype("int64")
+        if self._engine == "rows":
+            self.analyse_rows(datasets)
+        else:
+            self.analyse_columns(datasets)
+
+    def take_results(self) -> dict:
+        '''
+        Hand over the results accumulated so far and reset the accumulators, used to collect the results of worker processes.
+        Return:
+            dictionary with the per-analysis counters, the tags found and the scopes not found in the lookup table,
+            the datasets for the details report and the tag suggestions, and the metrics of the worker
+        '''
+        results = {
+            "analyses": self._analyses,
+            "tags_found": [(scope, tag) for scope, tags in self._scopes.items() for tag, details in tags.items() if details["tag_found"]],
+            "scopes_not_found": list(self._scopes_not_found),
+            "largest": self._largest,
+            "oldest": self._oldest,
+            "unmatched": self._unmatched,
+            "metrics": metrics.take(),
+        }
+        self._analyses = {name: empty_counters() for name in self._analyses}
+        self._largest = {}
+        self._oldest = {}
+        self._unmatched = TagSuggester()
+        for tags in self._scopes.values():
+            for details in tags.values():
+                details["tag_found"] = False
+        return results
+
+    def merge_results(self, results: dict) -> int:
+        '''
+        Add the results of a worker process to the ones of this analyser.
+        Arguments:
+            results: dict -> results as returned by take_results, with the number of datasets analysed stored as 'rows'
+        Return:
+            number of datasets analysed by the worker
+        '''
+        for name, details in results["analyses"].items():
+            for key, value in details.items():
+                self._analyses[name][key] += value
+        for scope, tag in results["tags_found"]:
+            self._scopes[scope][tag]["tag_found"] = True
+        for scope in results["scopes_not_found"]:
+            if scope not in self._scopes_not_found:
+                self._scopes_not_found.append(scope)
+        for heaps, merged_heaps in ((results["largest"], self._largest), (results["oldest"], self._oldest)):
+            for name, heap in heaps.items():
+                for entry in heap:
+                    self.push_bounded(merged_heaps.setdefault(name, []), entry)
+        self._unmatched.merge(results["unmatched"])
+        metrics.merge(results["metrics"])
+        return results["rows"]
+
+    def analyse_rows(self, datasets: pd.DataFrame) -> None:
+        '''
+        Match datasets to analyses one row at a time.
+        This is the reference implementation for the columnar engine in analyse_columns.
+        Arguments:
+            datasets: pd.DataFrame -> datasets on the RSE, with columns as in DUMP_COLUMNS
+        '''
+        for line in datasets.itertuples(index=False):
             scope = line.scope
             if not self.scope_is_valid(scope):
-                continue            
+                continue
             name = line.name
             size = line.size
-            old = self.replica_is_old(line.created, line.updated, line.accessed)
+            latest = self.latest_timestamp(line.created, line.updated, line.accessed)
+            old = self.replica_is_old(latest)
+            bucket = AGE_BUCKETS[self.age_bucket(latest)]
             matching_tags = self.match_tags(scope, name)
-            if matching_tags is None:
+            if not matching_tags:
+                self._unmatched.add(str(scope), name_components(str(scope), name), int(size))
                 continue
+            matched_analyses = []
             for tag in matching_tags:
                 analysis_name = self._scopes[scope][tag]["analysis"]
                 if analysis_name == "":
@@ -83,7 +364,159 @@ class GridSpaceAnalyser:
                 self._analyses[analysis_name]["size"] += size
                 if old:
                     self._analyses[analysis_name]["ntotal_old"] += 1
-        self.check_obsolete_tags()
+                self._analyses[analysis_name][f"ntotal {bucket}"] += 1
+                self._analyses[analysis_name][f"size {bucket}"] += size
+                matched_analyses.append(analysis_name)
+            # a dataset matching several tags of the same analysis is listed only once
+            for analysis_name in dict.fromkeys(matched_analyses):
+                self.add_details(analysis_name, str(scope), name, size, latest)
+
+    def analyse_columns(self, datasets: pd.DataFrame) -> None:
+        '''
+        Match datasets to analyses using vectorised operations on whole columns.
+        The results are identical to the ones of analyse_rows.
+        Arguments:
+            datasets: pd.DataFrame -> datasets on the RSE, with columns as in DUMP_COLUMNS
+        '''
+        valid = datasets["scope"].isin(self._scopes.keys())
+        for scope in datasets.loc[~valid, "scope"].unique():
+            self.scope_is_valid(scope)
+        datasets = datasets[valid]
+        latest = pd.Series(self.latest_timestamps(datasets), index=datasets.index)
+        old = self.replicas_are_old(latest)
+        buckets = pd.Series(self.age_buckets(latest.to_numpy()), index=datasets.index)
+
+        matches = []
+        for scope, scope_datasets in datasets.groupby("scope", sort=False, observed=True):
+            names = scope_datasets["name"].astype(str)
+            hits = self.match_tags_columns(scope, names)
+            self.collect_unmatched(scope, names[~names.index.isin(hits.index)], scope_datasets["size"])
+            if hits.empty:
+                continue
+            # one row per (dataset, tag) match, a dataset matching several tags is counted for each of them
+            stacked = hits.stack()
+            stacked = stacked[stacked]
+            rows = stacked.index.get_level_values(0)
+            tags = stacked.index.get_level_values(1)
+            analyses = [self._scopes[scope][tag]["analysis"] or "uncategorised" for tag in tags]
+            matches.append(pd.DataFrame({
+                "analysis": analyses,
+                "row": rows,
+                "size": scope_datasets["size"].loc[rows].to_numpy(),
+                "latest": latest.loc[rows].to_numpy(),
+                "old": old.loc[rows].to_numpy(),
+                "bucket": buckets.loc[rows].to_numpy(),
+            }))
+        if not matches:
+            return
+
+        matches = pd.concat(matches, ignore_index=True)
+        summary = matches.groupby(["analysis", "bucket"], sort=False).agg(
+            ntotal=("size", "size"), size=("size", "sum"), ntotal_old=("old", "sum"),
+        )
+        for (analysis_name, bucket), row in summary.iterrows():
+            counters = self._analyses[analysis_name]
+            counters["ntotal"] += int(row["ntotal"])
+            counters["size"] += int(row["size"])
+            counters["ntotal_old"] += int(row["ntotal_old"])
+            counters[f"ntotal {AGE_BUCKETS[bucket]}"] += int(row["ntotal"])
+            counters[f"size {AGE_BUCKETS[bucket]}"] += int(row["size"])
+        if self._top > 0:
+            self.update_details(datasets, matches)
+
+    def collect_unmatched(self, scope: str, names: pd.Series, sizes: pd.Series) -> None:
+        '''
+        Vectorised version of adding datasets not matching any tag to self._unmatched.
+        The datasets are grouped by the first component of their names, and for each group only the components shared by all
+        of its datasets are added, which is all the suggester keeps.
+        Arguments:
+            scope: str -> scope of the datasets
+            names: pd.Series -> names of the datasets not matching any tag
+            sizes: pd.Series -> sizes of the datasets, indexed like names (or a superset of it)
+        '''
+        if names.empty:
+            return
+        depth = self._unmatched.depth
+        # same as name_components, applied to the whole column, with missing components as NaN
+        components = names.str.removeprefix(f"{scope}.").str.split(".", n=depth, expand=True).iloc[:, :depth]
+        first = components[0].to_numpy()
+        groups = sizes.loc[names.index].groupby(first, sort=False).agg(["size", "sum"])
+        shared = {}
+        for level in components.columns[1:]:
+            column = components[level]
+            missing = column.isna().groupby(first, sort=False).agg(["any", "all"])
+            values = column.groupby(first, sort=False).agg(["nunique", "first"])
+            shared[level] = (missing, values)
+        for component, (count, size) in zip(groups.index, groups.to_numpy()):
+            prefix = [component]
+            branched = False
+            for missing, values in shared.values():
+                if missing.at[component, "all"]:
+                    break
+                if missing.at[component, "any"] or values.at[component, "nunique"] > 1:
+                    branched = True
+                    break
+                prefix.append(values.at[component, "first"])
+            self._unmatched.add(str(scope), prefix, int(size), int(count), branched)
+
+    def update_details(self, datasets: pd.DataFrame, matches: pd.DataFrame) -> None:
+        '''
+        Offer the largest and least recently used datasets of each analysis in a chunk to the heaps of the details report.
+        Only datasets which can still enter a heap are passed on, selected for all analyses at once with vectorised operations:
+        those not below the smallest entry of a full heap, and of these the self._top largest (least recently used) ones
+        of each analysis in the chunk, plus ties. Once the heaps are full, hardly any dataset of a chunk is passed on.
+        Arguments:
+            datasets: pd.DataFrame -> datasets of the chunk, with columns as in DUMP_COLUMNS
+            matches: pd.DataFrame -> one row per (dataset, analysis) match, with the index of the dataset in datasets as 'row'
+        '''
+        codes, analysis_names = pd.factorize(matches["analysis"])
+        rows = matches["row"].to_numpy()
+        sizes = matches["size"].to_numpy(dtype=np.int64)
+        latest = matches["latest"].to_numpy()
+        has_timestamp = latest != NO_TIMESTAMP
+        # heap entries are (size, scope, name, latest) and (-latest, scope, name, size), compared by their first element first
+        for heaps, values, others, valid in ((self._largest, sizes, latest, None), (self._oldest, -np.where(has_timestamp, latest, 0), sizes, has_timestamp)):
+            # smallest value which can still enter the heap of each analysis
+            thresholds = np.array([
+                heaps[name][0][0] if len(heaps.get(name, [])) >= self._top else np.iinfo(np.int64).min for name in analysis_names
+            ], dtype=np.int64)
+            passed = values >= thresholds[codes]
+            if valid is not None:
+                passed &= valid
+            candidates = pd.DataFrame({"code": codes[passed], "row": rows[passed], "value": values[passed], "other": others[passed]})
+            # a dataset matching several tags of the same analysis is listed only once
+            candidates = candidates.drop_duplicates(["code", "row"])
+            candidates = candidates[candidates.groupby("code", sort=False)["value"].rank(method="min", ascending=False) <= self._top]
+            scopes = datasets["scope"].loc[candidates["row"]].astype(str).to_numpy()
+            names = datasets["name"].loc[candidates["row"]].to_numpy()
+            for code, scope, name, value, other in zip(candidates["code"].to_numpy(), scopes, names, candidates["value"].to_numpy(), candidates["other"].to_numpy()):
+                self.push_bounded(heaps.setdefault(analysis_names[code], []), (int(value), scope, name, int(other)))
+
+    def add_details(self, analysis_name: str, scope: str, name: str, size: int, latest: int) -> None:
+        '''
+        Offer a dataset to the heaps of the largest and of the least recently used datasets of an analysis.
+        Arguments:
+            analysis_name: str -> analysis the dataset belongs to
+            scope: str -> scope of the dataset
+            name: str -> name of the dataset
+            size: int -> size of the dataset in bytes
+            latest: int -> latest of its created/updated/accessed timestamps, NO_TIMESTAMP if none is given
+        '''
+        if self._top <= 0:
+            return
+        self.push_bounded(self._largest.setdefault(analysis_name, []), (size, scope, name, latest))
+        if latest != NO_TIMESTAMP:
+            self.push_bounded(self._oldest.setdefault(analysis_name, []), (-latest, scope, name, size))
+
+    def push_bounded(self, heap: list[tuple], entry: tuple) -> None:
+        '''
+        Add an entry to a min-heap holding the self._top largest entries offered so far.
+        Entries are compared as tuples, such that the result does not depend on the order in which they are offered.
+        '''
+        if len(heap) < self._top:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
 
     def scope_is_valid(self, scope: str) -> bool:
         '''
@@ -109,31 +542,117 @@ class GridSpaceAnalyser:
         Return:
             list of tags matching given name in the given scope
         '''
-        matching_tags = []
-        for tag in self._scopes[scope]:
-            if re.search(tag, name) is not None:
-                matching_tags.append(tag)
-                self._scopes[scope][tag]["tag_found"] = True
-        if len(matching_tags) == 0:
-            log.warning(f"Could not find any tags for file {name} in scope {scope}.")
-            return []
+        with metrics.span("match_tags"):
+            matching_tags = self._matchers[scope].match(name)
+        for tag in matching_tags:
+            self._scopes[scope][tag]["tag_found"] = True
         if len(matching_tags) > 1:
             log.warning(f"Found multiple tags matching file {name} in scope {scope}.")
         return matching_tags
 
-    def replica_is_old(self, created, updated, accessed,threshold: int = 365*24*60*60) ->bool:
+    def match_tags_columns(self, scope: str, names: pd.Series) -> pd.DataFrame:
+        '''
+        Match a column of dataset names in a given scope to the tags in the lookup table.
+        Arguments:
+            scope: str -> scope to match
+            names: pd.Series -> names of datasets to match
+        Return:
+            boolean DataFrame with one column per tag, indexed like names, for all names matching at least one tag
+        '''
+        with metrics.span("match_tags"):
+            return self._match_tags_columns(scope, names)
+
+    def _match_tags_columns(self, scope: str, names: pd.Series) -> pd.DataFrame:
+        matcher = self._matchers[scope]
+        candidates = names
+        if matcher.prefilter is not None:
+            passed = names.str.contains(matcher.prefilter)
+            # tags left out of the prefilter are matched against every name
+            for pattern, prefiltered in zip(matcher.patterns, matcher.prefiltered):
+                if not prefiltered:
+                    passed |= names.str.contains(pattern)
+            candidates = names[passed]
+        hits = pd.DataFrame(
+            {
+                tag: candidates.str.contains(literal, regex=False) if literal is not None else candidates.str.contains(pattern)
+                for tag, literal, pattern in zip(matcher.tags, matcher.literals, matcher.patterns)
+            },
+            index=candidates.index,
+            columns=matcher.tags,
+        )
+        n_matches = hits.sum(axis=1)
+        for tag in hits.columns[hits.any(axis=0)]:
+            self._scopes[scope][tag]["tag_found"] = True
+        for name in candidates[n_matches > 1]:
+            log.warning(f"Found multiple tags matching file {name} in scope {scope}.")
+        return hits[n_matches > 0]
+
+    def latest_timestamp(self, created, updated, accessed) -> int:
+        '''
+        Find the latest of the created/updated/accessed timestamps of a replica.
+        Timestamps without time zone are taken to be in UTC.
+        Return:
+            latest timestamp in seconds since the epoch, NO_TIMESTAMP if none of the timestamps is given
+        '''
         def parse_time(t):
             if t is None or pd.isna(t):
-                return None
-            return datetime.fromisoformat(str(t).replace("Z", "+00:00")).timestamp()
-        
-        times = [parse_time(created), parse_time(updated), parse_time(accessed)]
-        times = [t for t in times if t is not None]
-        if not times:
-            return False
-        maxtime = max(times)
-        return (datetime.now(timezone.utc).timestamp() - maxtime) > threshold
-        
+                return NO_TIMESTAMP
+            parsed = datetime.fromisoformat(str(t).replace("Z", "+00:00"))
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            return int(parsed.timestamp())
+        return max(parse_time(created), parse_time(updated), parse_time(accessed))
+
+    def latest_timestamps(self, datasets: pd.DataFrame) -> np.ndarray:
+        '''
+        Vectorised version of latest_timestamp, parsing each of the created/updated/accessed columns once.
+        Arguments:
+            datasets: pd.DataFrame -> datasets on the RSE, with columns as in DUMP_COLUMNS
+        Return:
+            int64 array of the latest timestamp of each dataset in seconds since the epoch, NO_TIMESTAMP where none is given
+        '''
+        latest = np.full(len(datasets), NO_TIMESTAMP, dtype=np.int64)
+        for column in ("created", "updated", "accessed"):
+            times = pd.to_datetime(datasets[column], utc=True, errors="coerce", format="ISO8601")
+            # NaT is converted to the smallest int64, i.e. NO_TIMESTAMP
+            np.maximum(latest, times.dt.tz_localize(None).to_numpy(dtype="datetime64[s]").astype(np.int64), out=latest)
+        return latest
+
+    def replica_is_old(self, latest: int) -> bool:
+        '''
+        Check whether the latest timestamp of a replica is older than the threshold of this analyser.
+        Replicas without any timestamp are never old.
+        '''
+        return latest != NO_TIMESTAMP and self._now - latest > self._threshold
+
+    def replicas_are_old(self, latest: pd.Series) -> pd.Series:
+        '''
+        Vectorised version of replica_is_old.
+        Arguments:
+            latest: pd.Series -> latest timestamps as returned by latest_timestamps
+        Return:
+            boolean Series, True for replicas whose latest timestamp is older than the threshold
+        '''
+        return (latest != NO_TIMESTAMP) & (self._now - latest > self._threshold)
+
+    def age_bucket(self, latest: int) -> int:
+        '''
+        Find the age bucket of a replica.
+        Return:
+            index of the bucket in AGE_BUCKETS
+        '''
+        if latest == NO_TIMESTAMP:
+            return len(AGE_BUCKETS) - 1
+        return bisect.bisect_left(self._bucket_edges, self._now - latest)
+
+    def age_buckets(self, latest: np.ndarray) -> np.ndarray:
+        '''
+        Vectorised version of age_bucket.
+        '''
+        buckets = np.searchsorted(self._bucket_edges, self._now - latest, side="left")
+        buckets[latest == NO_TIMESTAMP] = len(AGE_BUCKETS) - 1
+        return buckets
+
     def check_obsolete_tags(self) -> None:
         '''
         Print a warning if a tag in the lookup table was not found in any of the samples.
@@ -145,9 +664,21 @@ class GridSpaceAnalyser:
                 if not details["tag_found"]:
                     log.warning(f"Tag {tag} was not found in any of the samples. Maybe it is obsolete?")
 
+    def log_unmatched(self) -> None:
+        '''
+        Print one warning for all datasets not matching any tag, together with the tags suggested for the largest of them.
+        '''
+        if self._unmatched.count == 0:
+            return
+        size = float(f"{(self._unmatched.size/1024.**3):.5g}")
+        log.warning(f"Could not find any tags for {self._unmatched.count} datasets ({size:g} GB) on {self._rse}, see reports/{self._rse}.suggested_tags.csv for suggested tags.")
+        for scope, tag, count, size in self._unmatched.suggest(SUGGEST_LOG):
+            log.info(f"Suggested tag {tag} in scope {scope} for {count} datasets ({float(f'{(size/1024.**3):.5g}'):g} GB).")
+
     def report(self) -> None:
         '''
-        Create report for each RSE, stored as CSV file in 'reports/'
+        Create report for each RSE, stored as CSV file in 'reports/', and add it to the history store if one is given.
+        The breakdown by age is stored in a separate CSV file, see report_ages.
         '''
         log.info(f"Creating report for {self._rse}.")
         with open(f'reports/{self._rse}.csv', 'w') as f:
@@ -157,3 +688,189 @@ class GridSpaceAnalyser:
                 size = float(f"{(details['size']/1024.**3):.5g}")
                 writer.writerow([name, details["ntotal"], f'{size:g}', details["ntotal_old"]])
                 log.info(f"{name}  {details['ntotal']} {size:g} {details['ntotal_old']}")
+        self.report_ages()
+        self.report_details()
+        self.report_suggested_tags()
+        if self._history is not None:
+            self._history.record(self._rse, TODAY.strftime("%Y-%m-%d"), {name: (int(details["size"]) // 1024, details["ntotal"]) for name, details in self._analyses.items()})
+
+
+    def report_ages(self) -> None:
+        '''
+        Create report of the number of datasets and disk space per age bucket for each analysis, stored as 'reports/<RSE>.ages.csv'.
+        The age of a dataset is the time since it was last created, updated or accessed.
+        '''
+        with open(f'reports/{self._rse}.ages.csv', 'w') as f:
+            writer = csv.writer(f, delimiter=',')
+            header = ["Analysis"]
+            for bucket in AGE_BUCKETS:
+                header += [f"Number of Files {bucket}", f"Disk Usage in GB {bucket}"]
+            writer.writerow(header)
+            for name, details in self._analyses.items():
+                row = [name]
+                for bucket in AGE_BUCKETS:
+                    size = float(f"{(details[f'size {bucket}']/1024.**3):.5g}")
+                    row += [details[f"ntotal {bucket}"], f'{size:g}']
+                writer.writerow(row)
+
+    def report_details(self) -> None:
+        '''
+        Create report of the largest and the least recently used datasets of each analysis, stored as 'reports/<RSE>.details.csv'.
+        A dataset is used when it is created, updated or accessed.
+        '''
+        if self._top <= 0:
+            return
+        with open(f'reports/{self._rse}.details.csv', 'w') as f:
+            writer = csv.writer(f, delimiter=',')
+            writer.writerow(["Analysis", "List", "Rank", "Scope", "Name", "Disk Usage in GB", "Last used"])
+            for name in self._analyses:
+                largest = sorted(self._largest.get(name, []), reverse=True)
+                oldest = [(size, scope, dataset, -latest) for latest, scope, dataset, size in sorted(self._oldest.get(name, []), reverse=True)]
+                for label, entries in (("largest", largest), ("oldest", oldest)):
+                    for rank, (size, scope, dataset, latest) in enumerate(entries, start=1):
+                        size = float(f"{(size/1024.**3):.5g}")
+                        last_used = datetime.fromtimestamp(latest, timezone.utc).strftime("%Y-%m-%d") if latest != NO_TIMESTAMP else ""
+                        writer.writerow([name, label, rank, scope, dataset, f'{size:g}', last_used])
+
+    def report_suggested_tags(self) -> None:
+        '''
+        Create report of tags suggested for the datasets not matching any tag in the lookup table, stored as 'reports/<RSE>.suggested_tags.csv'.
+        The tags are prefixes of the dataset names, starting after the scope, ordered by the disk space they cover.
+        '''
+        with open(f'reports/{self._rse}.suggested_tags.csv', 'w') as f:
+            writer = csv.writer(f, delimiter=',')
+            writer.writerow(["Scope", "Tag", "Number of Files", "Disk Usage in GB"])
+            for scope, tag, count, size in self._unmatched.suggest(SUGGEST_TOP):
+                size = float(f"{(size/1024.**3):.5g}")
+                writer.writerow([scope, tag, count, f'{size:g}'])
+
+
+def analyse_rses(analysers: list[GridSpaceAnalyser]) -> list[GridSpaceAnalyser]:
+    '''
+    Analyse the dumps of several RSEs concurrently, with one process per RSE.
+    The results are merged back into the given analysers, such that they can be reported as after analyse_datasets.
+    An RSE whose dump cannot be analysed, e.g. because it is missing or truncated, is logged and skipped, such that
+    the other RSEs can still be reported.
+    Arguments:
+        analysers: list[GridSpaceAnalyser] -> analysers with lookup table loaded, one per RSE
+    Return:
+        list of the analysers whose dump has been analysed
+    '''
+    analysed = []
+    if len(analysers) == 1:
+        try:
+            analysers[0].analyse_datasets()
+            analysed.append(analysers[0])
+        except Exception as e:
+            log.error(f"Could not analyse the dump of {analysers[0]._rse}: {e}")
+        return analysed
+    log.info(f"Analysing the dumps of {len(analysers)} RSEs concurrently.")
+    # metrics inherited from this process are dropped in the workers, such that they are not counted twice when merged back
+    with ProcessPoolExecutor(max_workers=len(analysers), initializer=metrics.reset) as executor:
+        futures = [executor.submit(_analyse_rse, analyser) for analyser in analysers]
+        for analyser, future in zip(analysers, futures):
+            try:
+                analyser.merge_results(future.result())
+                analysed.append(analyser)
+            except Exception as e:
+                log.error(f"Could not analyse the dump of {analyser._rse}: {e}")
+    return analysed
+
+
+def report_summary(analysers: list[GridSpaceAnalyser], path: str = SUMMARY_FILE) -> None:
+    '''
+    Create report comparing the analyses across RSEs, with number of files and disk usage on each RSE,
+    the total disk usage and the number of RSEs holding data of the analysis.
+    Arguments:
+        analysers: list[GridSpaceAnalyser] -> analysers after analyse_datasets, one per RSE
+        path: str -> CSV file to write the report to
+    '''
+    log.info(f"Creating summary for {', '.join(analyser._rse for analyser in analysers)}.")
+    names = list(dict.fromkeys(name for analyser in analysers for name in analyser._analyses))
+    with open(path, 'w') as f:
+        writer = csv.writer(f, delimiter=',')
+        header = ["Analysis"]
+        for analyser in analysers:
+            header += [f"Number of Files {analyser._rse}", f"Disk Usage in GB {analyser._rse}"]
+        writer.writerow(header + ["Total Disk Usage in GB", "Number of RSEs"])
+        for name in names:
+            row = [name]
+            total = 0
+            n_rses = 0
+            for analyser in analysers:
+                details = analyser._analyses.get(name, empty_counters())
+                size = float(f"{(details['size']/1024.**3):.5g}")
+                row += [details["ntotal"], f'{size:g}']
+                total += details["size"]
+                n_rses += details["ntotal"] > 0
+            writer.writerow(row + [f'{float(f"{(total/1024.**3):.5g}"):g}', n_rses])
+
+# analyser used by each worker process of GridSpaceAnalyser.analyse_parallel
+_worker_analyser: GridSpaceAnalyser | None = None
+
+
+def _init_worker(analyser: GridSpaceAnalyser) -> None:
+    global _worker_analyser
+    _worker_analyser = analyser
+    metrics.reset()
+
+
+def _analyse_rse(analyser: GridSpaceAnalyser) -> dict:
+    '''
+    Analyse the dump of one RSE in a worker process of analyse_rses.
+    '''
+    n_rows = analyser.analyse_datasets()
+    results = analyser.take_results()
+    results["rows"] = n_rows
+    return results
+
+
+def _analyse_pieces(pieces: Iterator[bytes]) -> dict:
+    '''
+    Analyse the decompressed data of a range of the dump in a worker process.
+    The ranges are not aligned to lines, so the (incomplete) text before the first and after the last line break
+    is returned as 'head' and 'tail', to be analysed together with the neighbouring ranges.
+    'head' is None if there is no line break in the range at all.
+    '''
+    head = None
+    tail = b""
+    n_rows = 0
+    for block in iter_line_blocks(pieces, PARALLEL_BLOCK_BYTES):
+        if head is None:
+            first_line_end = block.find(b"\n") + 1
+            if first_line_end == 0:
+                tail = block
+                continue
+            head, block = block[:first_line_end], block[first_line_end:]
+        last_line_end = block.rfind(b"\n") + 1
+        n_rows += _worker_analyser.analyse_lines(block[:last_line_end])
+        tail = block[last_line_end:]
+    results = _worker_analyser.take_results()
+    results.update({"rows": n_rows, "head": head, "tail": tail})
+    return results
+
+
+def _analyse_dump_range(f: pathlib.Path, start: int, end: int) -> dict:
+    '''
+    Decompress and analyse the bz2 streams between two byte offsets of the dump in a worker process, see _analyse_pieces.
+    '''
+    return _analyse_pieces(iter_decompressed(f, start, end))
+
+
+def _analyse_dump_blocks(f: pathlib.Path, boundaries: list[int], first: int, last: int) -> dict:
+    '''
+    Decompress and analyse the bz2 blocks of a single-stream dump starting at the candidates boundaries[first:last]
+    in a worker process, see iter_decompressed_blocks and _analyse_pieces.
+    The indices of the candidates at which the first block starts and the last one ends are returned as 'blocks',
+    to check that the ranges join up; both are 'last' if no block starts in the range.
+    '''
+    blocks = [last, last]
+    def pieces():
+        for start, end, data in iter_decompressed_blocks(f, boundaries, first, last):
+            if blocks[0] == blocks[1]:
+                blocks[0] = start
+            blocks[1] = end
+            yield data
+    results = _analyse_pieces(pieces())
+    results["blocks"] = tuple(blocks)
+    return results
@@ -1,12 +1,109 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from stare import Glance
 
+from helpers import metrics
+from helpers.glance import GlanceCache
 from helpers.logger import log
 
+# number of Glance lookups running at the same time
+DEFAULT_WORKERS = 8
+# number of attempts per Glance API call, with exponentially increasing waiting time in between
+DEFAULT_ATTEMPTS = 3
+DEFAULT_BACKOFF = 1.0
+# papers linked to an analysis are looked up again after this many days, such that a new paper is found by the next daily run,
+# while reruns on the same day are answered from the cache
+ANALYSIS_CACHE_TTL_DAYS = 0.5
+
 
 class PublicationAnalyser:
 
-    def __init__(self, client: Glance | None = None):
+    def __init__(self, client: Glance | None = None, cache: GlanceCache | None = None, workers: int = DEFAULT_WORKERS, attempts: int = DEFAULT_ATTEMPTS, backoff: float = DEFAULT_BACKOFF, analysis_ttl_days: float = ANALYSIS_CACHE_TTL_DAYS):
         self._client = client or Glance()
+        self._cache = cache
+        self._workers = workers
+        self._attempts = attempts
+        self._backoff = backoff
+        self._analysis_ttl_days = analysis_ttl_days
+        self._lock = threading.Lock()
+        self.api_calls = 0
+        self.cache_hits = 0
+        self.retries = 0
+
+    def _call(self, function, *args):
+        '''
+        Call the Glance API, retrying with jittered exponential backoff if the call fails.
+        Arguments:
+            function -> client method to call, e.g. self._client.papers.get
+            args -> arguments to pass to the method
+        Return:
+            response of the API
+        '''
+        for attempt in range(self._attempts):
+            with self._lock:
+                self.api_calls += 1
+            try:
+                with metrics.span("glance_api"):
+                    return function(*args)
+            except Exception as e:
+                if attempt + 1 == self._attempts:
+                    raise
+                delay = self._backoff * 2**attempt * random.uniform(0.5, 1.5)
+                log.debug(f"Glance API call failed ({e}), retrying in {delay:.1f} s.")
+                with self._lock:
+                    self.retries += 1
+                time.sleep(delay)
+
+    def _cached(self, key: str, lookup, ttl_days: float | None = None):
+        '''
+        Retrieve a response from the cache, or look it up and add it to the cache.
+        Arguments:
+            key: str -> key of the response in the cache
+            lookup -> function without arguments returning the (JSON-serialisable) response
+            ttl_days: float|None -> number of days after which the cached response expires, if shorter than the one of the cache
+        Return:
+            response
+        '''
+        if self._cache is not None:
+            value = self._cache.get(key, ttl_days)
+            if value is not None:
+                with self._lock:
+                    self.cache_hits += 1
+                metrics.count("glance_cache_hits")
+                return value
+        value = lookup()
+        if self._cache is not None:
+            self._cache.put(key, value)
+        return value
+
+    def related_papers(self, glance_code: str) -> list[str]:
+        '''
+        Look up the reference codes of the papers linked to an analysis.
+        Arguments:
+            glance_code: str -> analysis reference code, e.g. "ANA-EXOT-2019-35"
+        Return:
+            list of paper reference codes
+        '''
+        def lookup():
+            analysis = self._call(self._client.analyses.get, glance_code)
+            return [related.reference_code for related in analysis.related_publications if related.type == "Paper" and related.reference_code]
+        return self._cached(f"analysis:{glance_code}", lookup, self._analysis_ttl_days)
+
+    def paper_is_accepted(self, reference_code: str) -> bool:
+        '''
+        Check whether a paper has a recorded journal acceptance date.
+        Arguments:
+            reference_code: str -> paper reference code
+        Return:
+            True if the paper has been accepted by a journal, False otherwise
+        '''
+        def lookup():
+            paper = self._call(self._client.papers.get, reference_code)
+            return bool(paper.publication_phase and paper.publication_phase.journal_acceptance_date)
+        return self._cached(f"paper:{reference_code}", lookup)
 
     def is_accepted_by_journal(self, glance_code: str) -> bool:
         '''
@@ -16,30 +113,32 @@ class PublicationAnalyser:
         Return:
             True if a paper is linked to the analysis and has a recorded journal acceptance date, False otherwise
         '''
-        analysis = self._client.analyses.get(glance_code)
-        for related in analysis.related_publications:
-            if related.type != "Paper" or not related.reference_code:
-                continue
-            paper = self._client.papers.get(related.reference_code)
-            if paper.publication_phase and paper.publication_phase.journal_acceptance_date:
-                return True
-        return False
+        return any(self.paper_is_accepted(reference_code) for reference_code in self.related_papers(glance_code))
+
+    def _check(self, code: str) -> bool:
+        try:
+            return self.is_accepted_by_journal(code)
+        except Exception as e:
+            log.warning(f"Could not determine publication status for {code}: {e}")
+            return False
 
     def find_newly_finished(self, glance_codes: set[str], already_finished: set[str]) -> list[str]:
         '''
         Check publication status for every glance code not yet marked as finished.
+        The lookups run concurrently on a pool of self._workers threads.
         Arguments:
             glance_codes: set[str] -> all known analysis reference codes
             already_finished: set[str] -> reference codes already marked as finished
         Return:
             list of reference codes whose paper has newly been accepted by a journal
         '''
+        codes = sorted(glance_codes - already_finished)
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            accepted = list(executor.map(self._check, codes))
         newly_finished = []
-        for code in sorted(glance_codes - already_finished):
-            try:
-                if self.is_accepted_by_journal(code):
-                    log.info(f"{code} has been accepted by a journal.")
-                    newly_finished.append(code)
-            except Exception as e:
-                log.warning(f"Could not determine publication status for {code}: {e}")
+        for code, is_accepted in zip(codes, accepted):
+            if is_accepted:
+                log.info(f"{code} has been accepted by a journal.")
+                newly_finished.append(code)
+        log.info(f"Checked {len(codes)} analyses with {self.api_calls} Glance API calls ({self.retries} retries) and {self.cache_hits} cache hits.")
         return newly_finished
@@ -0,0 +1,87 @@
+"""
+Run GridSpaceAnalyser.analyse_datasets on a synthetic datasets_per_rse dump with each engine, and with the columnar engine
+in several worker processes, both on a single-stream and a multi-stream dump.
+Check that the reports are identical and compare the run times,
+including the one of a run without collecting the largest and least recently used datasets for the details report.
+Run from the repository root: python3 -m benchmarks.bench_analyse_datasets --rows 1000000
+"""
+
+import argparse
+import contextlib
+import logging
+import os
+import pathlib
+import tempfile
+import time
+
+from analysers.gridspaceanalyser import DEFAULT_CHUNKSIZE, DEFAULT_TOP, ENGINES, GridSpaceAnalyser
+from benchmarks.generators import write_dump
+from helpers.logger import log
+
+RSE = "BENCHMARK_PHYS-EXOTICS"
+DATE = "2000-01-01"
+
+
+@contextlib.contextmanager
+def working_directory(path: pathlib.Path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def run(engine: str, dump_directory: pathlib.Path, output_directory: pathlib.Path, chunksize: int, workers: int = 1, top: int = DEFAULT_TOP) -> float:
+    analyser = GridSpaceAnalyser(rse=RSE, date=DATE, engine=engine, chunksize=chunksize, workers=workers, top=top)
+    analyser.report_path = dump_directory
+    analyser.load_lookup_table()
+    start = time.perf_counter()
+    analyser.analyse_datasets()
+    elapsed = time.perf_counter() - start
+    (output_directory / "reports").mkdir(parents=True, exist_ok=True)
+    with working_directory(output_directory):
+        analyser.report()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of datasets in the synthetic dump.")
+    parser.add_argument("--hit-rate", type=float, default=0.3, help="Fraction of datasets matching a tag.")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Number of datasets read from the dump at once.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of worker processes for the parallel runs.")
+    args = parser.parse_args()
+
+    # the per-dataset warnings would dominate the run time
+    log.setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = pathlib.Path(tmp)
+        dump = f"{DATE}/datasets_per_rse/{RSE}.datasets_per_rse.{DATE}.csv.bz2"
+        write_dump(tmp / "single" / dump, args.rows, args.hit_rate)
+        # pbzip2 compresses blocks of 900 kB as separate streams
+        write_dump(tmp / "multi" / dump, args.rows, args.hit_rate, stream_bytes=900*1000)
+        runs = {f"{engine}": (engine, "single", 1) for engine in ENGINES}
+        runs[f"columnar, {args.workers} workers"] = ("columnar", "single", args.workers)
+        runs[f"columnar, {args.workers} workers, multi-stream"] = ("columnar", "multi", args.workers)
+        times = {
+            label: run(engine, tmp / dumps, tmp / "output" / str(i), args.chunksize, workers)
+            for i, (label, (engine, dumps, workers)) in enumerate(runs.items())
+        }
+        reports = {
+            label: [(tmp / "output" / str(i) / "reports" / f"{RSE}{suffix}.csv").read_text() for suffix in ("", ".ages", ".details", ".suggested_tags")]
+            for i, label in enumerate(runs)
+        }
+        times["columnar, without details"] = run("columnar", tmp / "single", tmp / "output" / "no-details", args.chunksize, top=0)
+
+    reference = reports["rows"]
+    for label, report in reports.items():
+        if report != reference:
+            raise RuntimeError(f"Report of run '{label}' differs from the one of the rows engine.")
+    print(f"rows: {args.rows}, reports identical for all runs")
+    for label, elapsed in times.items():
+        print(f"{label:>36}: {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Compare the run time of the duplicate detection of the EOS Analyser on a generated tree with known copies
+with hashing the whole content of every file. The duplicates found are checked by tests/test_dedup.py.
+Run from the repository root: python3 -m benchmarks.bench_duplicates --analyses 20 --files-per-analysis 50 --file-size 2000000
+"""
+
+import argparse
+import os
+import pathlib
+import tempfile
+import time
+
+from benchmarks.generators import write_duplicate_tree
+from helpers.dedup import DEFAULT_HASH_WORKERS, find_duplicates, hash_full, reclaimable_per_pair
+from helpers.filesystem import iter_files
+
+
+def list_files(root: pathlib.Path) -> list[tuple[str, str, int]]:
+    return [(analysis, path, size) for analysis in sorted(os.listdir(root)) for path, size in iter_files(str(root / analysis))]
+
+
+def duplicates_with_full_hashes(files: list[tuple[str, str, int]]) -> list[set[str]]:
+    by_hash = {}
+    for _, path, _ in files:
+        by_hash.setdefault(hash_full(path), set()).add(path)
+    return [paths for paths in by_hash.values() if len(paths) > 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--analyses", type=int, default=20, help="Number of analysis folders in the generated tree.")
+    parser.add_argument("--files-per-analysis", type=int, default=50, help="Number of original files per analysis folder.")
+    parser.add_argument("--file-size", type=int, default=2_000_000, help="Size of most files in bytes.")
+    parser.add_argument("--partial-size", type=int, default=64 * 1024, help="Number of bytes hashed at the start and at the end of each candidate.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_HASH_WORKERS, help="Maximum number of files read at the same time.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = pathlib.Path(tmp)
+        write_duplicate_tree(root, args.analyses, args.files_per_analysis, args.file_size, args.partial_size)
+        files = list_files(root)
+
+        start = time.perf_counter()
+        duplicates = find_duplicates(files, workers=args.workers, partial_size=args.partial_size)
+        time_partial = time.perf_counter() - start
+        start = time.perf_counter()
+        duplicates_with_full_hashes(files)
+        time_full = time.perf_counter() - start
+
+    pairs = reclaimable_per_pair(duplicates)
+    print(f"files: {len(files)}, bytes: {sum(size for _, _, size in files)}, groups of identical files: {len(duplicates)}, pairs of analyses: {len(pairs)}")
+    print(f"reclaimable: {sum(size for _, size in pairs.values())} bytes")
+    print(f"size, partial and full hashes: {time_partial:.2f} s")
+    print(f"full hashes of all files:      {time_full:.2f} s ({time_full/time_partial:.1f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Measure the throughput and memory usage of the 'find' engine of the EOS Analyser, which tallies the analysis folders
+of a subgroup from a single streaming 'eos find' listing, using a fake 'eos' executable emitting a synthetic listing.
+The listing is run at two sizes, the peak memory usage should not grow with the number of files.
+The tally itself is checked by tests/test_eosanalyser.py, this script only measures its run time and memory usage.
+Run from the repository root: python3 -m benchmarks.bench_eos_listing --analyses 100 --files-per-analysis 10000
+"""
+
+import argparse
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.bench_analyse_datasets import working_directory
+from benchmarks.bench_suite import INPUT_FILES
+from benchmarks.generators import write_fake_eos
+from helpers.constants import SUBGROUPS
+from helpers.logger import log
+
+SUBGROUP = SUBGROUPS[0]
+
+
+def run_listing(tmp: pathlib.Path, analyses: int, files_per_analysis: int) -> tuple[float, int]:
+    '''
+    Tally a synthetic subgroup with the 'find' engine.
+    Return:
+        tuple of seconds and peak memory usage in bytes of the tally, measured in separate runs
+    '''
+    from analysers.eosanalyser import EOSAnalyser
+    write_fake_eos(tmp / "bin" / "eos", analyses, files_per_analysis)
+    directory = tmp / "eos" / SUBGROUP
+    for i in range(analyses):
+        (directory / f"ana{i}").mkdir(parents=True, exist_ok=True)
+    names = sorted(os.listdir(directory))
+    analyser = EOSAnalyser(str(tmp / "eos"), engine="find")
+    start = time.perf_counter()
+    analyser.list_subgroup(str(directory), names)
+    seconds = time.perf_counter() - start
+    # tracing slows down the tally considerably, so the memory usage is measured in a second run
+    tracemalloc.start()
+    analyser.list_subgroup(str(directory), names)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak_memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--analyses", type=int, default=100, help="Number of analysis folders in the synthetic subgroup.")
+    parser.add_argument("--files-per-analysis", type=int, default=10000, help="Number of files per analysis folder in the larger listing, the smaller one has a tenth of them.")
+    args = parser.parse_args()
+
+    # one warning per analysis folder without Glance code otherwise
+    log.setLevel(logging.ERROR)
+    repository = pathlib.Path.cwd()
+    for files_per_analysis in (args.files_per_analysis // 10, args.files_per_analysis):
+        with tempfile.TemporaryDirectory() as tmp, working_directory(tmp):
+            tmp = pathlib.Path(tmp)
+            for input_file in INPUT_FILES:
+                shutil.copy(repository / input_file, tmp / input_file)
+            (tmp / "reports").mkdir()
+            path = os.environ["PATH"]
+            os.environ["PATH"] = f"{tmp / 'bin'}{os.pathsep}{path}"
+            try:
+                seconds, peak_memory = run_listing(tmp, args.analyses, files_per_analysis)
+            finally:
+                os.environ["PATH"] = path
+        number_of_files = args.analyses * files_per_analysis
+        print(f"files: {number_of_files:>10}, time: {seconds:.2f} s ({number_of_files/seconds:.0f} files/s), peak memory of the tally: {peak_memory/1024**2:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
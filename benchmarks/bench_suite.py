@@ -0,0 +1,187 @@
+"""
+Time and measure the peak memory usage of the main steps of the daily and weekly jobs at several scales,
+on synthetic data only, such that no access to EOS, the rucio-analytix reports or Glance is needed:
+GridSpaceAnalyser.analyse_datasets, EOSAnalyser.check_subgroup (walking the folders, and from a fake 'eos find' listing),
+get_data_from_git_history and send_weekly_report.summarise.
+Each benchmark is run in a fresh process, such that its peak memory usage is measured separately.
+The results are written to JSON, to compare them between commits with --compare.
+Run from the repository root: python3 -m benchmarks.bench_suite --scales small medium --output results.json
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.bench_analyse_datasets import DATE, RSE, working_directory
+from benchmarks.generators import generate_subgroup_information, write_dump, write_fake_eos, write_git_history, write_tree
+from helpers.constants import SUBGROUPS
+
+# parameters of the synthetic data for each benchmark and scale
+SCALES = {
+    "small": {
+        "analyse_datasets": {"rows": 10_000},
+        "check_subgroup": {"directories": 50, "files_per_directory": 20},
+        "list_subgroup": {"analyses": 20, "files_per_analysis": 500},
+        "get_data_from_git_history": {"days": 30, "analyses": 20},
+        "summarise": {"analyses": 100},
+    },
+    "medium": {
+        "analyse_datasets": {"rows": 200_000},
+        "check_subgroup": {"directories": 300, "files_per_directory": 50},
+        "list_subgroup": {"analyses": 100, "files_per_analysis": 2000},
+        "get_data_from_git_history": {"days": 180, "analyses": 50},
+        "summarise": {"analyses": 1000},
+    },
+    "large": {
+        "analyse_datasets": {"rows": 2_000_000},
+        "check_subgroup": {"directories": 1000, "files_per_directory": 100},
+        "list_subgroup": {"analyses": 200, "files_per_analysis": 10000},
+        "get_data_from_git_history": {"days": 730, "analyses": 100},
+        "summarise": {"analyses": 10000},
+    },
+}
+# files read from the working directory by the analysers
+INPUT_FILES = ["lookup_table.csv", "glance_codes.csv", "finished_analyses.txt"]
+
+
+def bench_analyse_datasets(tmp: pathlib.Path, rows: int) -> float:
+    from analysers.gridspaceanalyser import GridSpaceAnalyser
+    write_dump(tmp / DATE / "datasets_per_rse" / f"{RSE}.datasets_per_rse.{DATE}.csv.bz2", rows, hit_rate=0.3)
+    analyser = GridSpaceAnalyser(rse=RSE, date=DATE)
+    analyser.report_path = tmp
+    analyser.load_lookup_table()
+    start = time.perf_counter()
+    analyser.analyse_datasets()
+    return time.perf_counter() - start
+
+
+def bench_check_subgroup(tmp: pathlib.Path, directories: int, files_per_directory: int) -> float:
+    from analysers.eosanalyser import EOSAnalyser
+    write_tree(tmp / "eos" / "ccs", directories, files_per_directory)
+    analyser = EOSAnalyser(str(tmp / "eos"))
+    start = time.perf_counter()
+    analyser.check_subgroup("ccs")
+    return time.perf_counter() - start
+
+
+def bench_list_subgroup(tmp: pathlib.Path, analyses: int, files_per_analysis: int) -> float:
+    from analysers.eosanalyser import EOSAnalyser
+    write_fake_eos(tmp / "bin" / "eos", analyses, files_per_analysis)
+    for i in range(analyses):
+        (tmp / "eos" / "ccs" / f"ana{i}").mkdir(parents=True)
+    # run in a fresh process, no need to restore PATH
+    os.environ["PATH"] = f"{tmp / 'bin'}{os.pathsep}{os.environ['PATH']}"
+    analyser = EOSAnalyser(str(tmp / "eos"), engine="find")
+    start = time.perf_counter()
+    analyser.check_subgroup("ccs")
+    return time.perf_counter() - start
+
+
+def bench_get_data_from_git_history(tmp: pathlib.Path, days: int, analyses: int) -> float:
+    from helpers.git import get_data_from_git_history
+    write_git_history(tmp / "repository", SUBGROUPS, analyses, days)
+    with working_directory(tmp / "repository"):
+        start = time.perf_counter()
+        for subgroup in SUBGROUPS:
+            get_data_from_git_history(subgroup, list(range(days)))
+        return time.perf_counter() - start
+
+
+def bench_summarise(tmp: pathlib.Path, analyses: int) -> float:
+    from send_weekly_report import summarise
+    subgroup_information = generate_subgroup_information(SUBGROUPS, analyses)
+    start = time.perf_counter()
+    summarise(subgroup_information)
+    return time.perf_counter() - start
+
+
+BENCHMARKS = {
+    "analyse_datasets": bench_analyse_datasets,
+    "check_subgroup": bench_check_subgroup,
+    "list_subgroup": bench_list_subgroup,
+    "get_data_from_git_history": bench_get_data_from_git_history,
+    "summarise": bench_summarise,
+}
+
+
+def run_benchmark(name: str, parameters: dict, repository: pathlib.Path) -> dict:
+    '''
+    Run one benchmark in a temporary working directory holding copies of the input files of the analysers.
+    Called in a fresh process, such that the peak memory usage of the process is the one of the benchmark.
+    '''
+    logging.getLogger().setLevel(logging.ERROR)
+    from helpers.logger import log
+    log.setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = pathlib.Path(tmp)
+        for input_file in INPUT_FILES:
+            shutil.copy(repository / input_file, tmp / input_file)
+        (tmp / "reports").mkdir()
+        with working_directory(tmp):
+            seconds = BENCHMARKS[name](tmp, **parameters)
+    # ru_maxrss is given in kB on Linux
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"benchmark": name, "parameters": parameters, "seconds": seconds, "peak_memory_mb": peak_memory}
+
+
+def current_commit() -> str | None:
+    result = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def compare(results: list[dict], previous: list[dict]) -> None:
+    '''
+    Print the ratio of run time and peak memory usage with respect to previous results of the same benchmarks and scales.
+    '''
+    previous = {(r["benchmark"], r["scale"]): r for r in previous}
+    for result in results:
+        reference = previous.get((result["benchmark"], result["scale"]))
+        if reference is None:
+            continue
+        print(f"{result['benchmark']:>26} {result['scale']:>6}: time x{result['seconds']/reference['seconds']:.2f}, memory x{result['peak_memory_mb']/reference['peak_memory_mb']:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scales", nargs="+", default=["small"], choices=list(SCALES), help="Scales to run the benchmarks at.")
+    parser.add_argument("--benchmarks", nargs="+", default=list(BENCHMARKS), choices=list(BENCHMARKS), help="Benchmarks to run.")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file to write the results to.")
+    parser.add_argument("--compare", help="JSON file with the results of a previous run, e.g. of another commit, to compare to.")
+    args = parser.parse_args()
+
+    repository = pathlib.Path.cwd()
+    results = []
+    for scale in args.scales:
+        for name in args.benchmarks:
+            # a new process for each benchmark, not forked from this one, such that memory usage is not inherited
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                result = executor.submit(run_benchmark, name, SCALES[scale][name], repository).result()
+            result["scale"] = scale
+            results.append(result)
+            print(f"{name:>26} {scale:>6}: {result['seconds']:.2f} s, peak memory {result['peak_memory_mb']:.0f} MB")
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "commit": current_commit(),
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "results": results,
+        }, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    main()
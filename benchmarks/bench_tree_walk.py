@@ -0,0 +1,68 @@
+"""
+Compare the single-pass scandir walker with os.walk and separate stat calls per file, as previously used by the EOS Analyser,
+on a synthetic directory tree with many small files.
+Also measure the cost of collecting the file statistics (file-size histogram and small-file directories) during the walk.
+The results of the walker are checked by tests/test_filesystem.py, this script only measures the run time.
+Run from the repository root: python3 -m benchmarks.bench_tree_walk --directories 500 --files-per-directory 200
+"""
+
+import argparse
+import os
+import pathlib
+import tempfile
+import time
+
+from benchmarks.generators import write_tree
+from helpers.filesystem import FileStatistics, scan_tree
+
+
+def count_with_os_walk(path: str) -> int:
+    return sum(len(files) for _, _, files in os.walk(path))
+
+
+def size_with_os_walk(path: str) -> tuple[int, int]:
+    size = 0
+    number_of_files = 0
+    for dirpath, _, filenames in os.walk(path):
+        number_of_files += len(filenames)
+        for filename in filenames:
+            filepath = os.path.join(dirpath, filename)
+            if not os.path.isfile(filepath):
+                continue
+            if os.path.islink(filepath):
+                size += os.lstat(filepath).st_size
+            else:
+                size += os.path.getsize(filepath)
+    return size, number_of_files
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--directories", type=int, default=500, help="Number of directories in the synthetic tree.")
+    parser.add_argument("--files-per-directory", type=int, default=200, help="Number of files per directory.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_tree(pathlib.Path(tmp), args.directories, args.files_per_directory)
+        _, time_count_walk = timed(count_with_os_walk, tmp)
+        (_, number_scan, _), time_count_scan = timed(scan_tree, tmp, False)
+        _, time_size_walk = timed(size_with_os_walk, tmp)
+        (size_scan, _, directories), time_size_scan = timed(scan_tree, tmp)
+        _, time_statistics = timed(scan_tree, tmp, True, None, FileStatistics())
+
+    print(f"files: {number_scan}, directories: {directories}, bytes: {size_scan}")
+    print(f"count files, os.walk:           {time_count_walk:.2f} s")
+    print(f"count files, scan_tree:         {time_count_scan:.2f} s")
+    print(f"count and size, os.walk + stat: {time_size_walk:.2f} s")
+    print(f"count and size, scan_tree:      {time_size_scan:.2f} s ({time_size_walk/time_size_scan:.1f}x faster)")
+    print(f"with file statistics:           {time_statistics:.2f} s ({(time_statistics/time_size_scan-1)*100:+.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
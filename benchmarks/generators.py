@@ -0,0 +1,267 @@
+"""
+Generators for synthetic input data used by the benchmarks.
+"""
+
+import bz2
+import csv
+import datetime
+import os
+import pathlib
+import random
+import string
+import subprocess
+import sys
+from collections.abc import Iterable, Iterator
+
+from helpers.tagmatcher import literal_from_tag
+
+
+def load_tags() -> dict[str, list[str]]:
+    tags = {}
+    with open("lookup_table.csv") as f:
+        for row in csv.reader(f, delimiter=' '):
+            tags.setdefault(row[0], []).append(row[1])
+    return tags
+
+
+def random_token(rng: random.Random, length: int = 8) -> str:
+    return "".join(rng.choices(string.ascii_letters + string.digits, k=length))
+
+
+def generate_names(tags: dict[str, list[str]], rows: int, hit_rate: float, seed: int = 1) -> list[tuple[str, str]]:
+    '''
+    Generate (scope, name) pairs. A fraction hit_rate of the names contains one of the plain-string tags of its scope.
+    '''
+    rng = random.Random(seed)
+    scopes = list(tags)
+    literals = {scope: [literal_from_tag(tag) for tag in scope_tags if literal_from_tag(tag) is not None] for scope, scope_tags in tags.items()}
+    names = []
+    for _ in range(rows):
+        # most datasets on the group disk are in the group scope
+        scope = scopes[0] if rng.random() < 0.8 else rng.choice(scopes)
+        tokens = [scope, f"mc16_13TeV", str(rng.randint(100000, 999999)), random_token(rng), random_token(rng, 4)]
+        if literals[scope] and rng.random() < hit_rate:
+            tokens.insert(3, rng.choice(literals[scope]))
+            # some datasets match more than one tag
+            if rng.random() < 0.01:
+                tokens.insert(3, rng.choice(literals[scope]))
+        names.append((scope, ".".join(tokens)))
+    return names
+
+
+def write_dump(path: pathlib.Path, rows: int, hit_rate: float, seed: int = 1, stream_bytes: int | None = None) -> None:
+    '''
+    Write a synthetic datasets_per_rse dump in the tab-separated, bz2-compressed format of the rucio-analytix reports.
+    Replicas are created, updated and accessed at random times during the last three years, some timestamps and sizes are missing.
+    If stream_bytes is given, the dump is compressed as independent bz2 streams of stream_bytes uncompressed bytes each,
+    split regardless of line breaks, like pbzip2 does.
+    '''
+    rng = random.Random(seed)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    def timestamp():
+        if rng.random() < 0.05:
+            return ""
+        # half a day away from any whole number of days, such that no replica is within hours of the threshold for old replicas
+        return (now - datetime.timedelta(days=rng.randint(0, 3*365), hours=12)).strftime("%Y-%m-%d %H:%M:%S")
+    def size():
+        return "" if rng.random() < 0.001 else str(rng.randint(1, 10*1024**3))
+    names = generate_names(load_tags(), rows, hit_rate, seed)
+    # a few datasets in scopes which are not in the lookup table
+    names += [("user.unknown", f"user.unknown.{random_token(rng)}") for _ in range(rows // 1000)]
+    lines = (
+        "\t".join(["RSE", scope, name, scope.split(".")[-1], size(), timestamp(), timestamp(), timestamp(), random_token(rng, 32), "OK"]) + "\n"
+        for scope, name in names
+    )
+    write_bz2(path, lines, stream_bytes)
+
+
+def write_bz2(path: pathlib.Path, lines: Iterable[str], stream_bytes: int | None = None, compresslevel: int = 9) -> None:
+    '''
+    Write lines to a bz2-compressed file, as a single stream, or if stream_bytes is given as independent bz2 streams
+    of stream_bytes uncompressed bytes each, split regardless of line breaks, like pbzip2 does.
+    The compression level is the size of the blocks in units of 100 kB.
+    '''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if stream_bytes is None:
+        with bz2.open(path, "wt", compresslevel=compresslevel) as f:
+            f.writelines(lines)
+        return
+    with open(path, "wb") as f:
+        buffer = bytearray()
+        for line in lines:
+            buffer += line.encode()
+            while len(buffer) >= stream_bytes:
+                f.write(bz2.compress(bytes(buffer[:stream_bytes])))
+                del buffer[:stream_bytes]
+        if buffer:
+            f.write(bz2.compress(bytes(buffer)))
+
+
+def write_tree(root: pathlib.Path, directories: int, files_per_directory: int, seed: int = 1) -> None:
+    '''
+    Write a synthetic EOS-like directory tree with many small files, nested up to three levels deep.
+    A few symbolic links to files and directories, and a broken link, are added as well.
+    '''
+    rng = random.Random(seed)
+    paths = [root]
+    for i in range(directories):
+        parent = rng.choice(paths) if len(paths) < 3 or rng.random() < 0.5 else root
+        if len(parent.relative_to(root).parts) >= 3:
+            parent = root
+        path = parent / f"dir{i}"
+        path.mkdir(parents=True)
+        paths.append(path)
+        for j in range(files_per_directory):
+            # mostly small files, with the occasional larger one
+            size = rng.randint(0, 4096) if rng.random() < 0.95 else rng.randint(4096, 1024**2)
+            # sparse files, the content does not matter for the tally
+            with open(path / f"file{j}.root", "wb") as f:
+                f.truncate(size)
+    os.symlink(paths[-1] / "file0.root", root / "link_to_file")
+    os.symlink(paths[-1], root / "link_to_directory")
+    os.symlink(root / "does_not_exist", root / "broken_link")
+
+
+def generate_report(analyses: list[str], rng: random.Random) -> str:
+    '''
+    Generate the content of a subgroup report as written by the EOS Analyser.
+    '''
+    lines = ["Analysis Team,Disk Usage in GB,Number of files,Glance code"]
+    for analysis in analyses:
+        lines.append(f"{analysis},{rng.randint(0, 5000)},{rng.randint(0, 100000)},")
+    lines.append("Total Sum,0,0,")
+    return "\n".join(lines) + "\n"
+
+
+def write_git_history(path: pathlib.Path, subgroups: list[str], analyses: int, days: int, seed: int = 1) -> None:
+    '''
+    Write a git repository with one commit per day for the last days days, updating 'reports/<subgroup>.csv' of each subgroup,
+    like the daily CI pipeline does. The commits are written with a single 'git fast-import' call.
+    '''
+    rng = random.Random(seed)
+    names = {subgroup: [f"{subgroup}_{random_token(rng)}" for _ in range(analyses)] for subgroup in subgroups}
+    now = datetime.datetime.now(datetime.timezone.utc)
+    stream = []
+    for i, days_ago in enumerate(range(days - 1, -1, -1)):
+        timestamp = int((now - datetime.timedelta(days=days_ago)).timestamp())
+        message = f"update subgroup data ({i})"
+        stream.append(f"commit refs/heads/main\ncommitter Benchmark <benchmark@example.com> {timestamp} +0000\ndata {len(message)}\n{message}\n")
+        for subgroup in subgroups:
+            report = generate_report(names[subgroup], rng)
+            stream.append(f"M 644 inline reports/{subgroup}.csv\ndata {len(report.encode())}\n{report}\n")
+    path.mkdir(parents=True, exist_ok=True)
+    subprocess.run(["git", "init", "--quiet", "--initial-branch=main"], cwd=path, check=True)
+    subprocess.run(["git", "fast-import", "--quiet"], cwd=path, input="".join(stream).encode(), check=True)
+    subprocess.run(["git", "checkout", "--quiet", "main"], cwd=path, check=True)
+
+
+def generate_subgroup_information(subgroups: list[str], analyses: int, seed: int = 1) -> dict:
+    '''
+    Generate per-analysis data of today and of one week ago, in the format returned by helpers.history.get_histories.
+    Some analyses did not exist one week ago.
+    '''
+    rng = random.Random(seed)
+    today = datetime.datetime.now()
+    dates = [today.strftime("%Y-%m-%d"), (today - datetime.timedelta(6)).strftime("%Y-%m-%d")]
+    subgroup_information = {}
+    for subgroup in subgroups:
+        analysis_data = {}
+        for _ in range(analyses):
+            # disk usage in kB, up to 10 TB
+            data = {date: {"size": rng.randint(0, 10*1024**3), "number_of_files": rng.randint(0, 100000)} for date in dates}
+            if rng.random() < 0.1:
+                del data[dates[1]]
+            analysis_data[f"{subgroup}_{random_token(rng)}"] = data
+        subgroup_information[subgroup] = analysis_data
+    return subgroup_information
+
+
+def generate_find_listing(top: str, analyses: int, files_per_analysis: int, seed: int = 1) -> Iterator[str]:
+    '''
+    Generate the output of 'eos find -f --size --mtime <top>' for a subgroup folder with analysis folders 'ana0', 'ana1', ...,
+    one line at a time, such that listings of any length can be generated without holding them in memory.
+    Files are spread over nested directories, some paths contain spaces and only some paths are quoted, like in real listings.
+    '''
+    rng = random.Random(seed)
+    top = top.rstrip("/")
+    for i in range(analyses):
+        for j in range(files_per_analysis):
+            directory = f"{top}/ana{i}/dir{j % 7}/sub{j % 3}" if j % 5 else f"{top}/ana{i}"
+            name = f"file {j}.root" if j % 11 == 0 else f"file{j}.root"
+            path = f'"{directory}/{name}"' if j % 2 else f"{directory}/{name}"
+            size = rng.randint(0, 4096) if rng.random() < 0.95 else rng.randint(4096, 1024**3)
+            yield f"path={path} size={size} mtime={1700000000 + rng.randint(0, 10**7)}.{rng.randint(0, 999999999):09d}\n"
+
+
+def write_fake_eos(path: pathlib.Path, analyses: int, files_per_analysis: int, seed: int = 1) -> None:
+    '''
+    Write an executable 'eos' to path, which streams the listing of generate_find_listing for 'eos find -f --size --mtime <top>'
+    and fails for any other command, such that the EOS Analyser falls back to checking the analysis folders separately.
+    '''
+    repository = pathlib.Path(__file__).resolve().parent.parent
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"""#!{sys.executable}
+import sys
+sys.path.insert(0, {str(repository)!r})
+from benchmarks.generators import generate_find_listing
+if sys.argv[1:5] != ["find", "-f", "--size", "--mtime"]:
+    sys.exit(f"unsupported command {{' '.join(sys.argv[1:])}}")
+sys.stdout.writelines(generate_find_listing(sys.argv[5], {analyses}, {files_per_analysis}, {seed}))
+""")
+    path.chmod(0o755)
+
+
+def write_duplicate_tree(root: pathlib.Path, analyses: int, files_per_analysis: int, file_size: int, partial_size: int, seed: int = 1) -> list[set[str]]:
+    '''
+    Write analysis folders 'ana0', 'ana1', ... with files of random content, of which some are copied within and across the folders.
+    Files of the same size with different content are added as well, some of which only differ between their first and last
+    partial_size bytes, such that they are only told apart by hashing them completely. Symbolic links to files are not duplicates.
+    Return:
+        list of the groups of paths (relative to root) of files with identical content
+    '''
+    rng = random.Random(seed)
+    originals = []
+    for i in range(analyses):
+        directory = root / f"ana{i}" / "ntuples"
+        directory.mkdir(parents=True)
+        for j in range(files_per_analysis):
+            # most files share their size with others, a few have a size of their own
+            size = file_size if rng.random() < 0.8 else rng.randint(file_size // 2, file_size)
+            content = rng.randbytes(size)
+            path = directory / f"file{j}.root"
+            path.write_bytes(content)
+            originals.append((path, content))
+            if rng.random() < 0.2 and size > 2 * partial_size:
+                # same size, start and end, but different content in between
+                middle = size // 2
+                (directory / f"decoy{j}.root").write_bytes(content[:middle] + bytes([content[middle] ^ 1]) + content[middle+1:])
+    groups = []
+    for k, (path, content) in enumerate(rng.sample(originals, len(originals) // 5)):
+        copies = {str(path.relative_to(root))}
+        for n in range(rng.randint(1, 3)):
+            directory = root / f"ana{rng.randrange(analyses)}" / "copies"
+            directory.mkdir(exist_ok=True)
+            copy = directory / f"copy{k}_{n}.root"
+            copy.write_bytes(content)
+            copies.add(str(copy.relative_to(root)))
+        groups.append(copies)
+    os.symlink(originals[0][0], root / "ana0" / "link_to_file.root")
+    return groups
+
+
+def write_replaying_eos(path: pathlib.Path, outputs: dict[tuple[str, ...], pathlib.Path]) -> None:
+    '''
+    Write an executable 'eos' to path, which prints the content of the given files as output of the given commands
+    (without the leading 'eos') and fails for any other command.
+    '''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"""#!{sys.executable}
+import sys
+outputs = {{{", ".join(f"{tuple(command)!r}: {str(output.resolve())!r}" for command, output in outputs.items())}}}
+output = outputs.get(tuple(sys.argv[1:]))
+if output is None:
+    sys.exit(f"no output for command {{' '.join(sys.argv[1:])}}")
+with open(output) as f:
+    sys.stdout.write(f.read())
+""")
+    path.chmod(0o755)
@@ -0,0 +1,38 @@
+import argparse
+
+from helpers.constants import SUBGROUPS
+from helpers.sizeindex import INDEX_FILE, find_node, load_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the largest directories below a directory, using the size index written by 'eos.py --size-index' instead of EOS.")
+    parser.add_argument("subgroup", choices=SUBGROUPS, help="Subgroup of the analysis folder.")
+    parser.add_argument("path", nargs="?", default="", help="Directory relative to the subgroup folder, starting with the analysis folder. All analysis folders if not given.")
+    parser.add_argument("--top", type=int, default=10, help="Number of directories to list.")
+    parser.add_argument("--sort", choices=["size", "files"], default="size", help="List the directories with the most disk space or with the most files.")
+    args = parser.parse_args()
+
+    index_file = INDEX_FILE.format(subgroup=args.subgroup)
+    try:
+        index = load_index(index_file)
+    except FileNotFoundError:
+        parser.error(f"{index_file} not found, run 'eos.py --size-index' first.")
+    try:
+        node = find_node(index, args.path) if args.path.strip("/") else {"size": 0, "files": 0, "children": index["analyses"]}
+    except KeyError as e:
+        parser.error(e.args[0])
+
+    children = sorted(node.get("children", {}).items(), key=lambda child: child[1][args.sort], reverse=True)
+    if not children:
+        print(f"{args.path} has no sub-directories in the index (depth {index['depth']}).")
+        return
+    width = max(len(name) for name, _ in children[:args.top])
+    print(f"{'Directory':<{width}}  {'Disk Usage in GB':>16}  {'Number of files':>15}")
+    for name, child in children[:args.top]:
+        size = float(f"{child['size']/1024.**3:.5g}")
+        print(f"{name:<{width}}  {size:>16g}  {child['files']:>15}")
+    if len(children) > args.top:
+        print(f"... and {len(children)-args.top} more.")
+
+if __name__ == "__main__":
+    main()
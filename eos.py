@@ -1,29 +1,63 @@
 import argparse
+import sys
 
-from analysers.eosanalyser import EOSAnalyser
+from analysers.eosanalyser import DEFAULT_WORKERS, DEFAULT_WORKERS_PER_SUBGROUP, ENGINES, EOSAnalyser
+from helpers import metrics
+from helpers.checkpoint import DEFAULT_CHECKPOINT_DIRECTORY, DEFAULT_CHECKPOINT_WINDOW, Checkpoint
+from helpers.eosinterface import DEFAULT_ATTEMPTS, DEFAULT_TIMEOUT
 from helpers.constants import SUBGROUPS
+from helpers.dedup import DEFAULT_HASH_WORKERS, MIN_DUPLICATE_SIZE
+from helpers.filesystem import ScanCache
+from helpers.history import HistoryStore
 from helpers.logger import log
 from helpers.gitlab import report_missing_glance_code
+from helpers.sizeindex import DEFAULT_INDEX_DEPTH
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-s", "--subgroups", nargs="+", default=SUBGROUPS, help="Specify subgroups to check.")
     parser.add_argument("--report-in-gitlab", action="store_true", help="Automatically report findings (missing information, ...) in Gitlab issue.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Maximum number of analysis folders checked at the same time.")
+    parser.add_argument("--workers-per-subgroup", type=int, default=DEFAULT_WORKERS_PER_SUBGROUP, help="Maximum number of analysis folders of one subgroup checked at the same time.")
+    parser.add_argument("--scan-cache", default="cache/eos_scan_cache.json", help="File in which the contents of unchanged directories are cached between runs.")
+    parser.add_argument("--eos-timeout", type=float, default=DEFAULT_TIMEOUT, help="Seconds after which an EOS command is aborted and retried.")
+    parser.add_argument("--eos-attempts", type=int, default=DEFAULT_ATTEMPTS, help="Maximum number of attempts per EOS command.")
+    parser.add_argument("--engine", default="walk", choices=ENGINES, help="Take the disk space from the EOS metadata or 'eos du' and count the files by walking the analysis folders, or list all files of each subgroup with a single 'eos find' call.")
+    parser.add_argument("--file-statistics", action="store_true", help="Write a file-size histogram and the directories with the most small files of each subgroup to reports/<subgroup>.files.csv.")
+    parser.add_argument("--size-index", action="store_true", help="Write the disk space and number of files below each directory of the analysis folders to reports/<subgroup>.index.json, see drilldown.py.")
+    parser.add_argument("--index-depth", type=int, default=DEFAULT_INDEX_DEPTH, help="Number of directory levels below each analysis folder kept in the size index.")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_DIRECTORY, help="Directory in which the result of each analysis is recorded as soon as it is known, to resume a scan which has been killed.")
+    parser.add_argument("--checkpoint-window", type=float, default=DEFAULT_CHECKPOINT_WINDOW, help="Hours within which recorded results are reused instead of checking the analysis again, 0 to check all analyses.")
+    parser.add_argument("--duplicates", action="store_true", help="Also look for files with identical content in the analysis folders of each subgroup and write the disk space they waste to reports/<subgroup>.duplicates.csv.")
+    parser.add_argument("--hash-workers", type=int, default=DEFAULT_HASH_WORKERS, help="Maximum number of files read at the same time when looking for duplicates.")
+    parser.add_argument("--min-duplicate-size", type=int, default=MIN_DUPLICATE_SIZE, help="Smallest file size in bytes checked for duplicates.")
+    parser.add_argument("--full-rescan", action="store_true", help="Ignore the cache and scan all directories again.")
     args = parser.parse_args()
+    if args.engine == "find" and args.file_statistics:
+        parser.error("--file-statistics requires walking the analysis folders, use --engine walk.")
 
     for s in args.subgroups:
         if s not in SUBGROUPS:
             log.warning(f"Subgroup {s} was not found in list of subgroups.")
             args.subgroups.remove(s)
 
-    analyser = EOSAnalyser(directory="/eos/atlas/atlascerngroupdisk/phys-exotics/")
-
-    for subgroup in args.subgroups:
-        analyser.check_subgroup(subgroup)
+    cache = ScanCache(args.scan_cache, full_rescan=args.full_rescan)
+    analyser = EOSAnalyser(directory="/eos/atlas/atlascerngroupdisk/phys-exotics/", workers=args.workers, workers_per_subgroup=args.workers_per_subgroup, cache=cache, history=HistoryStore(), eos_timeout=args.eos_timeout, eos_attempts=args.eos_attempts, file_statistics=args.file_statistics, size_index=args.size_index, index_depth=args.index_depth, engine=args.engine, checkpoint=Checkpoint(args.checkpoint, window=args.checkpoint_window))
+    checked = analyser.check_subgroups(args.subgroups)
+    if args.duplicates:
+        for subgroup in checked:
+            analyser.check_duplicates(subgroup, workers=args.hash_workers, min_size=args.min_duplicate_size)
+    cache.log_statistics()
+    cache.save()
 
     if args.report_in_gitlab:
         report_missing_glance_code(analyser._analyses_without_glance)
+    # the reports of the other subgroups are written nevertheless, but the run is marked as failed
+    failed = [subgroup for subgroup in args.subgroups if subgroup not in checked]
+    if failed:
+        sys.exit(f"Could not check the subgroups {', '.join(failed)}.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with metrics.job("eos"):
+        main()
\ No newline at end of file
@@ -1,19 +1,53 @@
 import argparse
+import sys
+from datetime import datetime, timezone
 
-from analysers.gridspaceanalyser import GridSpaceAnalyser
+from analysers.gridspaceanalyser import DEFAULT_CHUNKSIZE, DEFAULT_TOP, ENGINES, GridSpaceAnalyser, analyse_rses, report_summary
+from helpers import metrics
+from helpers.constants import RSES
+from helpers.history import HistoryStore
 
 
 def main():
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("--rse", default="CERN-PROD_PHYS-EXOTICS", choices=["CERN-PROD_PHYS-EXOTICS", "TOKYO-LCG2_PHYS-EXOTICS"], help="RSE to check")
+    parser.add_argument("--rse", nargs="+", default=["CERN-PROD_PHYS-EXOTICS"], choices=RSES + ["all"], help="RSEs to check, 'all' for all RSEs. Several RSEs are analysed concurrently.")
+    parser.add_argument("--engine", default="columnar", choices=ENGINES, help="Match datasets using vectorised operations on whole columns, or one row at a time.")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Number of datasets read from the dump at once.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes used to decompress and analyse the dump of each RSE.")
+    parser.add_argument("--date", help="Date of the dumps to analyse (YYYY-MM-DD), instead of the latest available ones.")
+    parser.add_argument("--dump", help="Path of the dump to analyse, instead of looking it up in the rucio-analytix reports. Requires a single RSE.")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="Number of largest and of least recently used datasets listed for each analysis in the details report, 0 to skip the report.")
     args = parser.parse_args()
+    if args.date is not None:
+        try:
+            datetime.strptime(args.date, "%Y-%m-%d")
+        except ValueError:
+            parser.error(f"Invalid date {args.date}, expected format YYYY-MM-DD.")
 
-    analyser = GridSpaceAnalyser(rse=args.rse)
-    analyser.load_lookup_table()
-    analyser.analyse_datasets()
-    analyser.report()
+    rses = RSES if "all" in args.rse else list(dict.fromkeys(args.rse))
+    if args.dump is not None and len(rses) > 1:
+        parser.error("--dump can only be used with a single RSE.")
+    # the same reference time for all RSEs, such that the numbers of old datasets can be compared
+    now = datetime.now(timezone.utc)
+    history = HistoryStore()
+    analysers = [
+        GridSpaceAnalyser(rse=rse, engine=args.engine, chunksize=args.chunksize, workers=args.workers, history=history, reference_time=now, date=args.date, dump=args.dump, top=args.top)
+        for rse in rses
+    ]
+    analysers[0].load_lookup_table()
+    for analyser in analysers[1:]:
+        analyser.copy_lookup_table(analysers[0])
+    analysed = analyse_rses(analysers)
+    for analyser in analysed:
+        analyser.report()
+    if len(analysed) > 1:
+        report_summary(analysed)
+    # the reports of the other RSEs are written nevertheless, but the run is marked as failed
+    failed = [analyser._rse for analyser in analysers if analyser not in analysed]
+    if failed:
+        sys.exit(f"Could not analyse the dumps of {', '.join(failed)}.")
 
 if __name__ == "__main__":
-    main()
- 
+    with metrics.job("gridspace"):
+        main()
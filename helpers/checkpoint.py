@@ -0,0 +1,87 @@
+import json
+import pathlib
+import threading
+import time
+
+from helpers import metrics
+from helpers.logger import log
+
+DEFAULT_CHECKPOINT_DIRECTORY = "cache/checkpoints"
+# results older than this (in hours) belong to a previous run and are checked again
+DEFAULT_CHECKPOINT_WINDOW = 12
+
+
+class Checkpoint:
+    '''
+    Append-only record of the analyses checked by the EOS Analyser, with one JSON-lines file per subgroup in self.directory.
+    Each analysis is written as soon as it has been checked, such that a scan killed partway through, e.g. by a transient
+    EOS error, resumes with the remaining analyses instead of starting over. The checkpoint of a subgroup is cleared once
+    its reports have been written. Results are only reused within the run window, results left behind by older runs which
+    did not finish are dropped when the checkpoint of a subgroup is loaded.
+    '''
+
+    def __init__(self, directory: str | pathlib.Path = DEFAULT_CHECKPOINT_DIRECTORY, window: float = DEFAULT_CHECKPOINT_WINDOW):
+        '''
+        Arguments:
+            directory: str|pathlib.Path -> directory holding the checkpoint files
+            window: float -> hours within which results are reused, 0 to check all analyses again
+        '''
+        self.directory = pathlib.Path(directory)
+        self.window = window
+        self._lock = threading.Lock()
+
+    def path(self, subgroup: str) -> pathlib.Path:
+        return self.directory / f"{subgroup}.jsonl"
+
+    def load(self, subgroup: str) -> dict[str, dict]:
+        '''
+        Read the results of a subgroup recorded within the run window, and drop all other results from its checkpoint file.
+        Arguments:
+            subgroup: str -> name of subgroup
+        Return:
+            dictionary with analysis names as keys and the recorded results as values, the latest one if recorded several times
+        '''
+        path = self.path(subgroup)
+        if not path.is_file():
+            return {}
+        now = time.time()
+        results = {}
+        with self._lock:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        result = json.loads(line)
+                    except json.JSONDecodeError:
+                        # last line of a run killed while writing it
+                        continue
+                    if now - result["finished"] <= self.window * 3600:
+                        results[result["analysis"]] = result
+            with open(path, "w") as f:
+                f.writelines(json.dumps(result, separators=(",", ":")) + "\n" for result in results.values())
+        if results:
+            log.info(f"Resuming subgroup {subgroup} with {len(results)} analyses from {path}.")
+        metrics.count("checkpoint_hits", len(results))
+        return results
+
+    def record(self, subgroup: str, analysis: str, result: dict) -> None:
+        '''
+        Append the result of an analysis to the checkpoint file of its subgroup.
+        Arguments:
+            subgroup: str -> name of subgroup
+            analysis: str -> name of the analysis folder
+            result: dict -> JSON-serialisable result, e.g. disk space and number of files
+        '''
+        line = json.dumps({"analysis": analysis, "finished": time.time(), **result}, separators=(",", ":")) + "\n"
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.path(subgroup), "a") as f:
+                f.write(line)
+
+    def clear(self, subgroup: str) -> None:
+        '''
+        Remove the checkpoint file of a subgroup, once the scan of the subgroup has been completed.
+        Arguments:
+            subgroup: str -> name of subgroup
+        '''
+        with self._lock:
+            self.path(subgroup).unlink(missing_ok=True)
@@ -0,0 +1,178 @@
+import hashlib
+import os
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers import metrics
+from helpers.logger import log
+
+# number of bytes hashed at the start and at the end of each candidate
+PARTIAL_HASH_SIZE = 4 * 1024**2
+# number of files read at the same time, to not overload the EOS FUSE mount
+DEFAULT_HASH_WORKERS = 4
+# smaller files are not checked, as they hardly free any disk space
+MIN_DUPLICATE_SIZE = 1024**2
+HASH_BLOCK_SIZE = 1024**2
+
+
+def hash_partial(path: str, size: int, partial_size: int = PARTIAL_HASH_SIZE) -> str:
+    '''
+    Hash the first and the last partial_size bytes of a file with ranged reads, the whole file if it is not larger than both.
+    Arguments:
+        path: str -> file to hash
+        size: int -> size of the file in bytes
+        partial_size: int -> number of bytes to hash at the start and at the end
+    Return:
+        hex digest
+    '''
+    digest = hashlib.blake2b()
+    # buffered reads return the requested number of bytes unless the end of the file is reached, unlike a single os.pread
+    with open(path, "rb") as f:
+        if size <= 2 * partial_size:
+            digest.update(f.read(size))
+        else:
+            digest.update(f.read(partial_size))
+            f.seek(size - partial_size)
+            digest.update(f.read(partial_size))
+    metrics.count("bytes_hashed", min(size, 2 * partial_size))
+    return digest.hexdigest()
+
+
+def hash_full(path: str) -> str:
+    '''
+    Hash the whole content of a file, reading it block by block.
+    '''
+    digest = hashlib.blake2b()
+    with open(path, "rb") as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+            metrics.count("bytes_hashed", len(block))
+    return digest.hexdigest()
+
+
+def drop_hard_links(groups: list[list[tuple[str, str]]], executor: ThreadPoolExecutor) -> list[list[tuple[str, str]]]:
+    '''
+    Keep only the first path of each file (device and inode) in groups of candidates, as hard links to the same file
+    do not take up disk space more than once. Only the groups of at least two files are kept, files which cannot be stat'ed are dropped.
+    Arguments:
+        groups: list[list[tuple[str, str]]] -> groups of analysis names and paths of files
+        executor: ThreadPoolExecutor -> pool stat'ing the files
+    Return:
+        list of groups of analysis names and paths of distinct files
+    '''
+    def safe_inode(path: str) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(path, follow_symlinks=False)
+        except OSError as e:
+            log.debug(f"Could not stat {path}, skipping it: {e}")
+            metrics.count("unreadable_files")
+            return None
+        return stat.st_dev, stat.st_ino
+    inodes = executor.map(safe_inode, [path for group in groups for _, path in group])
+    distinct = []
+    for group in groups:
+        by_inode = {}
+        # the inodes are returned in the order of the candidates
+        for candidate in group:
+            inode = next(inodes)
+            if inode is None:
+                continue
+            if inode in by_inode:
+                metrics.count("hard_links")
+                continue
+            by_inode[inode] = candidate
+        if len(by_inode) > 1:
+            distinct.append(list(by_inode.values()))
+    return distinct
+
+
+def split_groups(groups: list[list[tuple[str, str]]], hasher: Callable[[str], str], executor: ThreadPoolExecutor) -> list[list[tuple[str, str]]]:
+    '''
+    Split groups of candidates by the hash of their files, keeping only the groups of at least two files with the same hash.
+    Files which cannot be read are dropped.
+    Arguments:
+        groups: list[list[tuple[str, str]]] -> groups of analysis names and paths of files
+        hasher: Callable[[str], str] -> function hashing the file at a given path
+        executor: ThreadPoolExecutor -> pool reading the files
+    Return:
+        list of groups of analysis names and paths of files with the same hash
+    '''
+    def safe_hash(path: str) -> str | None:
+        try:
+            return hasher(path)
+        except OSError as e:
+            log.debug(f"Could not read {path}, skipping it: {e}")
+            metrics.count("unreadable_files")
+            return None
+    candidates = [candidate for group in groups for candidate in group]
+    hashes = executor.map(safe_hash, [path for _, path in candidates])
+    split = []
+    for group in groups:
+        by_hash = {}
+        # the hashes are returned in the order of the candidates
+        for candidate in group:
+            digest = next(hashes)
+            if digest is not None:
+                by_hash.setdefault(digest, []).append(candidate)
+        split.extend(files for files in by_hash.values() if len(files) > 1)
+    return split
+
+
+def find_duplicates(files: Iterable[tuple[str, str, int]], workers: int = DEFAULT_HASH_WORKERS, partial_size: int = PARTIAL_HASH_SIZE) -> list[tuple[int, list[tuple[str, str]]]]:
+    '''
+    Find files with identical content, without hashing the whole content of every file:
+    files are grouped by their exact size first, then candidates of the same size by the hash of their first and last
+    partial_size bytes, and only files which still collide are hashed completely.
+    Hard links to the same file are counted once, as the first of their paths.
+    Arguments:
+        files: Iterable[tuple[str, str, int]] -> analysis name, path and size in bytes of each file
+        workers: int -> maximum number of files read at the same time
+        partial_size: int -> number of bytes hashed at the start and at the end of each candidate
+    Return:
+        list of tuples of file size in bytes and the analysis names and paths of files with identical content, largest files first
+    '''
+    by_size: dict[int, list[tuple[str, str]]] = {}
+    for analysis, path, size in files:
+        by_size.setdefault(size, []).append((analysis, path))
+    sizes = {}
+    groups = []
+    for size, group in by_size.items():
+        if len(group) > 1:
+            groups.append(group)
+            for _, path in group:
+                sizes[path] = size
+    del by_size
+    log.info(f"Found {len(sizes)} files in {len(groups)} groups of the same size.")
+    metrics.count("duplicate_candidates", len(sizes))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash") as executor:
+        groups = drop_hard_links(groups, executor)
+        with metrics.span("hash_partial"):
+            groups = split_groups(groups, lambda path: hash_partial(path, sizes[path], partial_size), executor)
+        # the partial hash covers the whole content of small files
+        complete = [group for group in groups if sizes[group[0][1]] <= 2 * partial_size]
+        collisions = [group for group in groups if sizes[group[0][1]] > 2 * partial_size]
+        log.info(f"{sum(len(group) for group in collisions)} files of more than {2*partial_size} bytes still collide after hashing their first and last {partial_size} bytes, hashing them completely.")
+        with metrics.span("hash_full"):
+            complete += split_groups(collisions, hash_full, executor)
+    return sorted(((sizes[group[0][1]], sorted(group)) for group in complete), key=lambda duplicate: (-duplicate[0], duplicate[1]))
+
+
+def reclaimable_per_pair(duplicates: list[tuple[int, list[tuple[str, str]]]]) -> dict[tuple[str, str], list[int]]:
+    '''
+    Attribute the disk space which can be freed by removing duplicates to pairs of analyses.
+    Of each group of identical files, the first one is kept, and each other copy frees its size for the pair of the analysis
+    of the kept file and the analysis of the copy, which is the same analysis for copies within one analysis folder.
+    Arguments:
+        duplicates: list[tuple[int, list[tuple[str, str]]]] -> groups of identical files as returned by find_duplicates
+    Return:
+        dictionary with pairs of analysis names as keys and the number of removable copies and the disk space they use in bytes as values
+    '''
+    pairs = {}
+    for size, group in duplicates:
+        kept, _ = group[0]
+        for analysis, _ in group[1:]:
+            counts = pairs.setdefault(tuple(sorted((kept, analysis))), [0, 0])
+            counts[0] += 1
+            counts[1] += size
+    return pairs
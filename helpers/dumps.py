@@ -0,0 +1,225 @@
+import bz2
+import mmap
+import pathlib
+from collections.abc import Iterator
+
+from helpers import metrics
+
+# every bz2 stream starts with 'BZh', the block size ('1'-'9') and the magic number of its first block, 0x314159265359
+BZ2_BLOCK_MAGIC = b"1AY&SY"
+READ_SIZE = 1024 * 1024
+# within a stream, blocks are not aligned to bytes, but still start with the 48-bit magic number, and the stream ends with
+# the 48-bit magic number 0x177245385090, the 32-bit CRC of the stream and up to 7 bits of padding
+BZ2_BLOCK_MAGIC_BITS = 0x314159265359
+BZ2_END_MAGIC_BITS = 0x177245385090
+# upper bound of the size of a compressed block: at most 900k symbols of at most 20 bits each, plus the coding tables
+MAX_BLOCK_BYTES = 3 * 1024 * 1024
+
+
+def find_bz2_streams(path: pathlib.Path) -> list[int]:
+    '''
+    Find the offsets of all bz2 streams in a file.
+    Files compressed with parallel tools like pbzip2 or lbzip2 consist of many independent streams,
+    which can be decompressed separately. Files compressed with bzip2 consist of a single stream.
+    Arguments:
+        path: pathlib.Path -> bz2 file to inspect
+    Return:
+        sorted list of byte offsets at which a bz2 stream starts
+    '''
+    offsets = []
+    with open(path, "rb") as f:
+        if path.stat().st_size == 0:
+            return offsets
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            position = mm.find(BZ2_BLOCK_MAGIC)
+            while position != -1:
+                start = position - 4
+                if start >= 0 and mm[start:start+3] == b"BZh" and mm[start+3:start+4] in b"123456789":
+                    offsets.append(start)
+                position = mm.find(BZ2_BLOCK_MAGIC, position + 1)
+    return offsets
+
+
+def find_bz2_end(mm: mmap.mmap) -> int | None:
+    '''
+    Find the end-of-stream marker at the end of a bz2 file.
+    Arguments:
+        mm: mmap.mmap -> contents of the file
+    Return:
+        bit offset of the end-of-stream marker, None if the file does not end with one
+    '''
+    # 4 bytes of header and 10 bytes of end-of-stream marker and CRC
+    if len(mm) < 14:
+        return None
+    tail = int.from_bytes(mm[-11:], "big")
+    for padding in range(8):
+        if (tail >> (32 + padding)) & (2**48 - 1) == BZ2_END_MAGIC_BITS:
+            return 8 * len(mm) - 80 - padding
+    return None
+
+
+def find_bz2_blocks(path: pathlib.Path) -> list[int]:
+    '''
+    Find the blocks of a bz2 file consisting of a single stream, like bzip2recover does.
+    The magic number of the blocks is searched at each of the 8 bit alignments. It may also occur by chance inside
+    the compressed data, so the offsets found are only candidates, see iter_decompressed_blocks.
+    Arguments:
+        path: pathlib.Path -> bz2 file to inspect
+    Return:
+        sorted bit offsets of the candidate blocks, followed by the bit offset of the end-of-stream marker
+    Raises:
+        EOFError if the file does not end with an end-of-stream marker, e.g. for a truncated file, like bz2.open does
+    '''
+    offsets = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        end = find_bz2_end(mm)
+        if end is None:
+            raise EOFError(f"{path} ended before the end-of-stream marker was reached.")
+        for shift in range(8):
+            # magic number starting 'shift' bits into a byte, followed by zero bits up to the next byte
+            n_bytes = (48 + shift + 7) // 8
+            window = (BZ2_BLOCK_MAGIC_BITS << (8 * n_bytes - 48 - shift)).to_bytes(n_bytes, "big")
+            # only the bytes covered completely by the magic number are searched for, the partial ones are compared afterwards
+            inner = window[1:-1] if shift else window
+            first_mask = 0xff >> shift
+            last_mask = (0xff << (8 * n_bytes - 48 - shift)) & 0xff
+            position = mm.find(inner)
+            while position != -1:
+                start = position - 1 if shift else position
+                if not shift or (start >= 0 and start + n_bytes <= len(mm)
+                                 and mm[start] & first_mask == window[0] and mm[start + n_bytes - 1] & last_mask == window[-1]):
+                    offset = 8 * start + shift
+                    # the stream header takes 4 bytes
+                    if 32 <= offset < end:
+                        offsets.append(offset)
+                position = mm.find(inner, position + 1)
+    return sorted(offsets) + [end]
+
+
+def decompress_bz2_block(mm: mmap.mmap, start: int, end: int) -> bytes:
+    '''
+    Decompress one block of a bz2 stream, by turning it into a stream of its own: the header of the file, the block,
+    the end-of-stream marker and the CRC of the block as CRC of the stream.
+    Arguments:
+        mm: mmap.mmap -> contents of the bz2 file
+        start: int -> bit offset of the block
+        end: int -> bit offset after the block
+    Return:
+        decompressed data of the block
+    Raises:
+        OSError or ValueError if the bits are not a complete block, e.g. if its CRC does not match
+    '''
+    first_byte = start // 8
+    last_byte = (end + 7) // 8
+    n_bits = end - start
+    block = (int.from_bytes(mm[first_byte:last_byte], "big") >> (8 * last_byte - end)) & ((1 << n_bits) - 1)
+    # the CRC of the block follows its magic number
+    crc = (block >> (n_bits - 80)) & 0xffffffff
+    padding = -(n_bits + 112) % 8
+    stream = ((int.from_bytes(mm[:4], "big") << n_bits | block) << 80 | BZ2_END_MAGIC_BITS << 32 | crc) << padding
+    return bz2.decompress(stream.to_bytes((n_bits + 112 + padding) // 8, "big"))
+
+
+def iter_decompressed_blocks(path: pathlib.Path, boundaries: list[int], first: int, last: int) -> Iterator[tuple[int, int, bytes]]:
+    '''
+    Decompress the blocks of a single-stream bz2 file which start at the candidates boundaries[first:last].
+    A candidate inside a block is detected because the block ending there cannot be decompressed, in which case
+    the block is extended to the next candidate, possibly beyond boundaries[last]. Leading candidates from which no block
+    can be decompressed are skipped, as they belong to the last block of the previous range; the caller has to check that
+    the ranges join up.
+    Arguments:
+        path: pathlib.Path -> bz2 file to read
+        boundaries: list[int] -> candidate blocks and end-of-stream marker, as returned by find_bz2_blocks
+        first: int -> index of the first candidate of the range
+        last: int -> index after the last candidate of the range
+    Return:
+        iterator over the index of the candidate at which a block starts, the one at which it ends, and its decompressed data
+    Raises:
+        OSError if a block of the range, other than the skipped ones, cannot be decompressed
+    '''
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        started = False
+        i = first
+        while i < last:
+            data = None
+            for k in range(i + 1, len(boundaries)):
+                if boundaries[k] - boundaries[i] > 8 * MAX_BLOCK_BYTES:
+                    break
+                try:
+                    with metrics.span("decompress"):
+                        data = decompress_bz2_block(mm, boundaries[i], boundaries[k])
+                    break
+                except (OSError, ValueError, EOFError):
+                    continue
+            if data is None:
+                if started:
+                    raise OSError(f"Invalid bz2 block at bit {boundaries[i]} of {path}.")
+                i += 1
+                continue
+            metrics.count("dump_bytes_read", (boundaries[k] - boundaries[i]) // 8)
+            started = True
+            yield i, k, data
+            i = k
+
+
+def iter_decompressed(path: pathlib.Path, start: int = 0, end: int | None = None) -> Iterator[bytes]:
+    '''
+    Decompress the bz2 streams stored between two byte offsets of a file.
+    Arguments:
+        path: pathlib.Path -> bz2 file to read
+        start: int -> offset of the first stream to decompress
+        end: int|None -> offset after the last stream to decompress, None to read until the end of the file
+    Return:
+        iterator over pieces of decompressed data
+    Raises:
+        EOFError if the last stream is incomplete, e.g. for a truncated file, like bz2.open does
+    '''
+    decompressor = bz2.BZ2Decompressor()
+    # whether the current decompressor has been fed any data
+    started = False
+    with open(path, "rb") as f:
+        f.seek(start)
+        position = start
+        while end is None or position < end:
+            data = f.read(READ_SIZE if end is None else min(READ_SIZE, end - position))
+            if not data:
+                break
+            position += len(data)
+            metrics.count("dump_bytes_read", len(data))
+            while data:
+                started = True
+                with metrics.span("decompress"):
+                    decompressed = decompressor.decompress(data)
+                if decompressed:
+                    yield decompressed
+                if not decompressor.eof:
+                    break
+                # the next stream starts right after the end of the current one
+                data = decompressor.unused_data
+                decompressor = bz2.BZ2Decompressor()
+                started = False
+    if started:
+        raise EOFError(f"{path} ended before the end-of-stream marker was reached.")
+
+
+def iter_line_blocks(pieces: Iterator[bytes], block_size: int) -> Iterator[bytes]:
+    '''
+    Regroup pieces of data into blocks of at least block_size bytes that end at a line break.
+    Arguments:
+        pieces: Iterator[bytes] -> data to regroup
+        block_size: int -> minimum size of a block in bytes, only the last block may be smaller
+    Return:
+        iterator over blocks of complete lines
+    '''
+    buffer = bytearray()
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) < block_size:
+            continue
+        end = buffer.rfind(b"\n") + 1
+        if end == 0:
+            continue
+        yield bytes(buffer[:end])
+        del buffer[:end]
+    if buffer:
+        yield bytes(buffer)
@@ -1,20 +1,99 @@
+import errno
+import os
 import pathlib
+import posixpath
+import random
+import re
+import signal
 import subprocess
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
 
-def eos_du(path: pathlib.Path) -> int:
-    cmd = ["eos", "du", "-s", path]
+from helpers import metrics
+from helpers.logger import log
+
+# seconds after which an EOS command is aborted
+DEFAULT_TIMEOUT = 300
+# number of attempts per EOS command, with exponentially increasing waiting time in between
+DEFAULT_ATTEMPTS = 3
+DEFAULT_BACKOFF = 2.0
+# maximum number of paths passed to a single 'eos du' call
+DU_BATCH_SIZE = 50
+# errno values of failures which may go away when the command is repeated, e.g. while the MGM is overloaded or restarting;
+# other failures, like a missing directory or missing permissions, are reported at once
+TRANSIENT_ERRNOS = {errno.EAGAIN, errno.EBUSY, errno.EIO, errno.ETIMEDOUT, errno.ECONNREFUSED, errno.ECONNRESET, errno.ENETUNREACH, errno.EHOSTUNREACH, errno.ENOTCONN}
+# error code in the error messages of the EOS command line tool, e.g. 'error: ... (errc=2) (No such file or directory)'
+ERROR_CODE = re.compile(r"errc=(\d+)")
+# one line of 'eos find -f --size --mtime', e.g. 'path="/eos/.../file.root" size=123 mtime=1700000000.123456789',
+# the path may contain spaces and is not always quoted
+FIND_LINE = re.compile(r'path="?(?P<path>.*?)"? size=(?P<size>\d+) mtime=(?P<mtime>\d+(?:\.\d+)?)\s*$')
+# one line of 'eos find -d --format path,treesize,treefiles', e.g. 'path="/eos/.../analysis/" treesize=123 treefiles=4'
+TREE_INFO_LINE = re.compile(r'path="?(?P<path>.*?)"? treesize=(?P<treesize>\d+) treefiles=(?P<treefiles>\d+)\s*$')
+
+
+def is_transient(returncode: int, stderr: str) -> bool:
+    '''
+    Decide whether a failed EOS command is worth retrying, from the error code in its error message if given,
+    otherwise from its exit code, which the EOS command line tool sets to the errno of the failure, or its error message.
+    Arguments:
+        returncode: int -> exit code of the command
+        stderr: str -> error output of the command
+    Return:
+        whether the failure is one of TRANSIENT_ERRNOS
+    '''
+    match = ERROR_CODE.search(stderr)
+    if match is not None:
+        return int(match[1]) in TRANSIENT_ERRNOS
+    return returncode in TRANSIENT_ERRNOS or any(os.strerror(code) in stderr for code in TRANSIENT_ERRNOS)
 
-    try:
-        result = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    text=True,
-                    check=True
-                )
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"EOS command {' '.join(cmd)} failed: {e.stderr.strip()}")
 
-    output = result.stdout.strip()
+def run_eos(cmd: list[str], timeout: float = DEFAULT_TIMEOUT, attempts: int = DEFAULT_ATTEMPTS, backoff: float = DEFAULT_BACKOFF) -> str:
+    '''
+    Run an EOS command, retrying with jittered exponential backoff if it does not finish within the timeout
+    or fails with a transient error, see is_transient. Other failures are not retried.
+    Arguments:
+        cmd: list[str] -> command to run, starting with 'eos'
+        timeout: float -> seconds after which an attempt is aborted
+        attempts: int -> maximum number of attempts
+        backoff: float -> seconds to wait before the second attempt, doubled for each further attempt
+    Return:
+        output of the command
+    '''
+    cmd = [str(c) for c in cmd]
+    for attempt in range(attempts):
+        try:
+            with metrics.span(f"eos_{cmd[1]}"):
+                result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=timeout)
+            return result.stdout
+        except FileNotFoundError:
+            raise RuntimeError(f"EOS command {' '.join(cmd)} failed: eos executable not found")
+        except subprocess.TimeoutExpired:
+            error = f"no response within {timeout} s"
+        except subprocess.CalledProcessError as e:
+            error = e.stderr.strip()
+            if not is_transient(e.returncode, e.stderr):
+                raise RuntimeError(f"EOS command {' '.join(cmd)} failed: {error}")
+        if attempt + 1 == attempts:
+            raise RuntimeError(f"EOS command {' '.join(cmd)} failed: {error}")
+        delay = backoff * 2**attempt * random.uniform(0.5, 1.5)
+        log.debug(f"EOS command {' '.join(cmd)} failed ({error}), retrying in {delay:.1f} s.")
+        metrics.count("eos_retries")
+        time.sleep(delay)
+
+
+def eos_du(path: pathlib.Path, timeout: float = DEFAULT_TIMEOUT, attempts: int = DEFAULT_ATTEMPTS) -> int:
+    '''
+    Retrieve the disk space used by a directory with 'eos du -s'.
+    Arguments:
+        path: pathlib.Path -> directory to check
+        timeout: float -> seconds after which an attempt is aborted
+        attempts: int -> maximum number of attempts
+    Return:
+        disk space in bytes
+    '''
+    output = run_eos(["eos", "du", "-s", path], timeout=timeout, attempts=attempts).strip()
 
     try:
         size = int(output.split()[0])
@@ -22,4 +101,178 @@ def eos_du(path: pathlib.Path) -> int:
         raise ValueError(f"Could not parse eos du output {output}")
 
     return size
-    
+
+
+def eos_du_batch(paths: list[str], timeout: float = DEFAULT_TIMEOUT, attempts: int = DEFAULT_ATTEMPTS, batch_size: int = DU_BATCH_SIZE) -> dict[str, int]:
+    '''
+    Retrieve the disk space used by several directories, passing up to batch_size paths to each 'eos du -s' call,
+    such that only one process is spawned and one round-trip to the MGM is needed per batch.
+    The output of a batch has to hold one line with the size and the path of each directory, like for 'du -s'.
+    If a batch fails or its output does not list every path exactly like that, the disk space of its directories
+    and of all remaining ones is retrieved with one call per path instead, see eos_du.
+    Arguments:
+        paths: list[str] -> directories to check
+        timeout: float -> seconds after which an attempt is aborted, per call
+        attempts: int -> maximum number of attempts per call
+        batch_size: int -> maximum number of paths per call
+    Return:
+        dictionary with the given paths as keys and the disk space in bytes as values,
+        without the paths whose disk space could not be retrieved
+    '''
+    sizes = {}
+    batched = batch_size > 1
+    for i in range(0, len(paths), batch_size):
+        batch = paths[i:i+batch_size]
+        if batched and len(batch) > 1:
+            try:
+                sizes.update(parse_du_batch(batch, run_eos(["eos", "du", "-s", *batch], timeout=timeout, attempts=attempts)))
+                continue
+            except (RuntimeError, ValueError) as e:
+                log.info(f"Could not get the disk space of {len(batch)} folders with one eos du call, using one call per folder instead: {e}")
+                metrics.count("eos_du_batch_fallbacks")
+                batched = False
+        for path in batch:
+            try:
+                sizes[path] = eos_du(path, timeout=timeout, attempts=attempts)
+            except (RuntimeError, ValueError) as e:
+                log.debug(f"Could not get disk space of {path} from EOS: {e}")
+    return sizes
+
+
+def parse_du_batch(paths: list[str], output: str) -> dict[str, int]:
+    '''
+    Parse the output of 'eos du -s' for several directories.
+    Arguments:
+        paths: list[str] -> directories passed to the command
+        output: str -> output of the command
+    Return:
+        dictionary with the given paths as keys and the disk space in bytes as values
+    Raises:
+        ValueError if a line cannot be parsed, lists an unexpected path or a path twice, or a path is not listed
+    '''
+    requested = {posixpath.normpath(path): path for path in paths}
+    sizes = {}
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        fields = line.split(maxsplit=1)
+        try:
+            size = int(fields[0])
+            path = posixpath.normpath(fields[1].strip())
+        except (IndexError, ValueError):
+            raise ValueError(f"Could not parse eos du output {line}")
+        if path not in requested or requested[path] in sizes:
+            raise ValueError(f"Unexpected path in eos du output {line}")
+        sizes[requested[path]] = size
+    missing = [path for path in paths if path not in sizes]
+    if missing:
+        raise ValueError(f"No eos du output for {', '.join(missing)}")
+    return sizes
+
+
+def eos_tree_info(directory: pathlib.Path, timeout: float = DEFAULT_TIMEOUT, attempts: int = DEFAULT_ATTEMPTS) -> dict[str, tuple[int, int]]:
+    '''
+    Retrieve the recursive size and number of files of every sub-directory of a directory with a single metadata query.
+    EOS keeps these numbers up to date on each directory ('treesize', 'treefiles'), such that no directory has to be walked.
+    Arguments:
+        directory: pathlib.Path -> directory whose sub-directories to list
+        timeout: float -> seconds after which an attempt is aborted
+        attempts: int -> maximum number of attempts
+    Return:
+        dictionary with the names of the sub-directories as keys and tuples of size in bytes and number of files as values
+    '''
+    cmd = ["eos", "find", "-d", "--maxdepth", "1", "--format", "path,treesize,treefiles", str(directory)]
+
+    output = run_eos(cmd, timeout=timeout, attempts=attempts)
+
+    top = posixpath.normpath(str(directory))
+    tree_info = {}
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        # the path may contain spaces, so the line is not simply split into key=value pairs
+        match = TREE_INFO_LINE.match(line)
+        if match is None:
+            raise ValueError(f"Could not parse eos find output {line}")
+        path = posixpath.normpath(match["path"])
+        tree_info_entry = (int(match["treesize"]), int(match["treefiles"]))
+        # the directory itself is listed as well
+        if path == top:
+            continue
+        tree_info[path.rsplit("/", 1)[-1]] = tree_info_entry
+    return tree_info
+
+
+def eos_find_files(directory: pathlib.Path, timeout: float = DEFAULT_TIMEOUT, attempts: int = DEFAULT_ATTEMPTS, backoff: float = DEFAULT_BACKOFF) -> Iterator[tuple[str, int, float]]:
+    '''
+    List all files below a directory with a single 'eos find -f --size --mtime' call, instead of one FUSE round-trip
+    per directory listing and per file.
+    The output is parsed line by line while it arrives, such that the memory usage does not depend on the number of files.
+    As records which have already been yielded cannot be taken back, the call is only retried (with jittered exponential backoff)
+    if it times out or fails with a transient error (see is_transient) before the first file is listed; afterwards, a failure
+    raises a RuntimeError and the listing has to be discarded.
+    Arguments:
+        directory: pathlib.Path -> directory whose files to list
+        timeout: float -> seconds without any output after which an attempt is aborted
+        attempts: int -> maximum number of attempts
+        backoff: float -> seconds to wait before the second attempt, doubled for each further attempt
+    Yield:
+        tuples of path, size in bytes and mtime in seconds of each file
+    '''
+    cmd = ["eos", "find", "-f", "--size", "--mtime", str(directory)]
+    for attempt in range(attempts):
+        listed = 0
+        with metrics.span("eos_find_files"), tempfile.TemporaryFile(mode="w+") as stderr:
+            try:
+                # stderr goes to a file, such that a full pipe cannot block the command while stdout is being read
+                # in a new session, such that the command can be killed together with any child processes holding stdout open
+                process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, text=True, start_new_session=True)
+            except FileNotFoundError:
+                raise RuntimeError(f"EOS command {' '.join(cmd)} failed: eos executable not found")
+            def kill():
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            last_output = time.monotonic()
+            finished = threading.Event()
+            timed_out = threading.Event()
+            def watchdog():
+                while not finished.wait(1):
+                    if time.monotonic() - last_output > timeout:
+                        timed_out.set()
+                        kill()
+                        return
+            threading.Thread(target=watchdog, daemon=True).start()
+            try:
+                for line in process.stdout:
+                    last_output = time.monotonic()
+                    if not line.strip():
+                        continue
+                    match = FIND_LINE.match(line)
+                    if match is None:
+                        kill()
+                        raise ValueError(f"Could not parse eos find output {line.strip()}")
+                    listed += 1
+                    yield match["path"], int(match["size"]), float(match["mtime"])
+                returncode = process.wait()
+            finally:
+                finished.set()
+                if process.poll() is None:
+                    # the consumer stopped early
+                    kill()
+                process.stdout.close()
+                process.wait()
+            metrics.count("eos_files_listed", listed)
+            if returncode == 0 and not timed_out.is_set():
+                return
+            stderr.seek(0)
+            error = f"no output within {timeout} s" if timed_out.is_set() else stderr.read().strip()
+        if listed > 0:
+            raise RuntimeError(f"EOS command {' '.join(cmd)} failed after listing {listed} files: {error}")
+        if attempt + 1 == attempts or not (timed_out.is_set() or is_transient(returncode, error)):
+            raise RuntimeError(f"EOS command {' '.join(cmd)} failed: {error}")
+        delay = backoff * 2**attempt * random.uniform(0.5, 1.5)
+        log.debug(f"EOS command {' '.join(cmd)} failed ({error}), retrying in {delay:.1f} s.")
+        metrics.count("eos_retries")
+        time.sleep(delay)
@@ -0,0 +1,294 @@
+import heapq
+import json
+import os
+import pathlib
+import threading
+from collections.abc import Iterator
+
+from helpers import metrics
+from helpers.logger import log
+from helpers.sizeindex import SizeIndex
+
+# files smaller than this (in bytes) are counted as small files in the file statistics
+SMALL_FILE_SIZE = 1024**2
+# number of directories with the most small files listed in the file statistics
+DEFAULT_TOP_DIRECTORIES = 20
+
+
+class ScanCache:
+    '''
+    Persistent cache of the files directly inside each directory, stored as compact JSON file.
+    An entry is valid as long as the mtime of its directory is unchanged, i.e. no file or sub-directory has been
+    added, removed or renamed. Files modified in place do not change the mtime of their directory,
+    so a full rescan should be done from time to time.
+    '''
+
+    def __init__(self, path: str | pathlib.Path | None = None, full_rescan: bool = False):
+        '''
+        Arguments:
+            path: str|pathlib.Path|None -> JSON file to load the cache from and to save it to, None for an in-memory cache
+            full_rescan: bool -> ignore all cached entries, such that every directory is scanned again
+        '''
+        self._path = pathlib.Path(path) if path is not None else None
+        self._entries: dict[str, dict] = {}
+        self._seen: set[str] = set()
+        self._tops: set[str] = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self._path is not None and self._path.is_file() and not full_rescan:
+            with open(self._path) as f:
+                self._entries = json.load(f)
+            log.info(f"Loaded {len(self._entries)} cached directories from {self._path}.")
+
+    def get(self, directory: str, mtime: int, sizes: bool, histogram: bool = False) -> dict | None:
+        '''
+        Retrieve the cached entry for a directory.
+        Arguments:
+            directory: str -> path of the directory
+            mtime: int -> current mtime of the directory in ns
+            sizes: bool -> whether the entry needs to include the disk space
+            histogram: bool -> whether the entry needs to include the file-size histogram
+        Return:
+            cached entry, None if the directory is not in the cache or has changed since
+        '''
+        with self._lock:
+            self._seen.add(directory)
+            entry = self._entries.get(directory)
+            if entry is None or entry["mtime"] != mtime or (sizes and entry["size"] is None) or (histogram and "histogram" not in entry):
+                self.misses += 1
+                metrics.count("scan_cache_misses")
+                return None
+            self.hits += 1
+            metrics.count("scan_cache_hits")
+            return entry
+
+    def put(self, directory: str, entry: dict) -> None:
+        with self._lock:
+            self._seen.add(directory)
+            self._entries[directory] = entry
+
+    def add_top(self, top: str) -> None:
+        '''
+        Register a directory tree as scanned, such that entries of its directories which no longer exist are dropped on saving.
+        '''
+        with self._lock:
+            self._tops.add(top)
+
+    def log_statistics(self) -> None:
+        total = self.hits + self.misses
+        if total == 0:
+            return
+        log.info(f"Directory cache: {self.hits} hits ({self.hits/total*100:.1f}%), {self.misses} misses ({self.misses/total*100:.1f}%).")
+
+    def save(self) -> None:
+        if self._path is None:
+            return
+        with self._lock:
+            # drop directories in the scanned trees which have not been seen, as they have been removed
+            for directory in [d for d in self._entries if d not in self._seen]:
+                if any(directory == top or directory.startswith(f"{top}/") for top in self._tops):
+                    del self._entries[directory]
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self._path, "w") as f:
+                json.dump(self._entries, f, separators=(",", ":"))
+        log.info(f"Saved {len(self._entries)} cached directories to {self._path}.")
+
+
+class FileStatistics:
+    '''
+    File-size histogram and the directories with the most small files, collected from the directory entries of scan_tree,
+    such that no file has to be stat'ed again. The histogram has log2 buckets: bucket b holds the files with a size
+    in [2**(b-1), 2**b) bytes, bucket 0 the empty ones. Only the self.top directories with the most files smaller
+    than SMALL_FILE_SIZE directly inside them are kept.
+    '''
+
+    def __init__(self, top: int = DEFAULT_TOP_DIRECTORIES):
+        self.top = top
+        # bucket -> [number of files, disk space in bytes]
+        self.histogram: dict[int, list[int]] = {}
+        # min-heap of (number of small files, disk space of small files in bytes, directory)
+        self.small_file_directories: list[tuple[int, int, str]] = []
+
+    def add_bucket(self, bucket: int, number_of_files: int, size: int) -> None:
+        counts = self.histogram.setdefault(bucket, [0, 0])
+        counts[0] += number_of_files
+        counts[1] += size
+
+    def add_small_file_directory(self, entry: tuple[int, int, str]) -> None:
+        if len(self.small_file_directories) < self.top:
+            heapq.heappush(self.small_file_directories, entry)
+        elif entry > self.small_file_directories[0]:
+            heapq.heapreplace(self.small_file_directories, entry)
+
+    def add(self, directory: str, entry: dict) -> None:
+        '''
+        Add the files directly inside a directory, as tallied by scan_directory with histogram=True.
+        '''
+        for bucket, number_of_files, size in entry["histogram"]:
+            self.add_bucket(bucket, number_of_files, size)
+        number_of_small_files, size_of_small_files = entry["small_files"]
+        if number_of_small_files > 0:
+            self.add_small_file_directory((number_of_small_files, size_of_small_files, directory))
+
+    def merge(self, other: "FileStatistics") -> None:
+        for bucket, (number_of_files, size) in other.histogram.items():
+            self.add_bucket(bucket, number_of_files, size)
+        for entry in other.small_file_directories:
+            self.add_small_file_directory(entry)
+
+
+def scan_directory(directory: str, sizes: bool, histogram: bool = False) -> dict:
+    '''
+    Tally the files directly inside a directory and list its sub-directories, see scan_tree.
+    Arguments:
+        directory: str -> directory to scan
+        sizes: bool -> whether to tally the disk space
+        histogram: bool -> whether to tally the file-size histogram and the small files as well, requires sizes
+    Return:
+        dictionary with disk space in bytes ('size', None if not tallied), number of files ('files')
+        and names of sub-directories ('subdirectories'), with histogram also a list of
+        [bucket, number of files, disk space] ('histogram') and the number and disk space of the small files ('small_files')
+    '''
+    size = 0
+    number_of_files = 0
+    subdirectories = []
+    buckets = {}
+    number_of_small_files = 0
+    size_of_small_files = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if not entry.is_symlink():
+                    subdirectories.append(entry.name)
+                continue
+            number_of_files += 1
+            if not sizes:
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                file_size = entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                continue
+            size += file_size
+            if histogram:
+                bucket = file_size.bit_length()
+                counts = buckets.get(bucket)
+                if counts is None:
+                    buckets[bucket] = [bucket, 1, file_size]
+                else:
+                    counts[1] += 1
+                    counts[2] += file_size
+                if file_size < SMALL_FILE_SIZE:
+                    number_of_small_files += 1
+                    size_of_small_files += file_size
+    result = {"size": size if sizes else None, "files": number_of_files, "subdirectories": subdirectories}
+    if histogram:
+        result["histogram"] = sorted(buckets.values())
+        result["small_files"] = [number_of_small_files, size_of_small_files]
+    return result
+
+
+def scan_tree(top: str, sizes: bool = True, cache: ScanCache | None = None, statistics: FileStatistics | None = None, index: SizeIndex | None = None) -> tuple[int, int, int]:
+    '''
+    Tally disk space, number of files and number of directories below a directory in a single traversal.
+    Uses os.scandir, such that the file type is taken from the directory listing and each file is stat'ed at most once.
+    Symbolic links are treated like in os.walk: links to directories are not followed and not counted,
+    all other links are counted as files, and the size of a link to a file is the size of the link itself.
+    Broken links and special files are counted as files without size. Directories which cannot be read are skipped.
+    With a cache, directories whose mtime is unchanged are not listed again, only stat'ed.
+    With statistics, the file sizes are also added to a file-size histogram in the same pass, which requires sizes.
+    With an index, the disk space and number of files below each directory down to the depth of the index are recorded as well,
+    which requires sizes, too.
+    Arguments:
+        top: str -> directory to scan
+        sizes: bool -> whether to tally the disk space, counting files only does not require to stat them
+        cache: ScanCache|None -> cache of previously scanned directories
+        statistics: FileStatistics|None -> file statistics to add the files to
+        index: SizeIndex|None -> size index of top to add the directories to
+    Return:
+        tuple of disk space in bytes, number of files and number of directories (not counting top itself)
+    '''
+    top = os.path.normpath(top)
+    if cache is not None:
+        cache.add_top(top)
+    if (statistics is not None or index is not None) and not sizes:
+        raise ValueError("File statistics and size indices require the file sizes to be tallied.")
+    with metrics.span("scan_tree"):
+        size, number_of_files, number_of_directories = _scan_tree(top, sizes, cache, statistics, index)
+    metrics.count("files_scanned", number_of_files)
+    metrics.count("directories_scanned", number_of_directories + 1)
+    if sizes:
+        metrics.count("bytes_scanned", size)
+    return size, number_of_files, number_of_directories
+
+
+def _scan_tree(top: str, sizes: bool, cache: ScanCache | None, statistics: FileStatistics | None, index: SizeIndex | None) -> tuple[int, int, int]:
+    histogram = statistics is not None
+    size = 0
+    number_of_files = 0
+    number_of_directories = 0
+    # iterative depth-first traversal, to not hit the recursion limit in deep trees
+    stack = [top]
+    while stack:
+        directory = stack.pop()
+        try:
+            if cache is None:
+                entry = scan_directory(directory, sizes, histogram)
+            else:
+                mtime = os.stat(directory).st_mtime_ns
+                entry = cache.get(directory, mtime, sizes, histogram)
+                if entry is None:
+                    entry = scan_directory(directory, sizes, histogram)
+                    entry["mtime"] = mtime
+                    cache.put(directory, entry)
+        except OSError:
+            continue
+        if sizes:
+            size += entry["size"]
+        number_of_files += entry["files"]
+        if histogram:
+            statistics.add(directory, entry)
+        if index is not None:
+            index.add(directory, entry)
+        number_of_directories += len(entry["subdirectories"])
+        stack.extend(os.path.join(directory, name) for name in entry["subdirectories"])
+    return size, number_of_files, number_of_directories
+
+
+def iter_files(top: str, min_size: int = 0) -> Iterator[tuple[str, int]]:
+    '''
+    List the regular files below a directory with their sizes, traversing it like scan_tree but without the cache,
+    which only holds the totals of each directory. Symbolic links are skipped, as they do not take up disk space.
+    Arguments:
+        top: str -> directory to list
+        min_size: int -> smallest file size in bytes to list
+    Yield:
+        tuples of path and size in bytes of each file
+    '''
+    stack = [os.path.normpath(top)]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_symlink():
+                            continue
+                        if entry.is_dir():
+                            stack.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                        file_size = entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+                    if file_size >= min_size:
+                        yield entry.path, file_size
+        except OSError:
+            continue
@@ -1,8 +1,121 @@
 import datetime
 import subprocess
 
+from helpers import metrics
 from helpers.logger import log
 
+def get_commits() -> list[tuple[str, int]]:
+    '''
+    List all commits of the current branch with a single 'git log' call.
+    Returns:
+        list of tuples of commit hash and commit timestamp, in the order of 'git rev-list' (newest first)
+    '''
+    with metrics.span("git_log"):
+        result = subprocess.run(["git", "log", "--format=%H %ct", "HEAD"], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{result.stderr}")
+    commits = []
+    for line in result.stdout.splitlines():
+        commit, timestamp = line.split()
+        commits.append((commit, int(timestamp)))
+    return commits
+
+def read_blobs(objects: list[str]) -> dict[str, str | None]:
+    '''
+    Read the content of several files from the git history with a single 'git cat-file --batch' call.
+    Arguments:
+        objects: list[str] -> objects to read, e.g. '<commit>:reports/<subgroup>.csv'
+    Returns:
+        dictionary with the objects as keys and their content as values, None for objects which do not exist
+    '''
+    with metrics.span("git_cat_file"):
+        result = subprocess.run(["git", "cat-file", "--batch"], input="".join(f"{o}\n" for o in objects).encode(), capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{result.stderr.decode()}")
+    output = result.stdout
+    contents = {}
+    position = 0
+    for o in objects:
+        # each object is either announced as '<hash> <type> <size>' followed by its content, or as '<object> missing'
+        header_end = output.index(b"\n", position)
+        header = output[position:header_end].decode().split()
+        position = header_end + 1
+        if len(header) != 3:
+            contents[o] = None
+            continue
+        size = int(header[2])
+        contents[o] = output[position:position+size].decode()
+        position += size + 1
+    return contents
+
+def parse_report(report: str, date: str, analysis_data: dict) -> None:
+    '''
+    Add the data of a subgroup report from a given day to analysis_data, see get_data_from_git_history
+    '''
+    analyses = [x for x in report.split("\n") if x!='']
+    isInGB = False
+    for analysis in analyses:
+        # skip header of CSV file
+        if "Disk Usage" in analysis:
+            isInGB = "Disk Usage in GB" in analysis
+            continue
+        # Analysis name is first column, disk space second column, and number of files third column
+        data = analysis.split(",")
+        name = data[0]
+        # we do not want to plot the sum of all analyses in a given subgroup
+        if name == "Total Sum":
+            continue
+        # convert back to kB if disk space given in GB
+        size = int(float(data[1])*1024**2) if isInGB else int(data[1])
+        number_of_files = int(data[2])
+        # need to create empty dict for each analysis if it does not exist yet
+        if name not in analysis_data:
+            analysis_data[name] = {}
+        analysis_data[name][date] = {"size": size, "number_of_files": number_of_files}
+
+def get_subgroups_data_from_git_history(subgroups: list[str], days_ago: list[int], missing_ok: bool = False):
+    '''
+    read historic analysis data of several subgroups from git history,
+    using one 'git log' and one 'git cat-file' call in total
+    Arguments:
+        subgroups: list[str] -> names of subgroups to get analysis data for
+        days_ago: list[int] -> list of past days to collect information for (0 for today, 1 for yesterday etc.)
+        missing_ok: bool -> skip days on which a report did not exist yet, instead of raising a RuntimeError
+    Returns:
+        dictionary with subgroup names as keys and dictionaries as returned by get_data_from_git_history as values
+    '''
+    log.info(f"Collecting information for subgroups {', '.join(subgroups)}.")
+    TODAY = datetime.datetime.now()
+    commits = get_commits()
+    # last commit before the end of each day, like 'git rev-list -1 --before=<next day> HEAD',
+    # which interprets the date at the current time of day
+    commit_per_date = {}
+    for i_day in days_ago:
+        date = (TODAY - datetime.timedelta(i_day)).strftime("%Y-%m-%d")
+        before = (TODAY - datetime.timedelta(i_day-1)).timestamp()
+        commit = next((commit for commit, timestamp in commits if timestamp <= before), None)
+        if commit is None:
+            if missing_ok:
+                continue
+            raise RuntimeError(f"No commit found before {date}.")
+        commit_per_date[date] = commit
+
+    objects = {(subgroup, date): f"{commit}:reports/{subgroup}.csv" for subgroup in subgroups for date, commit in commit_per_date.items()}
+    reports = read_blobs(sorted(set(objects.values())))
+
+    subgroup_data = {}
+    for subgroup in subgroups:
+        analysis_data = {}
+        for date in commit_per_date:
+            report = reports[objects[(subgroup, date)]]
+            if report is None:
+                if missing_ok:
+                    continue
+                raise RuntimeError(f"reports/{subgroup}.csv does not exist on {date}.")
+            parse_report(report, date, analysis_data)
+        subgroup_data[subgroup] = analysis_data
+    return subgroup_data
+
 def get_data_from_git_history(subgroup: str, days_ago: list[int]):
     '''
     read historic analysis data from git history
@@ -11,39 +124,7 @@ def get_data_from_git_history(subgroup: str, days_ago: list[int]):
         days_ago: list[int] -> list of past days to collect information for (0 for today, 1 for yesterday etc.)
     Returns:
         dictionary with analysis names as keys
-        and dictionaries {'size': size, 'number_of_files': number_of_files} 
+        and dictionaries {'size': size, 'number_of_files': number_of_files}
         as values
     '''
-    log.info(f"Collecting information for subgroup {subgroup}.")
-    TODAY = datetime.datetime.now()
-    analysis_data = {}
-    for i_day in days_ago:
-        date = (TODAY - datetime.timedelta(i_day)).strftime("%Y-%m-%d")
-        print(date)
-        before_date = (TODAY - datetime.timedelta(i_day-1)).strftime("%Y-%m-%d")
-        command = f'git show $(git rev-list -1 --before="{before_date}" HEAD):reports/{subgroup}.csv'
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        if result.stderr:
-            raise RuntimeError(f"{result.stderr}")
-
-        analyses = [x for x in result.stdout.split("\n") if x!='']
-        isInGB = False
-        for analysis in analyses:
-            # skip header of CSV file
-            if "Disk Usage" in analysis:
-                isInGB = "Disk Usage in GB" in analysis
-                continue
-            # Analysis name is first column, disk space second column, and number of files third column
-            data = analysis.split(",")
-            name = data[0]
-            # we do not want to plot the sum of all analyses in a given subgroup
-            if name == "Total Sum":
-                continue
-            # convert back to kB if disk space given in GB
-            size = int(float(data[1])*1024**2) if isInGB else int(data[1])
-            number_of_files = int(data[2])
-            # need to create empty dict for each analysis if it does not exist yet
-            if name not in analysis_data:
-                analysis_data[name] = {}
-            analysis_data[name][date] = {"size": size, "number_of_files": number_of_files}
-    return analysis_data
\ No newline at end of file
+    return get_subgroups_data_from_git_history([subgroup], days_ago)[subgroup]
@@ -1,2 +1,186 @@
+import csv
+import json
+import os
+import pathlib
+import threading
+import time
+
+GLANCE_CODES_FILE = "glance_codes.csv"
+FINISHED_ANALYSES_FILE = "finished_analyses.txt"
+
+
 def get_glance_link_from_code(code: str) -> str:
-    return f"https://atlas-glance.cern.ch/atlas/analysis/analyses/details.php?ref_code={code}"
\ No newline at end of file
+    return f"https://atlas-glance.cern.ch/atlas/analysis/analyses/details.php?ref_code={code}"
+
+
+class GlanceRegistry:
+    '''
+    Glance codes of the analysis folders, as listed in 'glance_codes.csv', and the set of finished analyses,
+    as listed in 'finished_analyses.txt'. Both files are parsed once and only parsed again when they have been modified.
+    '''
+
+    def __init__(self, glance_codes_file: str = GLANCE_CODES_FILE, finished_analyses_file: str = FINISHED_ANALYSES_FILE):
+        self._glance_codes_file = glance_codes_file
+        self._finished_analyses_file = finished_analyses_file
+        self._lock = threading.Lock()
+        self._glance_codes_mtime = None
+        self._finished_analyses_mtime = None
+        self._glance_codes: dict[str, str] = {}
+        self._codes_per_folder: dict[str, list[str]] = {}
+        self._folders_per_code: dict[str, list[str]] = {}
+        self._finished: set[str] = set()
+
+    def _refresh_glance_codes(self) -> None:
+        mtime = os.stat(self._glance_codes_file).st_mtime_ns
+        with self._lock:
+            if mtime == self._glance_codes_mtime:
+                return
+            glance_codes = {}
+            with open(self._glance_codes_file) as f:
+                r = csv.reader(f, delimiter=' ')
+                for row in r:
+                    name = row[0]
+                    code = row[1]
+                    glance_codes[name] = code
+            codes_per_folder = {name: codes.split(",") for name, codes in glance_codes.items()}
+            folders_per_code = {}
+            for name, codes in codes_per_folder.items():
+                for code in codes:
+                    folders_per_code.setdefault(code, []).append(name)
+            self._glance_codes = glance_codes
+            self._codes_per_folder = codes_per_folder
+            self._folders_per_code = folders_per_code
+            self._glance_codes_mtime = mtime
+
+    def _refresh_finished_analyses(self) -> None:
+        mtime = os.stat(self._finished_analyses_file).st_mtime_ns
+        with self._lock:
+            if mtime == self._finished_analyses_mtime:
+                return
+            with open(self._finished_analyses_file) as f:
+                self._finished = {line.strip() for line in f if line.strip()}
+            self._finished_analyses_mtime = mtime
+
+    @property
+    def glance_codes(self) -> dict[str, str]:
+        '''
+        Glance codes of all analysis folders, as comma-separated string per folder name. Not to be modified.
+        '''
+        self._refresh_glance_codes()
+        return self._glance_codes
+
+    def codes(self, folder: str) -> list[str]:
+        '''
+        Look up the Glance codes of an analysis folder.
+        Arguments:
+            folder: str -> name of the analysis folder
+        Return:
+            list of Glance codes, empty if the folder is not listed
+        '''
+        self._refresh_glance_codes()
+        return self._codes_per_folder.get(folder, [])
+
+    def folders(self, code: str) -> list[str]:
+        '''
+        Look up the analysis folders belonging to a Glance code.
+        Arguments:
+            code: str -> Glance reference code
+        Return:
+            list of folder names, empty if the code is not listed
+        '''
+        self._refresh_glance_codes()
+        return self._folders_per_code.get(code, [])
+
+    def all_codes(self) -> set[str]:
+        '''
+        All Glance codes listed for any analysis folder, without placeholders for folders without analysis ('N/A').
+        '''
+        self._refresh_glance_codes()
+        return {code for code in self._folders_per_code if code != "N/A"}
+
+    @property
+    def finished(self) -> set[str]:
+        '''
+        Glance codes of all analyses whose paper has been accepted by a journal. Not to be modified.
+        '''
+        self._refresh_finished_analyses()
+        return self._finished
+
+    def is_finished(self, code: str) -> bool:
+        return code in self.finished
+
+    def is_folder_finished(self, folder: str) -> bool:
+        '''
+        Check whether all analyses stored in an analysis folder are finished.
+        Arguments:
+            folder: str -> name of the analysis folder
+        Return:
+            True if the folder is listed in 'glance_codes.csv' and all its Glance codes are finished, False otherwise
+        '''
+        codes = self.codes(folder)
+        finished = self.finished
+        return bool(codes) and all(code in finished for code in codes)
+
+
+_registry: GlanceRegistry | None = None
+
+
+def get_registry() -> GlanceRegistry:
+    '''
+    Registry shared by all users within a process.
+    '''
+    global _registry
+    if _registry is None:
+        _registry = GlanceRegistry()
+    return _registry
+
+
+class GlanceCache:
+    '''
+    On-disk cache of Glance API responses, stored as JSON file.
+    Entries expire after a given number of days, such that e.g. papers without journal acceptance date
+    are only checked again every few days instead of daily.
+    '''
+
+    def __init__(self, path: str | pathlib.Path, ttl_days: float = 7):
+        '''
+        Arguments:
+            path: str|pathlib.Path -> JSON file to load the cache from and to save it to
+            ttl_days: float -> number of days after which an entry expires
+        '''
+        self._path = pathlib.Path(path)
+        self._ttl = ttl_days * 24 * 60 * 60
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        if self._path.is_file():
+            with open(self._path) as f:
+                self._entries = json.load(f)
+
+    def get(self, key: str, ttl_days: float | None = None):
+        '''
+        Retrieve a cached response.
+        Arguments:
+            key: str -> key of the response, e.g. 'paper:<reference code>'
+            ttl_days: float|None -> number of days after which this entry expires, if shorter than the one of the cache
+        Return:
+            cached value, None if there is no entry or it has expired
+        '''
+        ttl = self._ttl if ttl_days is None else min(self._ttl, ttl_days * 24 * 60 * 60)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry["time"] > ttl:
+                return None
+            return entry["value"]
+
+    def put(self, key: str, value) -> None:
+        with self._lock:
+            self._entries[key] = {"time": time.time(), "value": value}
+
+    def save(self) -> None:
+        with self._lock:
+            # drop expired entries
+            now = time.time()
+            self._entries = {key: entry for key, entry in self._entries.items() if now - entry["time"] <= self._ttl}
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self._path, "w") as f:
+                json.dump(self._entries, f, separators=(",", ":"))
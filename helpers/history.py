@@ -0,0 +1,215 @@
+import bisect
+import csv
+import datetime
+import pathlib
+
+from helpers.git import get_subgroups_data_from_git_history
+from helpers.logger import log
+
+HISTORY_DIRECTORY = "reports/history"
+HISTORY_HEADER = ["Date", "Subgroup", "Analysis", "Disk Usage in kB", "Number of files"]
+
+
+class HistoryStore:
+    '''
+    Append-only store of the daily per-analysis disk usage, with one CSV file per subgroup (or RSE) in 'reports/history/'.
+    Each row holds date, subgroup, analysis, disk usage in kB and number of files, such that the history can be read
+    without replaying the git history of the reports.
+    '''
+
+    def __init__(self, directory: str | pathlib.Path = HISTORY_DIRECTORY):
+        self._directory = pathlib.Path(directory)
+
+    def path(self, subgroup: str) -> pathlib.Path:
+        return self._directory / f"{subgroup}.csv"
+
+    def has(self, subgroup: str) -> bool:
+        return self.path(subgroup).is_file()
+
+    def record(self, subgroup: str, date: str, analyses: dict[str, tuple[int, int]]) -> None:
+        '''
+        Add the data of one day to the history of a subgroup. Data already recorded for the same day is replaced.
+        Arguments:
+            subgroup: str -> name of subgroup (or RSE)
+            date: str -> date in format YYYY-MM-DD
+            analyses: dict[str, tuple[int, int]] -> disk usage in kB and number of files for each analysis
+        '''
+        path = self.path(subgroup)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        rows = [[date, subgroup, name, size, number_of_files] for name, (size, number_of_files) in analyses.items()]
+        log.debug(f"Recording {len(rows)} analyses for {subgroup} on {date}.")
+        if not path.is_file():
+            with open(path, "w") as f:
+                writer = csv.writer(f)
+                writer.writerow(HISTORY_HEADER)
+                writer.writerows(rows)
+            return
+        with open(path) as f:
+            existing = list(csv.reader(f))[1:]
+        if all(row[0] < date for row in existing):
+            with open(path, "a") as f:
+                csv.writer(f).writerows(rows)
+            return
+        # rerun on the same day, or data added for a past day: rewrite the file in chronological order
+        existing = [row for row in existing if row[0] != date]
+        with open(path, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(HISTORY_HEADER)
+            writer.writerows(sorted(existing + rows, key=lambda row: row[0]))
+
+    def first_date(self, subgroup: str) -> str | None:
+        '''
+        Earliest date recorded for a subgroup, read from the first row as the file is kept in chronological order.
+        '''
+        with open(self.path(subgroup)) as f:
+            reader = csv.reader(f)
+            next(reader)
+            row = next(reader, None)
+        return row[0] if row is not None else None
+
+    def load(self, subgroup: str) -> dict[str, dict[str, tuple[int, int]]]:
+        '''
+        Read the full history of a subgroup.
+        Arguments:
+            subgroup: str -> name of subgroup (or RSE)
+        Return:
+            dictionary with dates as keys and dictionaries {analysis: (size in kB, number of files)} as values, in chronological order
+        '''
+        history = {}
+        with open(self.path(subgroup)) as f:
+            reader = csv.reader(f)
+            next(reader)
+            for date, _, name, size, number_of_files in reader:
+                history.setdefault(date, {})[name] = (int(size), int(number_of_files))
+        return dict(sorted(history.items()))
+
+    def get_data(self, subgroup: str, days_ago: list[int]) -> dict[str, dict[str, dict[str, int]]]:
+        '''
+        Read historic analysis data, in the same format as helpers.git.get_data_from_git_history.
+        Like there, the data for a given day is the latest data recorded on or before that day.
+        Arguments:
+            subgroup: str -> name of subgroup to get analysis data for
+            days_ago: list[int] -> list of past days to collect information for (0 for today, 1 for yesterday etc.)
+        Returns:
+            dictionary with analysis names as keys
+            and dictionaries {date: {'size': size, 'number_of_files': number_of_files}} as values
+        '''
+        history = self.load(subgroup)
+        recorded_dates = list(history)
+        today = datetime.datetime.now()
+        analysis_data = {}
+        for i_day in days_ago:
+            date = (today - datetime.timedelta(i_day)).strftime("%Y-%m-%d")
+            i_recorded = bisect.bisect_right(recorded_dates, date) - 1
+            if i_recorded < 0:
+                continue
+            for name, (size, number_of_files) in history[recorded_dates[i_recorded]].items():
+                analysis_data.setdefault(name, {})[date] = {"size": size, "number_of_files": number_of_files}
+        return analysis_data
+
+    def get_arrays(self, subgroup: str, days_ago: list[int]) -> tuple[list[str], list[str], "np.ndarray", "np.ndarray"]:
+        '''
+        Read historic analysis data as dense arrays, see get_data and to_arrays.
+        Arguments:
+            subgroup: str -> name of subgroup (or RSE)
+            days_ago: list[int] -> list of past days to collect information for (0 for today, 1 for yesterday etc.)
+        Return:
+            tuple of dates, analysis names, and disk usage in kB and number of files as arrays of shape (analyses, dates)
+        '''
+        return to_arrays(self.get_data(subgroup, days_ago), days_ago)
+
+    def backfill(self, subgroup: str, days: int) -> None:
+        '''
+        Import the history of a subgroup's report from the git history, replacing days already recorded.
+        Arguments:
+            subgroup: str -> name of subgroup
+            days: int -> number of past days to import
+        '''
+        analysis_data = get_subgroups_data_from_git_history([subgroup], days_ago=list(range(days)), missing_ok=True)[subgroup]
+        per_date = {}
+        for name, data in analysis_data.items():
+            for date, values in data.items():
+                per_date.setdefault(date, {})[name] = (values["size"], values["number_of_files"])
+        for date in sorted(per_date):
+            self.record(subgroup, date, per_date[date])
+
+
+def to_arrays(analysis_data: dict[str, dict[str, dict[str, int]]], days_ago: list[int]) -> tuple[list[str], list[str], "np.ndarray", "np.ndarray"]:
+    '''
+    Convert historic analysis data to dense arrays, with one row per analysis and one column per day.
+    Arguments:
+        analysis_data: dict -> data as returned by HistoryStore.get_data or helpers.git.get_data_from_git_history
+        days_ago: list[int] -> list of past days the data has been collected for (0 for today, 1 for yesterday etc.)
+    Return:
+        tuple of dates (in format YYYY-MM-DD, in the order of days_ago), analysis names, and disk usage in kB and
+        number of files as float arrays of shape (analyses, dates), NaN on days on which the analysis did not exist
+    '''
+    # numpy is only needed to read the history, not by the jobs which only record it
+    import numpy as np
+    today = datetime.datetime.now()
+    dates = [(today - datetime.timedelta(i_day)).strftime("%Y-%m-%d") for i_day in days_ago]
+    columns = {date: i_date for i_date, date in enumerate(dates)}
+    analyses = list(analysis_data)
+    sizes = np.full((len(analyses), len(dates)), np.nan)
+    numbers = np.full((len(analyses), len(dates)), np.nan)
+    for i_analysis, name in enumerate(analyses):
+        for date, values in analysis_data[name].items():
+            i_date = columns[date]
+            sizes[i_analysis, i_date] = values["size"]
+            numbers[i_analysis, i_date] = values["number_of_files"]
+    return dates, analyses, sizes, numbers
+
+
+def get_histories(subgroups: list[str], days_ago: list[int]) -> dict[str, dict[str, dict[str, dict[str, int]]]]:
+    '''
+    Read historic analysis data of several subgroups from the history store, and from the git history
+    for subgroups without history yet and for days before the first day recorded in the history store
+    (in at most two passes over the git history).
+    Arguments:
+        subgroups: list[str] -> names of subgroups to get analysis data for
+        days_ago: list[int] -> list of past days to collect information for (0 for today, 1 for yesterday etc.)
+    Returns:
+        dictionary with subgroup names as keys and dictionaries as returned by HistoryStore.get_data as values
+    '''
+    store = HistoryStore()
+    today = datetime.datetime.now()
+    dates = {i_day: (today - datetime.timedelta(i_day)).strftime("%Y-%m-%d") for i_day in days_ago}
+    histories = {}
+    # days before the first day recorded in the history store of each subgroup
+    earlier = {}
+    for subgroup in subgroups:
+        if store.has(subgroup):
+            log.info(f"Collecting information for subgroup {subgroup} from {store.path(subgroup)}.")
+            histories[subgroup] = store.get_data(subgroup, days_ago)
+            first_date = store.first_date(subgroup)
+            earlier[subgroup] = [i_day for i_day in days_ago if first_date is None or dates[i_day] < first_date]
+    missing = [subgroup for subgroup in subgroups if subgroup not in histories]
+    if missing:
+        histories.update(get_subgroups_data_from_git_history(missing, days_ago))
+    incomplete = [subgroup for subgroup, days in earlier.items() if days]
+    if incomplete:
+        log.info(f"Collecting information from before the history store for subgroups {', '.join(incomplete)} from git.")
+        git_data = get_subgroups_data_from_git_history(incomplete, sorted({i_day for subgroup in incomplete for i_day in earlier[subgroup]}), missing_ok=True)
+        for subgroup in incomplete:
+            earlier_dates = {dates[i_day] for i_day in earlier[subgroup]}
+            analysis_data = histories[subgroup]
+            for name, data in git_data[subgroup].items():
+                for date, values in data.items():
+                    if date in earlier_dates:
+                        analysis_data.setdefault(name, {})[date] = values
+            # keep the dates in the order of days_ago, like get_data does
+            order = {dates[i_day]: i for i, i_day in enumerate(days_ago)}
+            histories[subgroup] = {name: dict(sorted(data.items(), key=lambda item: order[item[0]])) for name, data in analysis_data.items()}
+    return {subgroup: histories[subgroup] for subgroup in subgroups}
+
+
+def get_history_arrays(subgroups: list[str], days_ago: list[int]) -> dict[str, tuple[list[str], list[str], "np.ndarray", "np.ndarray"]]:
+    '''
+    Read historic analysis data of several subgroups as dense arrays, see get_histories and to_arrays.
+    Arguments:
+        subgroups: list[str] -> names of subgroups to get analysis data for
+        days_ago: list[int] -> list of past days to collect information for (0 for today, 1 for yesterday etc.)
+    Returns:
+        dictionary with subgroup names as keys and tuples as returned by to_arrays as values
+    '''
+    return {subgroup: to_arrays(analysis_data, days_ago) for subgroup, analysis_data in get_histories(subgroups, days_ago).items()}
@@ -0,0 +1,140 @@
+import contextlib
+import cProfile
+import datetime
+import json
+import os
+import pathlib
+import threading
+import time
+
+from helpers.logger import log
+
+# set to 1 to collect timing spans and counters and write them to 'reports/<job>.metrics.json'
+METRICS_ENV = "EXOTICS_METRICS"
+# set to 1 to additionally profile the whole job with cProfile and write the statistics to 'reports/<job>.prof'
+PROFILE_ENV = "EXOTICS_PROFILE"
+METRICS_DIRECTORY = "reports"
+
+_enabled = os.getenv(METRICS_ENV, "0") not in ("", "0")
+_lock = threading.Lock()
+_spans: dict[str, dict] = {}
+_counters: dict[str, int] = {}
+# returned by span if metrics are disabled, such that instrumented code only pays for a function call
+_NO_SPAN = contextlib.nullcontext()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+class _Span:
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._start
+        with _lock:
+            span = _spans.setdefault(self._name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+            span["calls"] += 1
+            span["seconds"] += elapsed
+            span["max_seconds"] = max(span["max_seconds"], elapsed)
+        return False
+
+
+def span(name: str):
+    '''
+    Context manager measuring the time spent in a block of code, accumulated over all calls with the same name.
+    Arguments:
+        name: str -> name of the span, e.g. 'eos_du'
+    '''
+    if not _enabled:
+        return _NO_SPAN
+    return _Span(name)
+
+
+def count(name: str, n: int = 1) -> None:
+    '''
+    Increase a counter, e.g. of rows processed or cache hits.
+    Arguments:
+        name: str -> name of the counter
+        n: int -> amount to add
+    '''
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def reset() -> None:
+    '''
+    Drop all spans and counters, e.g. those inherited by a forked worker process.
+    '''
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+def take() -> dict:
+    '''
+    Hand over the spans and counters collected so far and reset them, used to collect the metrics of worker processes.
+    '''
+    with _lock:
+        results = {"spans": {name: dict(span) for name, span in _spans.items()}, "counters": dict(_counters)}
+        _spans.clear()
+        _counters.clear()
+    return results
+
+
+def merge(results: dict) -> None:
+    '''
+    Add spans and counters as returned by take, e.g. in a worker process, to the ones of this process.
+    '''
+    with _lock:
+        for name, other in results["spans"].items():
+            span = _spans.setdefault(name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+            span["calls"] += other["calls"]
+            span["seconds"] += other["seconds"]
+            span["max_seconds"] = max(span["max_seconds"], other["max_seconds"])
+        for name, n in results["counters"].items():
+            _counters[name] = _counters.get(name, 0) + n
+
+
+@contextlib.contextmanager
+def job(name: str, directory: str | pathlib.Path = METRICS_DIRECTORY):
+    '''
+    Context manager around a whole job. If metrics are enabled, the spans and counters are written to '<directory>/<name>.metrics.json'
+    at the end of the job, together with its total run time. If profiling is enabled, the cProfile statistics of the job
+    are written to '<directory>/<name>.prof', to be inspected e.g. with 'python3 -m pstats'.
+    Arguments:
+        name: str -> name of the job, e.g. 'gridspace'
+        directory: str|pathlib.Path -> directory to write the metrics to
+    '''
+    profiler = cProfile.Profile() if os.getenv(PROFILE_ENV, "0") not in ("", "0") else None
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        directory = pathlib.Path(directory)
+        if profiler is not None:
+            profiler.disable()
+            directory.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(directory / f"{name}.prof")
+            log.info(f"Wrote profile of {name} to {directory / f'{name}.prof'}.")
+        if _enabled:
+            results = take()
+            directory.mkdir(parents=True, exist_ok=True)
+            with open(directory / f"{name}.metrics.json", "w") as f:
+                json.dump({
+                    "job": name,
+                    "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                    "seconds": time.perf_counter() - start,
+                    "spans": dict(sorted(results["spans"].items())),
+                    "counters": dict(sorted(results["counters"].items())),
+                }, f, indent=2)
+            log.info(f"Wrote metrics of {name} to {directory / f'{name}.metrics.json'}.")
@@ -0,0 +1,94 @@
+import json
+import os
+import pathlib
+
+# number of directory levels below each analysis folder kept in the size index
+DEFAULT_INDEX_DEPTH = 3
+INDEX_FILE = "reports/{subgroup}.index.json"
+
+
+def new_node() -> dict:
+    return {"size": 0, "files": 0, "children": {}}
+
+
+class SizeIndex:
+    '''
+    Disk space and number of files below each directory of a tree, down to a given depth below its top directory.
+    Filled with the entries of scan_tree while walking the tree, such that no directory has to be walked again.
+    Files in directories deeper than the given depth are added to their ancestor at that depth.
+    '''
+
+    def __init__(self, top: str, depth: int = DEFAULT_INDEX_DEPTH):
+        self.top = os.path.normpath(top)
+        self.depth = depth
+        self.root = new_node()
+
+    def add(self, directory: str, entry: dict) -> None:
+        '''
+        Add the files directly inside a directory, as tallied by scan_directory with sizes.
+        Arguments:
+            directory: str -> path of the directory, below self.top
+            entry: dict -> entry returned by scan_directory
+        '''
+        relative = os.path.relpath(directory, self.top)
+        parts = [] if relative == "." else relative.split(os.sep)[:self.depth]
+        node = self.root
+        node["size"] += entry["size"]
+        node["files"] += entry["files"]
+        for part in parts:
+            node = node["children"].setdefault(part, new_node())
+            node["size"] += entry["size"]
+            node["files"] += entry["files"]
+
+
+def write_index(path: str | pathlib.Path, depth: int, indices: dict[str, SizeIndex]) -> None:
+    '''
+    Write the size indices of the analysis folders of a subgroup to a JSON file.
+    Arguments:
+        path: str|pathlib.Path -> JSON file to write
+        depth: int -> depth of the indices
+        indices: dict[str, SizeIndex] -> size index of each analysis folder
+    '''
+    def compact(node: dict) -> dict:
+        # leaves without children are written without the 'children' key, to keep the file small
+        compacted = {"size": node["size"], "files": node["files"]}
+        if node["children"]:
+            compacted["children"] = {name: compact(child) for name, child in sorted(node["children"].items())}
+        return compacted
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"depth": depth, "analyses": {name: compact(index.root) for name, index in indices.items()}}, f, separators=(",", ":"))
+
+
+def load_index(path: str | pathlib.Path) -> dict:
+    '''
+    Read the size index of a subgroup written by write_index.
+    Return:
+        dictionary with the depth of the index ('depth') and the tree of each analysis folder ('analyses')
+    '''
+    with open(path) as f:
+        return json.load(f)
+
+
+def find_node(index: dict, path: str) -> dict:
+    '''
+    Find the node of a directory in the size index of a subgroup.
+    Arguments:
+        index: dict -> size index as returned by load_index
+        path: str -> path of the directory relative to the subgroup folder, starting with the analysis folder
+    Return:
+        node with disk space in bytes ('size'), number of files ('files') and, if any, sub-directories ('children')
+    '''
+    parts = [part for part in path.strip("/").split("/") if part]
+    if not parts:
+        raise KeyError("No analysis folder given.")
+    node = {"children": index["analyses"]}
+    for depth, part in enumerate(parts):
+        children = node.get("children", {})
+        if part not in children:
+            if depth > index["depth"]:
+                raise KeyError(f"{path} is deeper than the depth of the index ({index['depth']}).")
+            raise KeyError(f"{'/'.join(parts[:depth+1])} not found in the index.")
+        node = children[part]
+    return node
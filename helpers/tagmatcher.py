@@ -0,0 +1,71 @@
+import re
+
+# characters with a special meaning in regular expressions
+REGEX_METACHARACTERS = set(".^$*+?{}[]|()\\")
+# syntax which refers to groups by number or name, or sets flags for the whole expression, such that a tag using it
+# changes its meaning or cannot be compiled as part of a larger expression: backreferences, named groups, conditionals and global flags
+UNCOMBINABLE_SYNTAX = re.compile(r"\\[1-9]|\(\?P[<=]|\(\?<[^=!]|\(\?\(|\(\?[aiLmsux]+\)")
+
+
+def literal_from_tag(tag: str) -> str | None:
+    '''
+    Check whether a tag from the lookup table is a plain string, i.e. contains no regular expression syntax
+    apart from escaped punctuation such as '\\.'.
+    Arguments:
+        tag: str -> tag to check
+    Return:
+        unescaped string if the tag is a plain string, None otherwise
+    '''
+    # escaped letters and digits ('\d', '\w', ...) have a special meaning, escaped punctuation does not
+    unescaped = re.sub(r"\\([^A-Za-z0-9])", "", tag)
+    if any(c in REGEX_METACHARACTERS for c in unescaped):
+        return None
+    return re.sub(r"\\([^A-Za-z0-9])", r"\1", tag)
+
+
+class TagMatcher:
+    '''
+    Match dataset names against all tags of one scope in the lookup table at once.
+    The tags are combined into a single alternation, such that names not matching any tag are rejected with one regex search.
+    Only names passing this prefilter are matched against the individual tags, using plain substring checks
+    for tags without regular expression syntax.
+    Tags with backreferences, named groups or global flags are left out of the prefilter and matched against every name.
+    '''
+
+    def __init__(self, tags: list[str]):
+        self.tags = list(tags)
+        self.patterns = [re.compile(tag) for tag in self.tags]
+        self.literals = [literal_from_tag(tag) for tag in self.tags]
+        # whether each tag is part of the prefilter, i.e. names rejected by the prefilter cannot match it
+        self.prefiltered = [UNCOMBINABLE_SYNTAX.search(tag) is None for tag in self.tags]
+        self.prefilter = None
+        if any(self.prefiltered):
+            try:
+                self.prefilter = re.compile("|".join(f"(?:{tag})" for tag, prefiltered in zip(self.tags, self.prefiltered) if prefiltered))
+            except re.error:
+                # tags which cannot be combined are only matched individually
+                self.prefilter = None
+        if self.prefilter is None:
+            self.prefiltered = [False] * len(self.tags)
+
+    def match(self, name: str) -> list[str]:
+        '''
+        Match a dataset name to the tags.
+        Arguments:
+            name: str -> name of dataset to match
+        Return:
+            list of all tags matching the given name, in the order of the lookup table
+        '''
+        rejected = self.prefilter is not None and self.prefilter.search(name) is None
+        if rejected and all(self.prefiltered):
+            return []
+        matching_tags = []
+        for tag, literal, pattern, prefiltered in zip(self.tags, self.literals, self.patterns, self.prefiltered):
+            if rejected and prefiltered:
+                continue
+            if literal is not None:
+                if literal in name:
+                    matching_tags.append(tag)
+            elif pattern.search(name) is not None:
+                matching_tags.append(tag)
+        return matching_tags
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+from helpers.tagmatcher import REGEX_METACHARACTERS
+
+# number of dot-separated name components (after the scope) kept for each dataset not matching any tag
+SUGGEST_DEPTH = 3
+
+
+def tag_from_literal(literal: str) -> str:
+    '''
+    Escape a plain string such that it can be used as tag in the lookup table, inverse of literal_from_tag.
+    Arguments:
+        literal: str -> string to escape
+    Return:
+        tag matching exactly the given string
+    '''
+    return "".join(f"\\{c}" if c in REGEX_METACHARACTERS else c for c in literal)
+
+
+def name_components(scope: str, name: str, depth: int = SUGGEST_DEPTH) -> list[str]:
+    '''
+    Split a dataset name into its dot-separated components, without the scope the name usually starts with.
+    Arguments:
+        scope: str -> scope of the dataset
+        name: str -> name of the dataset
+        depth: int -> maximum number of components returned
+    Return:
+        first depth components of the name
+    '''
+    return name.removeprefix(f"{scope}.").split(".", depth)[:depth]
+
+
+def new_node() -> dict:
+    return {"count": 0, "size": 0, "children": {}}
+
+
+class TagSuggester:
+    '''
+    Collect the datasets not matching any tag of the lookup table, in order to suggest new tags.
+    For each scope, the first SUGGEST_DEPTH components of the names are added to a trie, counting the number of datasets
+    and the disk space below each node. Tags are only suggested for chains of components shared by all datasets below
+    the first component, so the children of deeper nodes are dropped as soon as there is more than one of them,
+    such that the memory usage does not grow with the number of datasets.
+    '''
+
+    def __init__(self, depth: int = SUGGEST_DEPTH):
+        self.depth = depth
+        self.roots: dict[str, dict] = {}
+
+    @property
+    def count(self) -> int:
+        return sum(root["count"] for root in self.roots.values())
+
+    @property
+    def size(self) -> int:
+        return sum(root["size"] for root in self.roots.values())
+
+    def add(self, scope: str, components: list[str], size: int, count: int = 1, branched: bool = False) -> None:
+        '''
+        Add datasets with the same leading name components to the trie of their scope.
+        Arguments:
+            scope: str -> scope of the datasets
+            components: list[str] -> leading name components as returned by name_components
+            size: int -> total size of the datasets in bytes
+            count: int -> number of datasets
+            branched: bool -> the datasets continue with different components after the given ones
+        '''
+        node = self.roots.setdefault(scope, new_node())
+        node["count"] += count
+        node["size"] += size
+        for component in components:
+            node = self.child(node, component, first=node is self.roots[scope])
+            if node is None:
+                return
+            node["count"] += count
+            node["size"] += size
+        if branched and node is not self.roots[scope]:
+            node["children"] = None
+
+    def child(self, node: dict, component: str, first: bool) -> dict | None:
+        '''
+        Child of a node for the given component, created if needed.
+        Return:
+            None if the node has (or gets) more than one child and is not the root of a scope
+        '''
+        children = node["children"]
+        if children is None:
+            return None
+        if not first and component not in children and children:
+            node["children"] = None
+            return None
+        return children.setdefault(component, new_node())
+
+    def merge(self, other: TagSuggester) -> None:
+        '''
+        Add the datasets collected by another suggester, e.g. in a worker process.
+        '''
+        def merge_node(node: dict, other_node: dict, first: bool) -> None:
+            node["count"] += other_node["count"]
+            node["size"] += other_node["size"]
+            if other_node["children"] is None:
+                node["children"] = None
+                return
+            for component, other_child in other_node["children"].items():
+                child = self.child(node, component, first)
+                if child is None:
+                    return
+                merge_node(child, other_child, False)
+        for scope, other_root in other.roots.items():
+            merge_node(self.roots.setdefault(scope, new_node()), other_root, True)
+
+    def suggest(self, top: int) -> list[tuple[str, str, int, int]]:
+        '''
+        Find the name prefixes covering the most disk space.
+        Starting from the first component after the scope, a prefix is extended as long as all of its datasets share
+        the next component, such that the suggested tags are as specific as possible without missing any dataset.
+        Arguments:
+            top: int -> maximum number of suggestions
+        Return:
+            list of (scope, tag, number of datasets, size in bytes), ordered by decreasing size
+        '''
+        suggestions = []
+        for scope, root in self.roots.items():
+            for component, node in root["children"].items():
+                prefix = [component]
+                while node["children"]:
+                    (next_component, next_node), = node["children"].items()
+                    if next_node["count"] != node["count"]:
+                        break
+                    prefix.append(next_component)
+                    node = next_node
+                suggestions.append((scope, tag_from_literal(".".join(prefix)), node["count"], node["size"]))
+        # sorted by all fields, such that the result does not depend on the order in which datasets are added
+        return sorted(suggestions, key=lambda s: (-s[3], -s[2], s[0], s[1]))[:top]
@@ -0,0 +1,27 @@
+import argparse
+
+from helpers import metrics
+from helpers.constants import SUBGROUPS
+from helpers.history import HistoryStore
+from helpers.logger import log
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backfill", action="store_true", help="Import the history of the subgroup reports from the git history.")
+    parser.add_argument("--days", type=int, default=365, help="Number of past days to import.")
+    parser.add_argument("-s", "--subgroups", nargs="+", default=SUBGROUPS, help="Specify subgroups to import.")
+    args = parser.parse_args()
+
+    if not args.backfill:
+        parser.error("Nothing to do, use --backfill to import the history from git.")
+
+    store = HistoryStore()
+    for subgroup in args.subgroups:
+        log.info(f"Importing {args.days} days of history for subgroup {subgroup}.")
+        store.backfill(subgroup, args.days)
+        log.info(f"History of subgroup {subgroup} stored in {store.path(subgroup)}.")
+
+if __name__ == "__main__":
+    with metrics.job("history"):
+        main()
@@ -2,8 +2,9 @@ import datetime
 import matplotlib.pyplot as plt
 from matplotlib.dates import DateFormatter, DayLocator
 
+from helpers import metrics
 from helpers.constants import SUBGROUPS, TODAY
-from helpers.git import get_data_from_git_history
+from helpers.history import get_history_arrays
 from helpers.logger import log
 
 
@@ -12,26 +13,23 @@ from helpers.logger import log
 def sort_analyses(analyses):
     '''
     sort analyses by their total size
-    returns list of sorted analysis names
+    returns list of indices of the sorted analyses
     TODO
     '''
-    analysis_names = analyses.keys()
-    return analysis_names
+    return range(len(analyses))
 
 
 NUMBER_OF_DAYS = 100
 def main():
+    subgroup_information = get_history_arrays(SUBGROUPS, days_ago=list(range(0, NUMBER_OF_DAYS)))
     for subgroup in SUBGROUPS:
         log.info(f"Creating summary plot for subgroup {subgroup}.")
-        analysis_data = get_data_from_git_history(subgroup, days_ago=list(range(0, NUMBER_OF_DAYS)))
+        dates, analyses, sizes, _ = subgroup_information[subgroup]
+        dates = [datetime.datetime.strptime(date, "%Y-%m-%d") for date in dates]
         plt.figure(figsize=(10,6))
-        sorted_analysis_names = sort_analyses(analysis_data)
-        for name in sorted_analysis_names:
-            information = analysis_data[name]
-            dates = [datetime.datetime.strptime(date, "%Y-%m-%d") for date in information.keys()]
-            sizes = [s["size"] for s in information.values()]
-            numbers = [n["number_of_files"] for n in information.values()]
-            plt.plot(dates, sizes, label=name)
+        for i_analysis in sort_analyses(analyses):
+            # days on which the analysis did not exist are NaN and left out of the line
+            plt.plot(dates, sizes[i_analysis], label=analyses[i_analysis])
         date_formatter = DateFormatter('%Y-%m-%d')
         plt.gca().xaxis.set_major_formatter(date_formatter)
         plt.gca().xaxis.set_major_locator(DayLocator(interval=int(NUMBER_OF_DAYS/10)))
@@ -45,4 +43,5 @@ def main():
         plt.savefig(f"reports/{subgroup}.pdf")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with metrics.job("plots"):
+        main()
\ No newline at end of file
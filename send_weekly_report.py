@@ -1,14 +1,14 @@
 import datetime
-from functools import lru_cache
 import os
 import smtplib
 import subprocess
 
 from email.message import EmailMessage
 
-from helpers.constants import get_glance_codes, MAX_DISK_SPACE, MAX_FILE_NUMBER, REPORT_LIST, SUBGROUPS, TODAY
-from helpers.git import get_data_from_git_history
-from helpers.glance import get_glance_link_from_code
+from helpers import metrics
+from helpers.constants import MAX_DISK_SPACE, MAX_FILE_NUMBER, REPORT_LIST, SUBGROUPS, TODAY
+from helpers.history import get_histories
+from helpers.glance import get_glance_link_from_code, get_registry
 from helpers.logger import log
 from helpers.utils import convert_units
 
@@ -26,28 +26,17 @@ def link_string(url, text):
 
 def analysis_link(analysis: str):
     sanitised_name = sanitise_latex(analysis)
-    glance_code_list = get_glance_codes()
-    if analysis not in glance_code_list.keys():
+    glance_codes = get_registry().codes(analysis)
+    if not glance_codes:
         return sanitised_name
-    glance_codes = glance_code_list[analysis].split(",")
     links = [get_glance_link_from_code(glance_code) for glance_code in glance_codes]
     link_strings = [link_string(link, str(i)) for i, link in enumerate(links, start=1)]
     return f"{sanitised_name} [{', '.join(link_strings)}]"
 
-@lru_cache
-def get_finished_analyses():
-    with open("finished_analyses.txt", "r") as f:
-        return [line.rstrip() for line in f]
-
 def analysis_finished(analysis: str):
     xmark = "x"
     checkmark = "\\checkmark"
-    glance_code_list = get_glance_codes()
-    if analysis not in glance_code_list.keys():
-        return xmark
-    glance_codes = glance_code_list[analysis].split(",")
-    finished_analyses = get_finished_analyses()
-    if all(code in finished_analyses for code in glance_codes):
+    if get_registry().is_folder_finished(analysis):
         return checkmark
     return xmark
 
@@ -61,6 +50,12 @@ def format_increase_percent(current, increase):
         return "$\\infty$"
     return f"{round(increase/previous*100, 1)}"
 
+def format_change_percent(current, previous):
+    '''percentage change relative to the previous value; "infinite" if there was nothing before'''
+    if previous == 0:
+        return "$\\infty$"
+    return f"{round(abs(1-current/previous)*100, 1)}"
+
 def render_table(caption, label, column_spec, header, rows):
     body = "\n".join(rows)
     return f"""
@@ -80,10 +75,8 @@ def render_table(caption, label, column_spec, header, rows):
 
 
 def collect_subgroup_information():
-    subgroup_information = {}
-    for subgroup in SUBGROUPS:
-        analysis_data = get_data_from_git_history(subgroup=subgroup, days_ago=[0, 6])
-        subgroup_information[subgroup] = analysis_data
+    subgroup_information = get_histories(SUBGROUPS, days_ago=[0, 6])
+    for analysis_data in subgroup_information.values():
         print(analysis_data)
     return subgroup_information
 
@@ -176,8 +169,8 @@ def build_latex(summary):
 \\end{{center}}
 This document is automically created once a week by the {link_string(CI_URL, "ExoticsDiskspaceUsage monitoring tools")}.
 It is meant to give a comprehensive overview of the status of the Exotics diskspace and any changes that have occurred during the previous week.
-The current total diskspace used is {convert_units(totals["size"])}, {round(totals["size"]/MAX_DISK_SPACE*100, 1)}\\% of the {convert_units(MAX_DISK_SPACE)} available to the Exotics group, {change_description(totals["size"], totals["size_last_week"])} of {round(abs(1-totals["size"]/totals["size_last_week"])*100, 1)}\\% compared to the previous week. {round(totals["size_finished"]/totals["size"]*100, 1)}\\% of the used space belongs to analyses with their paper accepted by the journal.
-A total of {totals["number"]} files is stored in the Exotics diskspace, amounting to {round(totals["number"]/MAX_FILE_NUMBER*100, 1)}\\% of the maximum {MAX_FILE_NUMBER} allowed, {change_description(totals["number"], totals["number_last_week"])} of {round(abs(1-totals["number"]/totals["number_last_week"])*100, 1)}\\% compared to the previous week.
+The current total diskspace used is {convert_units(totals["size"])}, {round(totals["size"]/MAX_DISK_SPACE*100, 1)}\\% of the {convert_units(MAX_DISK_SPACE)} available to the Exotics group, {change_description(totals["size"], totals["size_last_week"])} of {format_change_percent(totals["size"], totals["size_last_week"])}\\% compared to the previous week. {round(totals["size_finished"]/totals["size"]*100, 1)}\\% of the used space belongs to analyses with their paper accepted by the journal.
+A total of {totals["number"]} files is stored in the Exotics diskspace, amounting to {round(totals["number"]/MAX_FILE_NUMBER*100, 1)}\\% of the maximum {MAX_FILE_NUMBER} allowed, {change_description(totals["number"], totals["number_last_week"])} of {format_change_percent(totals["number"], totals["number_last_week"])}\\% compared to the previous week.
 More detailed numbers, automatically updated daily, can be found in the {link_string('https://atlas-exot.docs.cern.ch/ExoStorageDocs/', 'Exotics Diskspace Documentation page')}.\\\\
 \\\\
 \\Cref{{tab:largest_directories}} lists all analysis directories using more than 1\\% of the diskspace available to the Exotics group each.
@@ -273,4 +266,5 @@ def main():
     send_email()
 
 if __name__ == "__main__":
-    main()
+    with metrics.job("weekly_report"):
+        main()
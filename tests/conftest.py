@@ -0,0 +1,31 @@
+import logging
+import pathlib
+import shutil
+
+import pytest
+
+from benchmarks.bench_suite import INPUT_FILES
+from helpers.logger import log
+
+REPOSITORY = pathlib.Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def workdir(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> pathlib.Path:
+    '''
+    Temporary working directory with the input files read by the analysers and an empty 'reports/' directory.
+    '''
+    for input_file in INPUT_FILES:
+        shutil.copy(REPOSITORY / input_file, tmp_path / input_file)
+    (tmp_path / "reports").mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture(autouse=True)
+def quiet_log():
+    # the analysers warn about every dataset and folder without match, which is expected for synthetic data
+    level = log.level
+    log.setLevel(logging.ERROR)
+    yield
+    log.setLevel(level)
@@ -0,0 +1,86 @@
+import csv
+import hashlib
+import os
+import pathlib
+
+import pytest
+
+from analysers.eosanalyser import EOSAnalyser
+from benchmarks.generators import write_duplicate_tree
+from helpers.dedup import find_duplicates, hash_full, hash_partial, reclaimable_per_pair
+from helpers.filesystem import iter_files
+
+PARTIAL_SIZE = 1024
+
+
+def list_files(root: pathlib.Path) -> list[tuple[str, str, int]]:
+    return [(analysis, path, size) for analysis in sorted(os.listdir(root)) for path, size in iter_files(str(root / analysis))]
+
+
+@pytest.fixture
+def tree(tmp_path: pathlib.Path) -> tuple[pathlib.Path, list[list[str]]]:
+    '''
+    Generated analysis folders with the groups of paths of identical files, including decoys which only differ in the middle.
+    '''
+    root = tmp_path / "cdm"
+    groups = write_duplicate_tree(root, 4, 10, 5 * PARTIAL_SIZE, PARTIAL_SIZE)
+    return root, sorted(sorted(str(root / path) for path in group) for group in groups)
+
+
+def test_find_duplicates(tree):
+    root, expected = tree
+    files = list_files(root)
+    assert expected and any("decoy" in path for _, path, _ in files)
+    duplicates = find_duplicates(files, workers=2, partial_size=PARTIAL_SIZE)
+    assert sorted(sorted(path for _, path in group) for _, group in duplicates) == expected
+    # identical to hashing every file completely
+    by_hash = {}
+    for _, path, _ in files:
+        by_hash.setdefault(hash_full(path), []).append(path)
+    assert sorted(sorted(paths) for paths in by_hash.values() if len(paths) > 1) == expected
+    sizes = {path: size for _, path, size in files}
+    for size, group in duplicates:
+        assert all(sizes[path] == size for _, path in group)
+        assert all(path.startswith(f"{root}/{analysis}/") for analysis, path in group)
+
+
+def test_hard_links_are_counted_once(tmp_path):
+    for analysis in ("a", "b"):
+        (tmp_path / analysis).mkdir()
+    original = tmp_path / "a" / "original.root"
+    original.write_bytes(b"x" * 100)
+    os.link(original, tmp_path / "a" / "link.root")
+    os.link(original, tmp_path / "b" / "link.root")
+    assert find_duplicates(list_files(tmp_path), partial_size=10) == []
+
+    (tmp_path / "b" / "copy.root").write_bytes(b"x" * 100)
+    duplicates = find_duplicates(list_files(tmp_path), partial_size=10)
+    assert len(duplicates) == 1
+    size, group = duplicates[0]
+    assert size == 100 and len(group) == 2 and ("b", str(tmp_path / "b" / "copy.root")) in group
+
+
+def test_hash_partial(tmp_path):
+    path = tmp_path / "file.root"
+    content = os.urandom(5000)
+    path.write_bytes(content)
+    assert hash_partial(str(path), 5000, 1000) == hashlib.blake2b(content[:1000] + content[-1000:]).hexdigest()
+    assert hash_partial(str(path), 5000, 2500) == hashlib.blake2b(content).hexdigest()
+
+
+def test_reclaimable_per_pair():
+    duplicates = [(100, [("a", "/a/1"), ("a", "/a/2"), ("b", "/b/1")]), (10, [("b", "/b/2"), ("a", "/a/3")])]
+    # the first file of each group is kept, copies within one analysis are paired with the analysis itself
+    assert reclaimable_per_pair(duplicates) == {("a", "a"): [1, 100], ("a", "b"): [2, 110]}
+
+
+def test_check_duplicates_report(tree, workdir):
+    root, expected = tree
+    EOSAnalyser(str(root.parent)).check_duplicates("cdm", min_size=0)
+    with open("reports/cdm.duplicates.csv") as f:
+        rows = list(csv.DictReader(f))
+    sizes = {path: size for _, path, size in list_files(root)}
+    assert rows[-1]["Analysis Team"] == "Total Sum"
+    assert int(rows[-1]["Duplicate files"]) == sum(len(group) - 1 for group in expected)
+    assert sum(int(row["Duplicate files"]) for row in rows[:-1]) == int(rows[-1]["Duplicate files"])
+    assert float(rows[-1]["Reclaimable Disk Usage in GB"]) == pytest.approx(sum(sizes[group[0]] * (len(group) - 1) for group in expected) / 1024**3, rel=1e-4)
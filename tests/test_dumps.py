@@ -0,0 +1,67 @@
+import bz2
+import os
+import pathlib
+
+import pytest
+
+from helpers.dumps import find_bz2_blocks, find_bz2_streams, iter_decompressed, iter_decompressed_blocks
+
+# text and random bytes, such that the blocks differ in their compressed size and are not aligned to bytes
+DATA = b"".join(f"user.a\tuser.a.dataset.{i}\t{i * 7919 % 10**9}\n".encode() for i in range(30_000)) + os.urandom(300_000)
+
+
+@pytest.fixture
+def dump(tmp_path: pathlib.Path) -> pathlib.Path:
+    path = tmp_path / "dump.csv.bz2"
+    # blocks of 100 kB
+    path.write_bytes(bz2.compress(DATA, 1))
+    return path
+
+
+def decompress_ranges(path: pathlib.Path, boundaries: list[int], borders: list[int]) -> list[list[tuple[int, int]]]:
+    '''
+    Decompress the blocks of each range and check that they add up to the original data.
+    Return the indices of the candidates at which the blocks of each range start and end.
+    '''
+    ranges = [list(iter_decompressed_blocks(path, boundaries, first, last)) for first, last in zip(borders[:-1], borders[1:])]
+    assert b"".join(data for blocks in ranges for _, _, data in blocks) == DATA
+    return [[(start, end) for start, end, _ in blocks] for blocks in ranges]
+
+
+def test_find_bz2_blocks(dump):
+    assert find_bz2_streams(dump) == [0]
+    boundaries = find_bz2_blocks(dump)
+    n_blocks = len(boundaries) - 1
+    assert n_blocks >= len(DATA) // 100_000
+    assert boundaries[0] == 32 and any(offset % 8 for offset in boundaries)
+    ranges = decompress_ranges(dump, boundaries, [0, 3, n_blocks])
+    assert ranges == [[(i, i + 1) for i in range(3)], [(i, i + 1) for i in range(3, n_blocks)]]
+
+
+def test_candidate_inside_block(dump):
+    # a chance occurrence of the magic number of the blocks inside the compressed data of the fourth block
+    boundaries = find_bz2_blocks(dump)
+    boundaries.insert(4, (boundaries[3] + boundaries[4]) // 2)
+    n_candidates = len(boundaries) - 1
+    ranges = decompress_ranges(dump, boundaries, [0, 4, n_candidates])
+    # the last block of the first range extends over the candidate, which the second range skips
+    assert ranges[0][-1] == (3, 5)
+    assert ranges[1][0] == (5, 6)
+    # a range can consist of the candidate alone
+    ranges = decompress_ranges(dump, boundaries, [0, 4, 5, n_candidates])
+    assert ranges[1] == []
+
+
+def test_invalid_block(dump):
+    boundaries = find_bz2_blocks(dump)
+    boundaries[3] += 1
+    with pytest.raises(OSError):
+        list(iter_decompressed_blocks(dump, boundaries, 0, len(boundaries) - 1))
+
+
+def test_truncated_dump(dump):
+    dump.write_bytes(dump.read_bytes()[:-100])
+    with pytest.raises(EOFError):
+        find_bz2_blocks(dump)
+    with pytest.raises(EOFError):
+        list(iter_decompressed(dump))
@@ -0,0 +1,91 @@
+import csv
+import os
+import pathlib
+
+import pytest
+
+from analysers.eosanalyser import EOSAnalyser
+from benchmarks.generators import generate_find_listing, write_fake_eos
+
+SUBGROUP = "cdm"
+ANALYSES = 5
+FILES_PER_ANALYSIS = 300
+
+
+def listing_totals(top: str) -> dict[str, tuple[int, int]]:
+    '''
+    Disk space and number of files of each analysis folder in the synthetic 'eos find' listing of top.
+    '''
+    totals = {f"ana{i}": [0, 0] for i in range(ANALYSES)}
+    for line in generate_find_listing(top, ANALYSES, FILES_PER_ANALYSIS):
+        path, size = line[len("path="):].split(" size=")
+        total = totals[path.strip('"')[len(top)+1:].split("/")[0]]
+        total[0] += int(size.split()[0])
+        total[1] += 1
+    return {analysis: tuple(total) for analysis, total in totals.items()}
+
+
+def read_report(subgroup: str) -> dict[str, tuple[str, int]]:
+    with open(f"reports/{subgroup}.csv") as f:
+        return {row["Analysis Team"]: (row["Disk Usage in GB"], int(row["Number of files"])) for row in csv.DictReader(f)}
+
+
+@pytest.fixture
+def subgroup(workdir: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> pathlib.Path:
+    '''
+    Empty analysis folders of a subgroup, whose files are only listed by a fake 'eos find' first on PATH.
+    '''
+    write_fake_eos(workdir / "bin" / "eos", ANALYSES, FILES_PER_ANALYSIS)
+    monkeypatch.setenv("PATH", f"{workdir / 'bin'}{os.pathsep}{os.environ['PATH']}")
+    directory = workdir / "eos" / SUBGROUP
+    for i in range(ANALYSES):
+        (directory / f"ana{i}").mkdir(parents=True)
+    return directory
+
+
+def test_list_subgroup_tallies_listing(subgroup):
+    analyser = EOSAnalyser(str(subgroup.parent), engine="find")
+    names = sorted(os.listdir(subgroup))
+    results = analyser.list_subgroup(str(subgroup), names)
+    assert {name: (size, number_of_files) for name, (size, number_of_files, _, _) in zip(names, results)} == listing_totals(str(subgroup))
+
+
+def test_find_engine_report(subgroup):
+    EOSAnalyser(str(subgroup.parent), engine="find").check_subgroup(SUBGROUP)
+    report = read_report(SUBGROUP)
+    totals = listing_totals(str(subgroup))
+    assert {name: number_of_files for name, (_, number_of_files) in report.items()} == {
+        **{name: number_of_files for name, (_, number_of_files) in totals.items()},
+        "Total Sum": ANALYSES * FILES_PER_ANALYSIS,
+    }
+    assert report["Total Sum"][0] == f'{float(f"{sum(size for size, _ in totals.values())/1024.**3:.5g}"):g}'
+
+
+def test_find_engine_falls_back_to_walking(subgroup, workdir):
+    # without a working 'eos', the listing fails and the analysis folders are walked instead
+    os.remove(workdir / "bin" / "eos")
+    (subgroup / "ana0" / "file.root").write_bytes(b"x" * 10)
+    analyser = EOSAnalyser(str(subgroup.parent), engine="find")
+    assert analyser.list_subgroup(str(subgroup), ["ana0"]) is None
+    analyser.check_subgroup(SUBGROUP)
+    report = read_report(SUBGROUP)
+    assert report["ana0"][1] == report["Total Sum"][1] == 1
+
+
+def test_failing_subgroup_does_not_discard_others(workdir, monkeypatch):
+    for subgroup in ("cdm", "hqt", "jdm"):
+        (workdir / "eos" / subgroup / "ana0").mkdir(parents=True)
+        (workdir / "eos" / subgroup / "ana0" / "file.root").write_bytes(b"x" * 10)
+    # 'eos' is not on PATH, so the folders are walked
+    analyser = EOSAnalyser(str(workdir / "eos"), eos_attempts=1)
+    check_analysis = analyser.check_analysis
+    def failing_check_analysis(path, *args):
+        if "/jdm/" in path:
+            raise RuntimeError("simulated failure")
+        return check_analysis(path, *args)
+    monkeypatch.setattr(analyser, "check_analysis", failing_check_analysis)
+    # the folder of 'missing' cannot be listed, an analysis folder of 'jdm' cannot be checked
+    assert analyser.check_subgroups(["cdm", "missing", "jdm", "hqt"]) == ["cdm", "hqt"]
+    assert read_report("cdm")["Total Sum"][1] == read_report("hqt")["Total Sum"][1] == 1
+    assert not os.path.exists("reports/missing.csv") and not os.path.exists("reports/jdm.csv")
+    assert not analyser.check_subgroup("missing")
@@ -0,0 +1,139 @@
+"""
+Tests of the EOS interface against fake 'eos' executables.
+The 'eos' output in tests/data/*.synthetic.txt is written by hand in the format of the EOS command line tool,
+it is not captured from EOS.
+"""
+
+import os
+import pathlib
+import sys
+
+import pytest
+
+from benchmarks.generators import write_replaying_eos
+from helpers.eosinterface import eos_du_batch, eos_find_files, eos_tree_info, run_eos
+
+DATA = pathlib.Path(__file__).parent / "data"
+DIRECTORY = "/eos/atlas/atlascerngroupdisk/phys-exotics/cdm"
+TREE_INFO_COMMAND = ("find", "-d", "--maxdepth", "1", "--format", "path,treesize,treefiles")
+
+
+@pytest.fixture
+def fake_eos(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    '''
+    Install a fake 'eos' executable first on PATH, printing the content of the given files for the given commands.
+    '''
+    def install(outputs: dict[tuple[str, ...], pathlib.Path]) -> None:
+        write_replaying_eos(tmp_path / "bin" / "eos", outputs)
+        monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}{os.pathsep}{os.environ['PATH']}")
+    return install
+
+
+@pytest.fixture
+def failing_eos(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    '''
+    Install a fake 'eos' executable first on PATH, which fails a given number of times with the given error message
+    and exit code, and prints nothing afterwards. Return the file counting its calls.
+    '''
+    def install(error: str, returncode: int, failures: int) -> pathlib.Path:
+        calls = tmp_path / "calls"
+        calls.write_text("0")
+        eos = tmp_path / "bin" / "eos"
+        eos.parent.mkdir(exist_ok=True)
+        eos.write_text(f"""#!{sys.executable}
+import sys
+with open({str(calls)!r}) as f:
+    calls = int(f.read()) + 1
+with open({str(calls)!r}, "w") as f:
+    f.write(str(calls))
+if calls <= {failures}:
+    sys.stderr.write({error!r})
+    sys.exit({returncode})
+""")
+        eos.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{eos.parent}{os.pathsep}{os.environ['PATH']}")
+        return calls
+    return install
+
+
+def write_outputs(tmp_path: pathlib.Path, outputs: dict[tuple[str, ...], str]) -> dict[tuple[str, ...], pathlib.Path]:
+    files = {}
+    for i, (command, output) in enumerate(outputs.items()):
+        files[command] = tmp_path / f"output{i}.txt"
+        files[command].write_text(output)
+    return files
+
+
+def test_eos_tree_info(fake_eos):
+    fake_eos({(*TREE_INFO_COMMAND, DIRECTORY): DATA / "eos_find_tree_info.synthetic.txt"})
+    # the subgroup folder itself is not listed, folder names may contain spaces
+    assert eos_tree_info(DIRECTORY, attempts=1) == {
+        "ANA-EXOT-2022-35_dileptonresonance": (879609302220, 31021),
+        "monojet": (439804651110, 17190),
+        "old ntuples (do not delete)": (1, 1),
+        "empty": (0, 0),
+    }
+
+
+def test_eos_tree_info_rejects_malformed_output(fake_eos, tmp_path):
+    malformed = tmp_path / "malformed.txt"
+    malformed.write_text(f'path="{DIRECTORY}/monojet/" treesize=unknown treefiles=3\n')
+    fake_eos({(*TREE_INFO_COMMAND, DIRECTORY): malformed})
+    with pytest.raises(ValueError):
+        eos_tree_info(DIRECTORY, attempts=1)
+
+
+def test_eos_tree_info_reports_failing_command(fake_eos):
+    fake_eos({})
+    with pytest.raises(RuntimeError):
+        eos_tree_info(DIRECTORY, attempts=1)
+
+
+COMMANDS = {
+    "run_eos": lambda: run_eos(["eos", "ls", DIRECTORY], attempts=3, backoff=0),
+    "eos_find_files": lambda: list(eos_find_files(DIRECTORY, attempts=3, backoff=0)),
+}
+
+
+@pytest.mark.parametrize("command", COMMANDS.values(), ids=COMMANDS.keys())
+@pytest.mark.parametrize("error, returncode", [
+    ("error: unable to stat (errc=5) (Input/output error)\n", 255),
+    ("error: connection refused\n", 111),
+    ("Connection refused\n", 1),
+], ids=["error code", "exit code", "message"])
+def test_transient_errors_are_retried(failing_eos, command, error, returncode):
+    calls = failing_eos(error, returncode, failures=2)
+    command()
+    assert calls.read_text() == "3"
+
+
+@pytest.mark.parametrize("command", COMMANDS.values(), ids=COMMANDS.keys())
+@pytest.mark.parametrize("error, returncode", [
+    ("error: no such directory (errc=2) (No such file or directory)\n", 255),
+    ("error: permission denied\n", 13),
+], ids=["error code", "exit code"])
+def test_deterministic_errors_are_not_retried(failing_eos, command, error, returncode):
+    calls = failing_eos(error, returncode, failures=3)
+    with pytest.raises(RuntimeError):
+        command()
+    assert calls.read_text() == "1"
+
+
+def test_eos_du_batch(fake_eos, tmp_path):
+    paths = [f"{DIRECTORY}/monojet", f"{DIRECTORY}/old ntuples (do not delete)", f"{DIRECTORY}/empty"]
+    fake_eos(write_outputs(tmp_path, {
+        ("du", "-s", *paths[:2]): f"439804651110 {paths[0]}/\n1 {paths[1]}\n",
+        ("du", "-s", paths[2]): f"0 {paths[2]}\n",
+    }))
+    assert eos_du_batch(paths, attempts=1, batch_size=2) == {paths[0]: 439804651110, paths[1]: 1, paths[2]: 0}
+
+
+def test_eos_du_batch_falls_back_to_one_path_per_call(fake_eos, tmp_path):
+    paths = [f"{DIRECTORY}/ana{i}" for i in range(5)]
+    fake_eos(write_outputs(tmp_path, {
+        # only the first path is listed, as if further paths were ignored
+        ("du", "-s", *paths[:2]): f"100 {paths[0]}\n",
+        # no output for ana3, whose disk space is left out
+        **{("du", "-s", path): f"{i * 100} {path}\n" for i, path in enumerate(paths) if i != 3},
+    }))
+    assert eos_du_batch(paths, attempts=1, batch_size=2) == {paths[0]: 0, paths[1]: 100, paths[2]: 200, paths[4]: 400}
@@ -0,0 +1,106 @@
+import os
+import pathlib
+
+import pytest
+
+from benchmarks.generators import write_tree
+from helpers.filesystem import FileStatistics, ScanCache, scan_tree
+
+
+def walk_totals(top: pathlib.Path) -> tuple[int, int, int]:
+    '''
+    Disk space, number of files and number of directories below top, tallied with os.walk and one stat call per file,
+    as the EOS Analyser did before scan_tree.
+    '''
+    size = 0
+    number_of_files = 0
+    number_of_directories = 0
+    for dirpath, dirnames, filenames in os.walk(top):
+        # os.walk lists links to directories, but does not descend into them
+        number_of_directories += sum(not os.path.islink(os.path.join(dirpath, name)) for name in dirnames)
+        number_of_files += len(filenames)
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if os.path.isfile(path):
+                size += os.lstat(path).st_size if os.path.islink(path) else os.path.getsize(path)
+    return size, number_of_files, number_of_directories
+
+
+@pytest.fixture
+def tree(tmp_path: pathlib.Path) -> pathlib.Path:
+    top = tmp_path / "tree"
+    write_tree(top, 20, 10)
+    return top
+
+
+def touch_directory(directory: pathlib.Path) -> None:
+    # make sure the mtime changes, even on file systems with a coarse timestamp resolution
+    mtime = directory.stat().st_mtime_ns + 10**9
+    os.utime(directory, ns=(mtime, mtime))
+
+
+def test_scan_tree_matches_os_walk(tree):
+    assert scan_tree(str(tree)) == walk_totals(tree)
+    size, number_of_files, number_of_directories = walk_totals(tree)
+    assert scan_tree(str(tree), sizes=False) == (0, number_of_files, number_of_directories)
+
+
+def test_file_statistics_match_scan(tree):
+    statistics = FileStatistics()
+    size, number_of_files, _ = scan_tree(str(tree), statistics=statistics)
+    # the broken link is counted as file, but has no size and is not in the histogram
+    assert sum(size for _, size in statistics.histogram.values()) == size
+    assert sum(number for number, _ in statistics.histogram.values()) == number_of_files - 1
+
+
+def test_scan_cache_hits_unchanged_directories(tree, tmp_path):
+    expected = scan_tree(str(tree))
+    number_of_directories = expected[2] + 1
+    cache = ScanCache(tmp_path / "cache.json")
+    assert scan_tree(str(tree), cache=cache) == expected
+    assert (cache.hits, cache.misses) == (0, number_of_directories)
+    cache.save()
+
+    cache = ScanCache(tmp_path / "cache.json")
+    assert scan_tree(str(tree), cache=cache) == expected
+    assert (cache.hits, cache.misses) == (number_of_directories, 0)
+
+
+def test_scan_cache_misses_changed_directories(tree, tmp_path):
+    cache = ScanCache(tmp_path / "cache.json")
+    size, number_of_files, number_of_directories = scan_tree(str(tree), cache=cache)
+    cache.save()
+
+    directory = next(tree.rglob("dir3"))
+    (directory / "new.root").write_bytes(b"x" * 100)
+    touch_directory(directory)
+    cache = ScanCache(tmp_path / "cache.json")
+    assert scan_tree(str(tree), cache=cache) == (size + 100, number_of_files + 1, number_of_directories)
+    assert (cache.hits, cache.misses) == (number_of_directories, 1)
+
+    # entries tallied without sizes cannot answer a scan with sizes
+    cache = ScanCache()
+    scan_tree(str(tree), sizes=False, cache=cache)
+    scan_tree(str(tree), cache=cache)
+    assert (cache.hits, cache.misses) == (0, 2 * (number_of_directories + 1))
+
+    cache = ScanCache(tmp_path / "cache.json", full_rescan=True)
+    scan_tree(str(tree), cache=cache)
+    assert (cache.hits, cache.misses) == (0, number_of_directories + 1)
+
+
+def test_scan_cache_drops_removed_directories(tmp_path):
+    top = tmp_path / "tree"
+    (top / "kept").mkdir(parents=True)
+    (top / "removed").mkdir()
+    (top / "removed" / "file.root").write_bytes(b"x" * 10)
+    cache = ScanCache(tmp_path / "cache.json")
+    assert scan_tree(str(top), cache=cache) == (10, 1, 2)
+    cache.save()
+
+    (top / "removed" / "file.root").unlink()
+    (top / "removed").rmdir()
+    cache = ScanCache(tmp_path / "cache.json")
+    assert scan_tree(str(top), cache=cache) == (0, 0, 1)
+    cache.save()
+    assert ScanCache(tmp_path / "cache.json")._entries.keys() == {str(top), str(top / "kept")}
@@ -0,0 +1,169 @@
+"""
+Check that the engines of the GridSpaceAnalyser reproduce the report of the original implementation,
+which matched one row at a time with re.search for every tag of the lookup table.
+"""
+
+import bz2
+import csv
+import pathlib
+import re
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+from analysers import gridspaceanalyser
+from analysers.gridspaceanalyser import DUMP_HEADER, OLD_THRESHOLD, GridSpaceAnalyser
+from benchmarks.generators import load_tags, write_bz2, write_dump
+from helpers.tagmatcher import literal_from_tag
+
+RSE = "TEST_PHYS-EXOTICS"
+ROWS = 5000
+REPORTS = ("", ".ages", ".details", ".suggested_tags")
+
+
+def reference_report(dump: pathlib.Path, now: datetime) -> list[list[str]]:
+    '''
+    Rows of reports/<RSE>.csv as written by the original per-row implementation of analyse_datasets and report,
+    with the changes made on purpose since: datasets without size are counted without disk space (instead of making
+    the disk usage NaN), ages are computed relative to one reference time and timestamps without time zone are in UTC.
+    '''
+    scopes = {}
+    analyses = {"uncategorised": {"ntotal": 0, "ntotal_old": 0, "size": 0}}
+    with open("lookup_table.csv") as f:
+        for row in csv.reader(f, delimiter=' '):
+            scopes.setdefault(row[0], {})[row[1]] = row[2] if len(row) >= 3 else ""
+            if len(row) >= 3:
+                analyses[row[2]] = {"ntotal": 0, "ntotal_old": 0, "size": 0}
+
+    def parse_time(t):
+        if t is None or pd.isna(t):
+            return None
+        parsed = datetime.fromisoformat(str(t).replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+    reader = pd.read_csv(dump, header=None, names=DUMP_HEADER, compression='bz2', delimiter="\t")
+    for line in reader.itertuples(index=False):
+        if line.scope not in scopes:
+            continue
+        size = 0 if pd.isna(line.size) else int(line.size)
+        times = [t for t in (parse_time(line.created), parse_time(line.updated), parse_time(line.accessed)) if t is not None]
+        old = bool(times) and now.timestamp() - max(times) > OLD_THRESHOLD
+        for tag, analysis_name in scopes[line.scope].items():
+            if re.search(tag, line.name) is None:
+                continue
+            counters = analyses[analysis_name or "uncategorised"]
+            counters["ntotal"] += 1
+            counters["size"] += size
+            if old:
+                counters["ntotal_old"] += 1
+    rows = [["Analysis", "Number of Files", "Disk Usage in GB", "Number of Files accessed >1 year ago"]]
+    for name, details in analyses.items():
+        size = float(f"{(details['size']/1024.**3):.5g}")
+        rows.append([name, str(details["ntotal"]), f'{size:g}', str(details["ntotal_old"])])
+    return rows
+
+
+def edge_case_lines() -> list[str]:
+    '''
+    Datasets which the generated dump only contains by chance: without size, without any timestamp, in scopes which are
+    not in the lookup table, and matching several tags.
+    '''
+    scope, tags = next(iter(load_tags().items()))
+    literals = [literal for literal in map(literal_from_tag, tags) if literal is not None]
+    def line(scope, name, size, created, updated, accessed):
+        return "\t".join(["RSE", scope, name, "exotics", size, created, updated, accessed, "0" * 32, "OK"]) + "\n"
+    return [
+        line(scope, f"{scope}.mc16_13TeV.1.{literals[0]}.nosize", "", "2020-01-01 00:00:00", "", ""),
+        line(scope, f"{scope}.mc16_13TeV.2.{literals[0]}.notime", "1024", "", "", ""),
+        line(scope, f"{scope}.mc16_13TeV.3.{literals[1]}.{literals[2]}.twotags", "2048", "2015-06-01 12:00:00", "", "2016-06-01 12:00:00"),
+        line("user.nobody", "user.nobody.dataset", "4096", "2020-01-01 00:00:00", "", ""),
+        line("user.nobody", "user.nobody.unsized", "", "", "", ""),
+    ]
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch: pytest.MonkeyPatch):
+    # blocks of a few hundred lines, such that the datasets of the small dump are spread over several worker processes
+    monkeypatch.setattr(gridspaceanalyser, "PARALLEL_BLOCK_BYTES", 50_000)
+
+
+@pytest.fixture
+def dumps(workdir: pathlib.Path) -> dict[str, pathlib.Path]:
+    '''
+    Generated dump with edge cases, compressed as a single bz2 stream of small blocks and as many small streams like pbzip2 does.
+    '''
+    generated = workdir / "generated.csv.bz2"
+    write_dump(generated, ROWS, hit_rate=0.3)
+    lines = bz2.decompress(generated.read_bytes()).decode().splitlines(keepends=True)
+    # edge cases at the start, in the middle and at the end of the dump
+    edge_cases = edge_case_lines()
+    lines = edge_cases + lines[:ROWS // 2] + edge_cases + lines[ROWS // 2:] + edge_cases
+    paths = {"single": workdir / "single.csv.bz2", "multi": workdir / "multi.csv.bz2"}
+    write_bz2(paths["single"], lines, compresslevel=1)
+    write_bz2(paths["multi"], lines, stream_bytes=20_000)
+    return paths
+
+
+def run(dump: pathlib.Path, now: datetime, **kwargs) -> list[str]:
+    analyser = GridSpaceAnalyser(rse=RSE, dump=dump, reference_time=now, chunksize=1000, **kwargs)
+    analyser.load_lookup_table()
+    analyser.analyse_datasets()
+    analyser.report()
+    return [pathlib.Path(f"reports/{RSE}{suffix}.csv").read_text() for suffix in REPORTS]
+
+
+def test_dump_covers_edge_cases(dumps):
+    datasets = pd.read_csv(dumps["single"], header=None, names=DUMP_HEADER, compression='bz2', delimiter="\t")
+    assert datasets["size"].isna().any()
+    assert datasets[["created", "updated", "accessed"]].isna().all(axis=1).any()
+    assert (~datasets["scope"].isin(load_tags())).any()
+
+
+@pytest.mark.parametrize("engine, dump, workers", [
+    ("rows", "single", 1),
+    ("columnar", "single", 1),
+    ("columnar", "single", 2),
+    ("columnar", "multi", 1),
+    ("columnar", "multi", 3),
+    ("rows", "multi", 2),
+])
+def test_report_matches_original_implementation(dumps, engine, dump, workers):
+    now = datetime.now(timezone.utc)
+    reference = reference_report(dumps["single"], now)
+    report, *_ = run(dumps[dump], now, engine=engine, workers=workers)
+    assert list(csv.reader(report.splitlines())) == reference
+
+
+def test_engines_write_identical_reports(dumps):
+    now = datetime.now(timezone.utc)
+    reference = run(dumps["single"], now, engine="rows")
+    for engine, dump, workers in [("columnar", "single", 1), ("columnar", "single", 2), ("columnar", "multi", 3)]:
+        assert run(dumps[dump], now, engine=engine, workers=workers) == reference, (engine, dump, workers)
+
+
+@pytest.mark.parametrize("top", [1, 3])
+def test_engines_list_identical_details(dumps, top):
+    # with few entries per analysis, the heaps are full after the first chunk and most datasets are skipped
+    now = datetime.now(timezone.utc)
+    reference = run(dumps["single"], now, engine="rows", top=top)
+    assert run(dumps["single"], now, engine="columnar", top=top) == reference
+    assert run(dumps["multi"], now, engine="columnar", top=top, workers=2) == reference
+
+
+@pytest.mark.parametrize("content", [b"", b"not compressed\n", bz2.compress(b""), bz2.compress("".join(edge_case_lines()).encode() * 100)[:-50]],
+                         ids=["empty", "not_compressed", "no_datasets", "truncated"])
+def test_invalid_dumps_behave_like_serial_run(workdir, content):
+    # e.g. a dump of 0 bytes, left behind by a failed download
+    dump = workdir / "invalid.csv.bz2"
+    dump.write_bytes(content)
+    now = datetime.now(timezone.utc)
+    outcomes = []
+    for workers in (1, 2):
+        try:
+            outcomes.append(run(dump, now, engine="columnar", workers=workers))
+        except Exception as error:
+            outcomes.append(type(error))
+    assert outcomes[0] == outcomes[1]
@@ -0,0 +1,23 @@
+import datetime
+
+import numpy as np
+
+from helpers.history import HistoryStore
+
+
+def day(days_ago: int) -> str:
+    return (datetime.datetime.now() - datetime.timedelta(days_ago)).strftime("%Y-%m-%d")
+
+
+def test_get_arrays(tmp_path):
+    store = HistoryStore(tmp_path)
+    store.record("cdm", day(3), {"monojet": (100, 10)})
+    store.record("cdm", day(1), {"monojet": (300, 30), "dilepton": (50, 5)})
+    store.record("cdm", day(0), {"monojet": (400, 40), "dilepton": (60, 6)})
+    dates, analyses, sizes, numbers = store.get_arrays("cdm", [0, 1, 2, 3, 4])
+    assert dates == [day(i_day) for i_day in range(5)]
+    assert analyses == ["monojet", "dilepton"]
+    assert sizes.shape == numbers.shape == (2, 5)
+    # days without record carry the latest earlier one forward, days before the first record are NaN
+    np.testing.assert_array_equal(sizes, [[400, 300, 100, 100, np.nan], [60, 50, np.nan, np.nan, np.nan]])
+    np.testing.assert_array_equal(numbers, [[40, 30, 10, 10, np.nan], [6, 5, np.nan, np.nan, np.nan]])
@@ -0,0 +1,143 @@
+"""
+Tests of the Glance lookups of the PublicationAnalyser against a fake Glance client which records its calls.
+"""
+
+import json
+import pathlib
+import sys
+import threading
+import types
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeEndpoint:
+
+    def __init__(self, client: "FakeGlance", name: str, lookup):
+        self._client = client
+        self._name = name
+        self._lookup = lookup
+
+    def get(self, code: str):
+        with self._client.lock:
+            self._client.calls.append((self._name, code))
+            failures = self._client.failures.get(code, 0)
+            if failures:
+                self._client.failures[code] = failures - 1
+        if failures:
+            raise ConnectionError(f"Glance is not reachable for {code}.")
+        return self._lookup(code)
+
+
+class FakeGlance:
+    '''
+    Stand-in for stare.Glance, answering from the given analyses and accepted papers and recording each call as (endpoint, code).
+    '''
+
+    def __init__(self, analyses: dict[str, list[str]], accepted: set[str], failures: dict[str, int] | None = None):
+        '''
+        Arguments:
+            analyses: dict[str, list[str]] -> reference codes of the papers linked to each analysis
+            accepted: set[str] -> reference codes of the papers accepted by a journal
+            failures: dict[str, int] -> number of calls failing with a ConnectionError per reference code before it is answered
+        '''
+        self.lock = threading.Lock()
+        self.calls: list[tuple[str, str]] = []
+        self.failures = dict(failures or {})
+        self.analyses = FakeEndpoint(self, "analyses", lambda code: SimpleNamespace(
+            related_publications=[SimpleNamespace(type="Paper", reference_code=paper) for paper in analyses[code]],
+        ))
+        self.papers = FakeEndpoint(self, "papers", lambda code: SimpleNamespace(
+            publication_phase=SimpleNamespace(journal_acceptance_date="2024-03-01" if code in accepted else None),
+        ))
+
+
+# the analyser imports the Glance client of the stare package, which is not needed (nor installed) as the tests pass the fake client
+stare = types.ModuleType("stare")
+stare.Glance = FakeGlance
+sys.modules.setdefault("stare", stare)
+
+from analysers.publicationanalyser import PublicationAnalyser  # noqa: E402
+from helpers.glance import GlanceCache  # noqa: E402
+
+TTL_DAYS = 7
+ANALYSES = {
+    "ANA-EXOT-2019-35": ["EXOT-2019-35"],
+    "ANA-EXOT-2021-02": ["EXOT-2021-02"],
+    "ANA-EXOT-2022-11": [],
+    "ANA-EXOT-2022-35": ["EXOT-2022-35"],
+}
+ACCEPTED = {"EXOT-2019-35"}
+
+
+def age_entries(cache_file: pathlib.Path, keys: list[str], days: float) -> None:
+    '''
+    Make entries of a saved cache older by the given number of days.
+    '''
+    entries = json.loads(cache_file.read_text())
+    for key in keys:
+        entries[key]["time"] -= days * 24 * 60 * 60
+    cache_file.write_text(json.dumps(entries))
+
+
+@pytest.fixture
+def cache_file(tmp_path: pathlib.Path) -> pathlib.Path:
+    return tmp_path / "glance_cache.json"
+
+
+def test_failing_calls_are_retried_and_counted(cache_file):
+    client = FakeGlance(ANALYSES, ACCEPTED, failures={"EXOT-2019-35": 2, "EXOT-2022-35": 3})
+    analyser = PublicationAnalyser(client, cache=GlanceCache(cache_file, ttl_days=TTL_DAYS), workers=4, attempts=3, backoff=0)
+    assert analyser.find_newly_finished(set(ANALYSES), set()) == ["ANA-EXOT-2019-35"]
+    # retried until the call succeeds, and given up after the last attempt
+    assert client.calls.count(("papers", "EXOT-2019-35")) == 3
+    assert client.calls.count(("papers", "EXOT-2022-35")) == 3
+    assert analyser.retries == 4
+    assert analyser.api_calls == len(client.calls)
+    assert analyser.cache_hits == 0
+
+
+def test_cached_responses_are_reused(cache_file):
+    cache = GlanceCache(cache_file, ttl_days=TTL_DAYS)
+    PublicationAnalyser(FakeGlance(ANALYSES, ACCEPTED, failures={"EXOT-2022-35": 3}), cache=cache, backoff=0).find_newly_finished(set(ANALYSES), set())
+    cache.save()
+
+    client = FakeGlance(ANALYSES, ACCEPTED)
+    analyser = PublicationAnalyser(client, cache=GlanceCache(cache_file, ttl_days=TTL_DAYS), backoff=0)
+    assert analyser.find_newly_finished(set(ANALYSES), set()) == ["ANA-EXOT-2019-35"]
+    # only the paper which could not be looked up before
+    assert client.calls == [("papers", "EXOT-2022-35")]
+    assert analyser.api_calls == 1
+    assert analyser.cache_hits == len(ANALYSES) + 2
+
+
+def test_expired_entries_are_looked_up_again(cache_file):
+    cache = GlanceCache(cache_file, ttl_days=TTL_DAYS)
+    PublicationAnalyser(FakeGlance(ANALYSES, ACCEPTED), cache=cache, backoff=0).find_newly_finished({"ANA-EXOT-2021-02"}, set())
+    cache.save()
+    age_entries(cache_file, ["paper:EXOT-2021-02"], TTL_DAYS + 1)
+
+    cache = GlanceCache(cache_file, ttl_days=TTL_DAYS)
+    assert cache.get("paper:EXOT-2021-02") is None
+    cache.save()
+    assert "paper:EXOT-2021-02" not in json.loads(cache_file.read_text())
+    client = FakeGlance(ANALYSES, ACCEPTED)
+    PublicationAnalyser(client, cache=cache, backoff=0).find_newly_finished({"ANA-EXOT-2021-02"}, set())
+    assert client.calls == [("papers", "EXOT-2021-02")]
+
+
+def test_new_papers_of_an_analysis_are_found_the_next_day(cache_file):
+    cache = GlanceCache(cache_file, ttl_days=TTL_DAYS)
+    PublicationAnalyser(FakeGlance({"ANA-EXOT-2022-11": []}, ACCEPTED), cache=cache, backoff=0).find_newly_finished({"ANA-EXOT-2022-11"}, set())
+    cache.save()
+
+    # a rerun on the same day is answered from the cache
+    client = FakeGlance({"ANA-EXOT-2022-11": ["EXOT-2022-11"]}, {"EXOT-2022-11"})
+    assert PublicationAnalyser(client, cache=GlanceCache(cache_file, ttl_days=TTL_DAYS), backoff=0).find_newly_finished({"ANA-EXOT-2022-11"}, set()) == []
+    assert client.calls == []
+
+    # the next day, the papers of the analysis are looked up again, while papers are still cached for a week
+    age_entries(cache_file, ["analysis:ANA-EXOT-2022-11"], 1)
+    assert PublicationAnalyser(client, cache=GlanceCache(cache_file, ttl_days=TTL_DAYS), backoff=0).find_newly_finished({"ANA-EXOT-2022-11"}, set()) == ["ANA-EXOT-2022-11"]
+    assert client.calls == [("analyses", "ANA-EXOT-2022-11"), ("papers", "EXOT-2022-11")]
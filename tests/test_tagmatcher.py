@@ -0,0 +1,42 @@
+import re
+
+import pandas as pd
+import pytest
+
+from analysers.gridspaceanalyser import GridSpaceAnalyser
+from helpers.tagmatcher import TagMatcher
+
+# the first six tags would change their meaning, or could not be compiled, as part of one combined expression
+TAGS = [r"(mono)\1jet", r"(di)\1lepton", r"(?P<channel>ee)", r"(?P<channel>mm)", r"(?i)ZPRIME", r"(v)?(?(1)lq|zz)", "\\.DAOD_EXOT", "ttbar"]
+NAMES = ["user.a.monomonojet", "user.a.monojet", "user.a.didilepton", "user.a.ee", "user.a.mm", "user.a.zprime", "user.a.vlq",
+         "user.a.x.DAOD_EXOT5", "user.a.ttbar", "user.a.nothing"]
+
+
+def matches_individually(tags: list[str], name: str) -> list[str]:
+    return [tag for tag in tags if re.search(tag, name) is not None]
+
+
+# without the named groups, the tags could be compiled into one expression, but the backreferences would refer to the wrong groups
+TAG_SETS = pytest.mark.parametrize("tags", [TAGS, TAGS[:2] + TAGS[6:]], ids=["all", "backreferences"])
+
+
+@TAG_SETS
+def test_match_tags_with_group_references(tags):
+    matcher = TagMatcher(tags)
+    assert matcher.prefilter is not None
+    assert matcher.prefiltered == [False] * (len(tags) - 2) + [True] * 2
+    for name in NAMES:
+        assert matcher.match(name) == matches_individually(tags, name)
+    assert matcher.match("user.a.didilepton") == [r"(di)\1lepton"]
+
+
+@TAG_SETS
+@pytest.mark.filterwarnings("ignore:This pattern is interpreted as a regular expression")
+def test_match_tags_columns_with_group_references(tags):
+    analyser = GridSpaceAnalyser()
+    analyser._scopes = {"user.a": {tag: {"analysis": "", "tag_found": False} for tag in tags}}
+    analyser._matchers = {"user.a": TagMatcher(tags)}
+    hits = analyser._match_tags_columns("user.a", pd.Series(NAMES))
+    for i_name, name in enumerate(NAMES):
+        found = [tag for tag in tags if i_name in hits.index and hits.loc[i_name, tag]]
+        assert found == matches_individually(tags, name)
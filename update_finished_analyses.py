@@ -1,25 +1,24 @@
 from stare import Glance
 
 from analysers.publicationanalyser import PublicationAnalyser
-from helpers.constants import get_glance_codes
+from helpers import metrics
+from helpers.glance import FINISHED_ANALYSES_FILE, GlanceCache, get_registry
 from helpers.logger import log
 
-FINISHED_ANALYSES_FILE = "finished_analyses.txt"
+GLANCE_CACHE_FILE = "cache/glance_cache.json"
+# papers without journal acceptance date are checked again after this many days
+GLANCE_CACHE_TTL_DAYS = 7
 
 
 def main():
-    with open(FINISHED_ANALYSES_FILE) as f:
-        finished = {line.strip() for line in f if line.strip()}
+    registry = get_registry()
+    finished = set(registry.finished)
+    all_codes = registry.all_codes()
 
-    glance_codes = get_glance_codes()
-    all_codes = set()
-    for codes in glance_codes.values():
-        if codes == "N/A":
-            continue
-        all_codes.update(codes.split(","))
-
-    analyser = PublicationAnalyser(Glance())
+    cache = GlanceCache(GLANCE_CACHE_FILE, ttl_days=GLANCE_CACHE_TTL_DAYS)
+    analyser = PublicationAnalyser(Glance(), cache=cache)
     newly_finished = analyser.find_newly_finished(all_codes, finished)
+    cache.save()
 
     if not newly_finished:
         log.info("No new finished analyses found.")
@@ -33,4 +32,5 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.job("update_finished_analyses"):
+        main()